@@ -0,0 +1,316 @@
+""" CSC110 Fall 2021 Final Project: benchmarks
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Time and memory-profile the load, compute and render stages of the project separately,
+    and time how long the command line entry points take to start
+    2. Run every stage on the real data and on synthetic datasets with 10x, 100x and 1000x the
+    countries of the real data, and optionally a multiple of its years
+    3. Write the results to a JSON file, so that results can be compared across commits
+
+A synthetic dataset of scale k holds k copies of every country of the real dataset, where each
+copy's values are the real values multiplied by random noise. With a year scale of m, it covers m
+times as many years as the real dataset, where the years after the real ones repeat the real
+values with noise.
+"""
+
+import csv
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+import numpy as np
+import cache
+import clean_data
+import composition
+import computations
+import correlations
+import inequality
+import query
+import visualizations
+
+# the scales of the datasets benchmarked, where 1 is the real dataset
+SCALES = [1, 10, 100, 1000]
+
+# the stages benchmarked
+STAGES = ['load', 'compute', 'render', 'startup']
+
+# the file the results are written to
+RESULTS_FILE = 'benchmark_results.json'
+
+
+def make_synthetic_dataset(scale: int, seed: int = 0, year_scale: int = 1) -> clean_data.Dataset:
+    """ Return a Dataset with scale copies of every country of the real dataset over year_scale
+    times as many years. The years continue on from the last real year, and each further run of
+    years repeats the real values. The real countries in the real years keep their real values and
+    every other value is a real value multiplied by random noise between 0.9 and 1.1. The k-th copy
+    of a country has its name and ISO3 code followed by k.
+
+    Preconditions:
+        - scale >= 1
+        - year_scale >= 1
+
+    >>> data = make_synthetic_dataset(2)
+    >>> len(data.names) == 2 * len(clean_data.load_dataset().names)
+    True
+    >>> data.row('CAN1') - data.row('CAN') == len(data.names) // 2
+    True
+    >>> len(make_synthetic_dataset(1, year_scale=3).years) == 3 * len(data.years)
+    True
+    """
+    real = clean_data.load_dataset()
+    names = [name if k == 0 else f'{name} {k}' for k in range(scale) for name in real.names]
+    codes = [code if k == 0 else f'{code}{k}' for k in range(scale) for code in real.iso_codes]
+    years = list(range(real.years[0], real.years[0] + year_scale * len(real.years)))
+    data = clean_data.Dataset(names, codes, years)
+    random = np.random.default_rng(seed)
+    for root in clean_data.METRIC_ROOTS:
+        noise = random.uniform(0.9, 1.1, (len(names), len(years)))
+        noise[:len(real.names), :len(real.years)] = 1.0
+        data.columns[root] = np.asfortranarray(np.tile(real.columns[root], (scale, year_scale))
+                                               * noise)
+    clean_data.get_gdp_quartile(data, data.years[0], data.years[-1])
+    return data
+
+
+def write_synthetic_csv(data: clean_data.Dataset, filename: str) -> None:
+    """ Write the GDP and unemployment rate of every country of data to filename in the format of
+    a World Development Indicators csv file (like raw_data/national_gdp.csv).
+    """
+    indicators = {'NY.GDP.MKTP.CD': 'gdp_', 'SL.UEM.TOTL.ZS': 'unemployment_'}
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+                        + [str(year) for year in data.years])
+        for code, root in indicators.items():
+            for i in range(len(data.names)):
+                # missing values are written as empty cells
+                cells = ['' if math.isnan(value) else repr(value)
+                         for value in data.columns[root][i].tolist()]
+                writer.writerow([data.names[i], data.iso_codes[i], root, code] + cells)
+
+
+def measure(run: Callable[[], Any], repeat: int,
+            setup: Optional[Callable[[], Any]] = None) -> dict:
+    """ Return the running times of run (in seconds) over repeat runs and the peak memory
+    allocated by one more run (in bytes), as a dictionary. If setup is given, it is called before
+    every run without being measured.
+
+    Preconditions:
+        - repeat >= 1
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': statistics.median(times), 'best_seconds': min(times),
+            'peak_memory': peak}
+
+
+def get_load_benchmarks(data: clean_data.Dataset, scale: int,
+                        directory: str) -> dict[str, Callable[[], Any]]:
+    """ Return the load stage benchmarks of a dataset of the scale, by name. The real csv files
+    are only parsed at scale 1, while every scale streams a csv file of data written to directory.
+    """
+    benchmarks = {}
+    if scale == 1:
+        benchmarks['clean_data'] = clean_data.clean_data
+        benchmarks['read_cache'] = cache.read_cache
+        # refreshing when no source file changed only costs checking the files
+        benchmarks['refresh_dataset'] = lambda: cache.refresh_dataset(
+            clean_data.load_dataset(), use_cache=False)
+    filename = os.path.join(directory, f'synthetic_{scale}.csv')
+    write_synthetic_csv(data, filename)
+    indicators = {'NY.GDP.MKTP.CD': 'gdp_', 'SL.UEM.TOTL.ZS': 'unemployment_'}
+    benchmarks['stream_indicators'] = lambda: clean_data.stream_indicators(
+        clean_data.Dataset(data.names, data.iso_codes, data.years), filename, indicators)
+    return benchmarks
+
+
+def get_compute_benchmarks(data: clean_data.Dataset) -> dict[str, Callable[[], Any]]:
+    """ Return the compute stage benchmarks of data, by name.
+    """
+    start, end = data.years[-5], data.years[-1]
+    sectors = list(clean_data.SECTOR_ROOTS.values())
+    return {
+        'get_percent_change_matrix': lambda: computations.get_percent_change_matrix('gdp_', data),
+        'get_cagr_matrix': lambda: computations.get_cagr_matrix('gdp_', 4, data),
+        'get_cumulative_change_matrix':
+            lambda: computations.get_cumulative_change_matrix('gdp_', start, data),
+        'get_buckets': lambda: computations.get_buckets('unemployment_', 4, data),
+        'get_group_aggregates': lambda: computations.get_group_aggregates(
+            sectors, data.quartiles, ('sum', 'mean', 'median'), data),
+        'get_totals': lambda: computations.get_totals('gdp_', data),
+        'get_share_matrix': lambda: computations.get_share_matrix('gdp_', data),
+        'get_percent_of_whole': lambda: computations.get_percent_of_whole(f'gdp_{end}', data),
+        'get_attribute_by_gdp_quartile':
+            lambda: computations.get_attribute_by_gdp_quartile('unemployment_', end, data),
+        'get_covid_correlation': lambda: computations.get_covid_correlation(
+            'total_deaths_per_million', 'gdp_', start, end, data),
+        'get_bucket_matrix': lambda: clean_data.get_bucket_matrix(data.columns['gdp_'], 4),
+        'impute_matrix': lambda: clean_data.impute_matrix(data.columns['gdp_'], 'growth'),
+        'get_correlations': lambda: correlations.get_correlations(
+            [('gdp_change', 'unemployment_change'), ('gdp_', 'unemployment_')] + [
+                ('gdp_', root) for root in sectors], start, end, data, data.quartiles),
+        'get_sector_shares': lambda: composition.get_sector_shares(data),
+        'get_group_shifts': lambda: composition.get_group_shifts('lilien', data.quartiles,
+                                                                 data=data),
+        'get_inequality_matrix': lambda: inequality.get_inequality_matrix('gdp_', data),
+        'get_confidence_intervals': lambda: inequality.get_confidence_intervals(
+            'gdp_', start, end, data, inequality.Bootstrap(resamples=50))
+    }
+
+
+def get_render_benchmarks(data: clean_data.Dataset) -> dict[str, Callable[[], Any]]:
+    """ Return the render stage benchmarks of data, by name. Each benchmark builds a figure and
+    serializes it to JSON, which is what a browser is sent.
+    """
+    start, end = data.years[-5], data.years[-1]
+    return {
+        'build_map_percentage_change': lambda: visualizations.build_map_percentage_change(
+            'gdp_', start, end, data).to_json(),
+        'build_map_percent_difference_gdp':
+            lambda: visualizations.build_map_percent_difference_gdp(start, end, data).to_json(),
+        'build_scatter_percentage_change': lambda: visualizations.build_scatter_percentage_change(
+            'unemployment_', start, end, data).to_json(),
+        'build_visualize_aggregates':
+            lambda: visualizations.build_visualize_aggregates(start, end, None, data).to_json()
+    }
+
+
+def get_startup_benchmarks(scale: int) -> dict[str, Callable[[], Any]]:
+    """ Return the startup stage benchmarks, by name, which are only run at scale 1. Each benchmark
+    runs a command in a new Python process, from starting Python to its exit, so its peak memory
+    is only the memory used to start the process.
+    """
+    if scale != 1:
+        return {}
+    directory = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        'query': [os.path.join(directory, 'query.py'), 'share', 'gdp_', '2020', 'Canada'],
+        'main --help': [os.path.join(directory, 'main.py'), '--help'],
+        'import visualizations': ['-c', 'import visualizations'],
+        'import plotly': ['-c', 'import plotly.express, pandas']
+    }
+    return {name: lambda command=command: run_python(command, directory)
+            for name, command in commands.items()}
+
+
+def run_python(arguments: list[str], directory: str) -> None:
+    """ Run a new Python process with the command line arguments in directory, and wait for it to
+    exit. Raise a subprocess.CalledProcessError if it fails.
+    """
+    subprocess.run([sys.executable] + arguments, check=True, capture_output=True, cwd=directory)
+
+
+def get_commit() -> str:
+    """ Return the hash of the git commit the benchmarks are run on, or '' if it isn't known.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(scales: Optional[list[int]] = None, stages: Optional[list[str]] = None,
+                   repeat: int = 3, output: str = RESULTS_FILE,
+                   year_scale: int = 1) -> list[dict]:
+    """ Run the benchmarks of every stage in stages (STAGES by default) on a dataset of every
+    scale in scales (SCALES by default), print a summary and write the results to output as JSON.
+    The datasets cover year_scale times as many years as the real dataset (see
+    make_synthetic_dataset). Return the results, where each result records the stage, name, scale
+    and year scale of a benchmark, the shape of its dataset, its median and best running times and
+    its peak memory.
+
+    Computations are benchmarked without their memoized results, so every run computes them.
+
+    Preconditions:
+        - all(scale >= 1 for scale in scales)
+        - all(stage in STAGES for stage in stages)
+        - repeat >= 1
+        - year_scale >= 1
+    """
+    scales = scales or SCALES
+    stages = stages or STAGES
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            if scale == 1 and year_scale == 1:
+                data = clean_data.load_dataset()
+            else:
+                data = make_synthetic_dataset(scale, year_scale=year_scale)
+            benchmarks = {
+                'load': lambda: get_load_benchmarks(data, scale, directory),
+                'compute': lambda: get_compute_benchmarks(data),
+                'render': lambda: get_render_benchmarks(data),
+                'startup': lambda: get_startup_benchmarks(scale)
+            }
+            for stage in stages:
+                for name, run in benchmarks[stage]().items():
+                    result = measure(run, repeat, data.derived.clear)
+                    result.update({'stage': stage, 'name': name, 'scale': scale,
+                                   'year_scale': year_scale, 'countries': len(data.names),
+                                   'years': len(data.years)})
+                    if stage == 'startup' and name == 'query':
+                        result['budget'] = query.STARTUP_BUDGET
+                    results.append(result)
+                    print(f'{stage:<8} {name:<34} x{scale:<5} {result["seconds"] * 1000:>11.2f} ms '
+                          f'{result["peak_memory"] / 2 ** 20:>10.2f} MiB')
+            # the shared dataset's memoized results were cleared by the benchmarks
+            data.derived.clear()
+    write_report(results, repeat, output)
+    return results
+
+
+def write_report(results: list[dict], repeat: int, output: str) -> None:
+    """ Write the results of run_benchmarks, each run repeat times, to output as JSON, along with
+    the commit and the versions and number of cores they were measured with.
+    """
+    report = {'commit': get_commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'cpus': os.cpu_count(), 'repeat': repeat,
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': ['write_synthetic_csv', 'run_benchmarks', 'write_report'],
+        'extra-imports': ['csv', 'json', 'math', 'os', 'platform', 'statistics', 'subprocess',
+                          'sys', 'tempfile', 'time', 'tracemalloc', 'typing', 'numpy', 'cache',
+                          'clean_data', 'composition', 'computations', 'correlations', 'inequality',
+                          'query', 'visualizations', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200', 'W0640']
+    })
+
+    run_benchmarks()
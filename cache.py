@@ -0,0 +1,407 @@
+""" CSC110 Fall 2021 Final Project: cache
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Cache the Dataset parsed by clean_data.py in binary files, so the csv files are only parsed
+    again once they change
+    2. Refresh a Dataset incrementally: only the source files that changed are parsed again, and
+    only the results derived from them are computed again
+
+The values read from each file in clean_data.METRIC_FILES are cached under a key of their own (see
+get_file_key), next to a manifest that records the signatures of the source files. The Dataset of
+each imputation method has a manifest of its own. clean_data.load_dataset uses this module to load
+the Dataset shared by every caller in a process (see get_shared_dataset).
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Union
+import numpy as np
+import instrument
+from clean_data import COVID_FILE, FILE_ROOTS, GDP_FILE, IMPUTATION_METHODS, METRIC_FILES, \
+    METRIC_ROOTS, SOURCE_FILES, Dataset, get_gdp_quartile, get_source_stamp, get_years, \
+    impute_roots, populate_dictionary, read_files
+
+# the directory the parsed Dataset is cached in, and the version of the format it is cached in
+CACHE_DIR = '.cache'
+CACHE_VERSION = 4
+
+
+def get_file_hash(filename: str) -> str:
+    """ Return the SHA-256 hash of the contents of the file.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@instrument.timed
+def get_source_signatures(known: Optional[list[dict]] = None) -> list[dict]:
+    """ Return the size, modification time and content hash of each file in SOURCE_FILES. The hash
+    of a file whose size and modification time are the same as in the signatures known (e.g. the
+    ones recorded in the cache) is taken from known instead of hashing the file again.
+    """
+    known_sources = {source['file']: source for source in known or []}
+    signatures = []
+    for filename in SOURCE_FILES:
+        status = os.stat(filename)
+        source = known_sources.get(filename, {})
+        if source.get('size') == status.st_size and source.get('mtime_ns') == status.st_mtime_ns:
+            digest = source['sha256']
+        else:
+            digest = get_file_hash(filename)
+        signatures.append({'file': filename, 'size': status.st_size,
+                           'mtime_ns': status.st_mtime_ns, 'sha256': digest})
+    return signatures
+
+
+def is_cache_current(sources: list[dict]) -> Optional[bool]:
+    """ Return whether the source files recorded in the cache are unchanged. A file whose size and
+    modification time are unchanged is assumed to be unchanged, otherwise its contents are hashed.
+
+    Return None (instead of True) if the files are unchanged but one of them was touched, so that
+    the recorded modification times should be updated.
+    """
+    if [source['file'] for source in sources] != SOURCE_FILES:
+        return False
+    touched = False
+    for source in sources:
+        status = os.stat(source['file'])
+        if status.st_size != source['size']:
+            return False
+        elif status.st_mtime_ns != source['mtime_ns']:
+            if get_file_hash(source['file']) != source['sha256']:
+                return False
+            source['mtime_ns'] = status.st_mtime_ns
+            touched = True
+    return None if touched else True
+
+
+def get_cache_path(name: str, key: str) -> str:
+    """ Return the path of the cached array called name, where key identifies the source file the
+    array was computed from (see get_file_key).
+    """
+    return os.path.join(CACHE_DIR, f'{name}.{key}.npy')
+
+
+def get_file_key(data: Dataset, filename: str) -> str:
+    """ Return the key of the arrays of data read from filename, which is a file in METRIC_FILES.
+    The key only changes when the contents of the file, the countries or years of data or the
+    imputation method of data change.
+    """
+    layout = [CACHE_VERSION, data.sources[filename], data.iso_codes, data.names, data.years,
+              data.imputation]
+    return hashlib.sha256(json.dumps(layout).encode()).hexdigest()[:16]
+
+
+def get_array_names(filename: str, imputation: Optional[str] = None) -> list[str]:
+    """ Return the names of the arrays of a Dataset read from filename, which is a file in
+    METRIC_FILES: the metric roots of the file and, for national GDP, 'quartiles', since the GDP
+    quartiles are only computed from national GDP. If the Dataset was imputed with the method
+    imputation, the mask of the values filled of each root is named 'imputed_' followed by the
+    root.
+
+    >>> get_array_names(GDP_FILE, 'linear')
+    ['gdp_', 'quartiles', 'imputed_gdp_']
+    """
+    names = FILE_ROOTS[filename] + (['quartiles'] if filename == GDP_FILE else [])
+    if imputation is not None:
+        names.extend('imputed_' + root for root in FILE_ROOTS[filename])
+    return names
+
+
+def get_file_arrays(data: Dataset, filename: str) -> dict[str, np.ndarray]:
+    """ Return a mapping of the name of each array of data read from filename (see
+    get_array_names) to the array.
+    """
+    arrays = {}
+    for name in get_array_names(filename, data.imputation):
+        if name == 'quartiles':
+            arrays[name] = data.quartiles
+        elif name.startswith('imputed_'):
+            arrays[name] = data.imputed[name[len('imputed_'):]]
+        else:
+            arrays[name] = data.columns[name]
+    return arrays
+
+
+def set_file_arrays(data: Dataset, arrays: dict[str, np.ndarray]) -> None:
+    """ Store the arrays returned by get_file_arrays in data.
+    """
+    for name, array in arrays.items():
+        if name == 'quartiles':
+            data.quartiles = array
+        elif name.startswith('imputed_'):
+            data.imputed[name[len('imputed_'):]] = array
+        else:
+            data.columns[name] = array
+
+
+def read_cached_arrays(filename: str, key: str,
+                       imputation: Optional[str] = None) -> Optional[dict[str, np.ndarray]]:
+    """ Return the arrays read from filename that are cached under key (see get_file_arrays) for
+    a Dataset imputed with the method imputation, memory-mapped read-only, or None if they aren't
+    all cached.
+    """
+    try:
+        return {name: np.load(get_cache_path(name, key), mmap_mode='r')
+                for name in get_array_names(filename, imputation)}
+    except (OSError, ValueError):
+        return None
+
+
+def save_atomic(path: str, content: Union[np.ndarray, dict]) -> None:
+    """ Write content (an array in .npy format or a dict in json format) to path. The content is
+    written to a temporary file first so that other processes never read a partially written file.
+    The temporary file is named after the process and the thread, so that threads writing the same
+    path at once (e.g. the threads of server.py) don't write to the same temporary file.
+    """
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as file:
+        if isinstance(content, np.ndarray):
+            np.save(file, content)
+        else:
+            file.write(json.dumps(content).encode())
+    os.replace(temporary, path)
+
+
+@instrument.timed
+def write_cache(data: Dataset, sources: list[dict]) -> None:
+    """ Write data to CACHE_DIR, where sources are the signatures of the source files data was read
+    from (as returned by get_source_signatures()). The arrays of each file in METRIC_FILES are
+    cached under a key of their own (see get_file_key), so only the arrays of the files that
+    changed are written. The cached arrays that the replaced manifest referred to and the new one
+    doesn't (e.g. the arrays of older source files) are removed once the new manifest is in place.
+
+    Preconditions:
+        - data.sources == {source['file']: source['sha256'] for source in sources}
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    old_keys = (read_manifest(data.imputation) or {}).get('keys', {})
+    keys = {metric_file: get_file_key(data, metric_file) for metric_file in METRIC_FILES}
+    for filename, key in keys.items():
+        for name, array in get_file_arrays(data, filename).items():
+            path = get_cache_path(name, key)
+            if not os.path.exists(path):
+                save_atomic(path, np.asarray(array))
+    # the manifest is swapped in last, so the arrays it refers to are always complete
+    save_atomic(get_manifest_path(data.imputation),
+                {'version': CACHE_VERSION, 'keys': keys, 'sources': sources,
+                 'roots': METRIC_ROOTS, 'names': data.names, 'codes': data.iso_codes,
+                 'years': data.years})
+    # only the arrays the new manifest replaced are removed, since the arrays no manifest refers
+    # to yet may belong to a manifest another process is about to write, and an array another
+    # manifest (e.g. one just written by another process) still refers to is kept
+    current = {current_key for imputation in [None] + IMPUTATION_METHODS
+               for current_key in (read_manifest(imputation) or {}).get('keys', {}).values()}
+    for filename, key in old_keys.items():
+        if filename in keys and key not in current:
+            for name in get_array_names(filename, data.imputation):
+                try:
+                    os.remove(get_cache_path(name, key))
+                except OSError:
+                    pass
+
+
+def get_manifest_path(imputation: Optional[str] = None) -> str:
+    """ Return the path of the manifest of the cache of the Dataset imputed with the method
+    imputation (None for the Dataset that isn't imputed).
+
+    >>> os.path.basename(get_manifest_path('linear'))
+    'dataset.linear.json'
+    """
+    name = 'dataset.json' if imputation is None else f'dataset.{imputation}.json'
+    return os.path.join(CACHE_DIR, name)
+
+
+def read_manifest(imputation: Optional[str] = None) -> Optional[dict]:
+    """ Return the manifest of the cache in CACHE_DIR of the Dataset imputed with the method
+    imputation, or None if there is no cache or it was written by another version of this module.
+    """
+    try:
+        with open(get_manifest_path(imputation)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION or manifest.get('roots') != METRIC_ROOTS:
+        return None
+    return manifest
+
+
+@instrument.timed
+def read_cache(imputation: Optional[str] = None) -> Optional[Dataset]:
+    """ Return the Dataset imputed with the method imputation that is cached in CACHE_DIR, or None
+    if there is no cache or the source files changed since it was written. The arrays of the
+    returned Dataset are memory-mapped read-only from the cache rather than read into memory.
+    """
+    manifest = read_manifest(imputation)
+    if manifest is None:
+        return None
+    try:
+        current = is_cache_current(manifest['sources'])
+        if current is False:
+            return None
+        data = Dataset(manifest['names'], manifest['codes'], manifest['years'],
+                       get_source_stamp(), imputation)
+        data.sources = {source['file']: source['sha256'] for source in manifest['sources']}
+        for filename in METRIC_FILES:
+            arrays = read_cached_arrays(filename, manifest['keys'][filename], imputation)
+            if arrays is None:
+                return None
+            set_file_arrays(data, arrays)
+    except (OSError, KeyError):
+        return None
+    if current is None:
+        # record the new modification times so the files aren't hashed again next time
+        save_atomic(get_manifest_path(imputation), manifest)
+    return data
+
+
+@instrument.timed
+def refresh_dataset(previous: Optional[Dataset] = None, use_cache: bool = True,
+                    workers: Optional[int] = None, imputation: Optional[str] = None) -> Dataset:
+    """ Return a new Dataset read from the csv files in METRIC_FILES, only parsing the files that
+    changed since previous (the Dataset loaded before, if any) or the binary cache was read from
+    them.
+
+    The values of a file are taken from previous if the file and the countries and years of the
+    Dataset are unchanged, or else from the cache in CACHE_DIR if use_cache is True. The other
+    files are parsed by workers worker processes (see read_files) and, if use_cache is True,
+    cached. GDP quartiles are only computed again when national GDP is parsed again.
+
+    If imputation is not None, the values of every file parsed are filled with the method
+    imputation (see impute_roots) before the GDP quartiles are computed.
+
+    Preconditions:
+        - imputation is None or imputation in IMPUTATION_METHODS
+    """
+    manifest = read_manifest(imputation) if use_cache else None
+    sources = get_source_signatures(manifest['sources'] if manifest is not None else None)
+    data = Dataset(*populate_dictionary(), get_years(), get_source_stamp(), imputation)
+    data.sources = {source['file']: source['sha256'] for source in sources}
+    # the Dataset whose arrays can be taken for the files that didn't change, if any
+    reused = previous if previous is not None and is_same_layout(previous, data) else None
+
+    parsed = []
+    for filename in METRIC_FILES:
+        arrays = None
+        if reused is not None and reused.sources.get(filename) == data.sources[filename]:
+            arrays = get_file_arrays(reused, filename)
+        elif use_cache:
+            arrays = read_cached_arrays(filename, get_file_key(data, filename), imputation)
+        if arrays is None:
+            parsed.append(filename)
+        else:
+            set_file_arrays(data, arrays)
+    instrument.count('refresh_dataset', 'files parsed', len(parsed))
+    read_files(data, parsed, workers)
+    if imputation is not None:
+        impute_roots(data, [root for filename in parsed for root in FILE_ROOTS[filename]])
+    if GDP_FILE in parsed:
+        get_gdp_quartile(data, data.years[0], data.years[-1])
+    if use_cache and parsed != []:
+        try:
+            write_cache(data, sources)
+        except OSError:
+            # the cache is only an optimization, so failing to write it isn't an error
+            pass
+    return data
+
+
+def is_same_layout(data1: Dataset, data2: Dataset) -> bool:
+    """ Return whether data1 and data2 store the same countries in the same rows and the same years
+    in the same columns and were imputed the same way, so that their arrays can be exchanged.
+    """
+    return data1.iso_codes == data2.iso_codes and data1.names == data2.names \
+        and data1.years == data2.years and data1.imputation == data2.imputation
+
+
+def keep_derived(previous: Dataset, data: Dataset) -> None:
+    """ Copy the results of previous.derived into data.derived when the source files they were
+    computed from are the same in both, so that only the results of the files that changed are
+    computed again. Nothing is copied unless both have the same layout (see is_same_layout).
+    """
+    if not is_same_layout(previous, data):
+        return
+    unchanged = {filename for filename in data.sources
+                 if previous.sources.get(filename) == data.sources[filename]}
+    kept = 0
+    for key, result in previous.derived.items():
+        files = previous.dependencies.get(key)
+        if files is not None and key not in data.derived and files <= unchanged:
+            data.remember(key, result, files)
+            kept += 1
+    if COVID_FILE in unchanged:
+        # the names used in the COVID-19 file were added as aliases when its metrics were read
+        data.index.update(previous.index)
+    instrument.count('keep_derived', 'kept', kept)
+
+
+class SharedDatasets:
+    """ The Datasets shared by every caller of clean_data.load_dataset in this process.
+
+    Instance Attributes:
+        - datasets: a mapping of an imputation method (None for no imputation) to the Dataset
+        returned by the last call to get_shared_dataset with that method
+        - lock: the lock held while a Dataset is checked and loaded again, so that threads (e.g.
+        the threads of server.py) never refresh the same Dataset at once
+    """
+    datasets: dict[Optional[str], Dataset]
+    lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.datasets = {}
+        self.lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_datasets() -> SharedDatasets:
+    """ Return the SharedDatasets of this process, which is created the first time it is needed.
+    """
+    return SharedDatasets()
+
+
+def get_shared_dataset(use_cache: bool = True, workers: Optional[int] = None,
+                       imputation: Optional[str] = None) -> Dataset:
+    """ Return the shared Dataset imputed with the method imputation, loading it again (see
+    read_cache and refresh_dataset) if a source file was modified since it was last loaded. The
+    derived results of the files that didn't change are kept (see keep_derived).
+
+    Preconditions:
+        - imputation is None or imputation in IMPUTATION_METHODS
+    """
+    shared = get_shared_datasets()
+    with shared.lock:
+        previous = shared.datasets.get(imputation)
+        if previous is None or previous.stamp != get_source_stamp():
+            data = read_cache(imputation) if use_cache else None
+            if data is None:
+                data = refresh_dataset(previous, use_cache, workers, imputation)
+            if previous is not None:
+                keep_derived(previous, data)
+            shared.datasets[imputation] = data
+        return shared.datasets[imputation]
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': ['get_file_hash', 'save_atomic', 'read_manifest'],
+        'extra-imports': ['functools', 'hashlib', 'json', 'os', 'threading', 'typing', 'numpy',
+                          'instrument', 'clean_data', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200']
+    })
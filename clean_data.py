@@ -4,323 +4,975 @@ This Python module contains several function headers and descriptions. Functions
 in this file are meant to:
     1. Extract country metrics from external csv files
     2. Process country metrics obtained from csv files to set new metrics
+
+The cleaned data is stored column by column: a Dataset holds one float64 matrix per metric root
+(e.g. 'gdp_' or 'unemployment_') where row i is the i-th country and column j is the j-th year.
+Missing values are stored as NaN. COVID-19 metrics and the World Bank region and income group of
+every country are loaded into the same rows on demand.
+
+Loading is incremental: the values read from each source file are cached separately, so when one
+file changes only that file is parsed again, GDP quartiles are only computed again when national
+GDP changes, and the results derived from the files that didn't change are kept (see
+cache.refresh_dataset).
+
+Imputation is opt-in: a Dataset loaded with an imputation method (see IMPUTATION_METHODS) has the
+gaps in every country's series filled when its files are read, and records which values were
+filled, so that a country isn't left out of a result because of one missing year. Each method's
+Dataset is cached separately.
 """
 
 import csv
-from typing import Optional, Any
+import math
+import operator
+import os
+import re
+from typing import Any, Iterable, Iterator, Optional, Union
+import numpy as np
+import instrument
+
+# the csv files a Dataset is read from; a change to any of them invalidates the loaded Dataset.
+# The files outside of METRIC_FILES are only parsed when one of their columns is first needed.
+COVID_FILE = 'raw_data/covid_vaccination.csv'
+GROUPS_FILE = 'raw_data/country_income_quartile.csv'
+GDP_FILE = 'raw_data/national_gdp.csv'
+METRIC_FILES = [GDP_FILE, 'raw_data/sector_gdp.csv', 'raw_data/unemployment_rate.csv']
+SOURCE_FILES = METRIC_FILES + [COVID_FILE, GROUPS_FILE]
+
+# the World Bank income groups, from the lowest to the highest
+INCOME_GROUPS = ['Low income', 'Lower middle income', 'Upper middle income', 'High income']
+
+# the roots of every metric stored in a Dataset
+METRIC_ROOTS = ['gdp_', 'gdp_manufacturing_', 'gdp_service_', 'gdp_industry_', 'gdp_agriculture_',
+                'unemployment_']
+
+# the methods that can fill the missing values of a country's series (see impute_matrix), and the
+# longest run of missing years they fill
+IMPUTATION_METHODS = ['linear', 'ffill', 'growth']
+IMPUTATION_LIMIT = 3
+
+# country codes used by some sources in place of the ISO3 code of a country
+CODE_ALIASES = {'OWID_KOS': 'XKX'}
+
+# the metric root of each sector indicator code found in sector_gdp.csv
+SECTOR_ROOTS = {'NV.IND.MANF.KN': 'gdp_manufacturing_', 'NV.SRV.TOTL.KN': 'gdp_service_',
+                'NV.IND.TOTL.KN': 'gdp_industry_', 'NV.AGR.TOTL.KN': 'gdp_agriculture_'}
+
+# the metric root of each World Development Indicators code stored in a Dataset
+INDICATOR_ROOTS = {'NY.GDP.MKTP.CD': 'gdp_', 'SL.UEM.TOTL.ZS': 'unemployment_', **SECTOR_ROOTS}
+
+# the metric roots read from each file in METRIC_FILES, and the file each metric root is read from
+FILE_ROOTS = {GDP_FILE: ['gdp_'], 'raw_data/sector_gdp.csv': list(SECTOR_ROOTS.values()),
+              'raw_data/unemployment_rate.csv': ['unemployment_']}
+ROOT_FILES = {root: filename for filename in FILE_ROOTS for root in FILE_ROOTS[filename]}
+
+# the number of csv rows converted to floats at once when streaming a file
+CHUNK_SIZE = 4096
+
+# the indicators stored from each file in METRIC_FILES, where None means that the file has a
+# column for every year of every indicator (see get_header_attributes)
+METRIC_INDICATORS = {'raw_data/national_gdp.csv': {'NY.GDP.MKTP.CD': 'gdp_'},
+                     'raw_data/sector_gdp.csv': None,
+                     'raw_data/unemployment_rate.csv': {'SL.UEM.TOTL.ZS': 'unemployment_'}}
+
+# the total size in bytes of the csv files above which they are parsed by one worker process per
+# core, and the smallest part of a file that is given to a worker of its own
+PARALLEL_THRESHOLD = 32 * 2 ** 20
+PART_SIZE = 4 * 2 ** 20
+
+
+class Dataset:
+    """ A snapshot of the cleaned data of every country. A single Dataset is shared by all
+    computations and visualizations so that the csv files are only parsed once.
+
+    Instance Attributes:
+        - names: the name of every country, where names[i] is the country stored in row i
+        - iso_codes: the ISO3 code of every country, where iso_codes[i] is the country stored in
+        row i
+        - codes: a mapping of a country's name to its ISO3 code
+        - code_index: a mapping of a country's ISO3 code (or an alias of it in CODE_ALIASES) to
+        its row
+        - index: a mapping of a country's name (or an alias of it, such as the spelling used by
+        another source) to its row
+        - years: the years stored, where years[j] is the year stored in column j
+        - columns: a mapping of a metric root to its matrix of values
+        - quartiles: the GDP quartile of every country in every year, where 4 is the top 25%
+        quartile, 1 is the bottom 25% quartile and 0 means the country's GDP isn't available
+        - countries: a mapping of a country's name to a Country view of its row
+        - stamp: the modification time of each file in SOURCE_FILES when 'self' was loaded
+        - sources: a mapping of each file in SOURCE_FILES to the SHA-256 hash of its contents
+        when 'self' was loaded, or {} if they weren't hashed
+        - derived: a mapping of a computation and its parameters to its (read-only) result, so
+        that results computed from 'self' are only computed once
+        - dependencies: a mapping of each key of derived to the source files its result was
+        computed from (see remember)
+        - imputation: the method the missing values of 'self' were filled with (see
+        impute_matrix), or None if they weren't filled
+        - imputed: a mapping of a metric root to the mask of its values that were filled, where
+        imputed[root][i, j] is True if the value of the i-th country in the j-th year was
+        missing, or {} if imputation is None
+
+    Representation Invariants:
+        - len(self.names) == len(self.iso_codes) == len(self.codes)
+        - all(self.code_index[self.iso_codes[i]] == i for i in range(len(self.iso_codes)))
+        - all(self.index[self.names[i]] == i for i in range(len(self.names)))
+        - all(self.columns[root].shape == (len(self.names), len(self.years))
+              for root in self.columns)
+        - self.quartiles.shape == (len(self.names), len(self.years))
+        - self.imputation is None or self.imputation in IMPUTATION_METHODS
+        - (self.imputation is None) == (self.imputed == {})
+        - all(self.imputed[root].shape == self.columns[root].shape for root in self.imputed)
+
+    Sample Usage
+    >>> data = Dataset(['Canada'], ['CAN'], [2020])
+    >>> data.columns['gdp_'][0, 0] = 1644040000000.0
+    >>> data.countries['Canada'].gdp_2020
+    1644040000000.0
+    """
+    names: list[str]
+    iso_codes: list[str]
+    codes: dict[str, str]
+    code_index: dict[str, int]
+    index: dict[str, int]
+    years: list[int]
+    columns: dict[str, np.ndarray]
+    quartiles: np.ndarray
+    countries: dict[str, 'Country']
+    stamp: tuple[int, ...]
+    sources: dict[str, str]
+    derived: dict[tuple, Any]
+    dependencies: dict[tuple, frozenset[str]]
+    imputation: Optional[str]
+    imputed: dict[str, np.ndarray]
+
+    def __init__(self, names: list[str], codes: list[str], years: list[int],
+                 stamp: tuple[int, ...] = (), imputation: Optional[str] = None) -> None:
+        self.names = names
+        self.iso_codes = codes
+        self.codes = dict(zip(names, codes))
+        self.code_index = {code: i for i, code in enumerate(codes)}
+        for alias, code in CODE_ALIASES.items():
+            if code in self.code_index:
+                self.code_index[alias] = self.code_index[code]
+        self.index = {}
+        # names used to be capitalized (e.g. 'United states'), so those spellings are aliases
+        self.add_aliases([name.capitalize() for name in names], list(range(len(names))))
+        self.add_aliases(names, list(range(len(names))))
+        self.years = years
+        shape = (len(names), len(years))
+        # column-major order keeps the values of each year contiguous in memory
+        self.columns = {root: np.full(shape, np.nan, order='F') for root in METRIC_ROOTS}
+        self.quartiles = np.zeros(shape, dtype=np.int8, order='F')
+        self.countries = {name: Country(self, i) for i, name in enumerate(names)}
+        self.stamp = stamp
+        self.sources = {}
+        self.derived = {}
+        self.dependencies = {}
+        self.imputation = imputation
+        self.imputed = {} if imputation is None else {
+            root: np.zeros(shape, dtype=bool, order='F') for root in METRIC_ROOTS}
+
+    def add_aliases(self, aliases: list[str], rows: list[int]) -> None:
+        """ Record that aliases[k] is a name of the country stored in rows[k].
+
+        Preconditions:
+            - len(aliases) == len(rows)
+        """
+        self.index.update(zip(aliases, rows))
+
+    def remember(self, key: tuple, result: Any, files: Iterable[str]) -> None:
+        """ Store result in self.derived under key, where result was computed from the source
+        files in files (e.g. the files returned by get_root_files). The result is kept by the
+        next Dataset loaded as long as these files don't change.
+        """
+        self.derived[key] = result
+        self.dependencies[key] = frozenset(files)
+
+    def get_stamp(self, files: Iterable[str]) -> tuple[str, ...]:
+        """ Return the hashes of the contents of the source files in files when self was loaded,
+        so that anything computed from these files can be recomputed once one of them changes.
+        """
+        return tuple(self.sources.get(filename, '') for filename in files)
+
+    def row(self, country: str) -> int:
+        """ Return the row of the country, which is given by its ISO3 code, its name or an alias of
+        its name.
+
+        >>> data = Dataset(['Russian Federation'], ['RUS'], [2020])
+        >>> data.add_aliases(['Russia'], [0])
+        >>> [data.row(key) for key in ['RUS', 'Russian Federation', 'Russian federation', 'Russia']]
+        [0, 0, 0, 0]
+        """
+        if country in self.code_index:
+            return self.code_index[country]
+        return self.index[country]
+
+    def get_rows(self, codes: list[str]) -> np.ndarray:
+        """ Return the row of the country with each ISO3 code in codes, or -1 if self has no
+        country with that code. Sources are joined to self by gathering their values into these
+        rows.
+
+        >>> Dataset(['Canada', 'Kosovo'], ['CAN', 'XKX'], [2020]).get_rows(['OWID_KOS', 'X', 'CAN'])
+        array([ 1, -1,  0])
+        """
+        lookup = self.code_index.get
+        return np.array([lookup(code, -1) for code in codes], dtype=np.intp)
+
+    def column(self, attr: str) -> np.ndarray:
+        """ Return the values of attr (e.g. 'gdp_2016' or 'gdp_quartile_2016') for every country,
+        where the i-th value belongs to the country stored in row i.
+
+        Preconditions:
+            - attr is the name of a metric root or 'gdp_quartile_' followed by a year in self.years
+        """
+        root, year = attr[:-4], int(attr[-4:])
+        j = self.years.index(year)
+        if root == 'gdp_quartile_':
+            return self.quartiles[:, j]
+        return self.columns[root][:, j]
 
 
 class Country:
-    """ A class representing each country with their associated statistics
+    """ A lightweight view of a country's row in a Dataset. Any metric root followed by a year
+    (e.g. country.gdp_2016 or country.unemployment_2020) is read directly from the Dataset, as is
+    country.gdp_quartile_xxxx where xxxx is a year.
 
     Instance Attributes:
         - name: the name of 'self'
-        - gdp_2016: national GDP value of 'self' reported in the year 2016
-        - gdp_2017: national GDP value of 'self' reported in the year 2017
-        - gdp_2018: national GDP value of 'self' reported in the year 2018
-        - gdp_2019: national GDP value of 'self' reported in the year 2019
-        - gdp_2020: national GDP value of 'self' reported in the year 2020
-        - gdp_quartile_2016: the quartile of 'self's 2016 GDP where 4 is the top 25% quartile
-        and 1 is the bottom 25% quartile
-        - gdp_quartile_2017: the quartile of 'self's 2017 GDP where 4 is the top 25% quartile
-        and 1 is the bottom 25% quartile
-        - gdp_quartile_2018: the quartile of 'self's 2018 GDP where 4 is the top 25% quartile
-        and 1 is the bottom 25% quartile
-        - gdp_quartile_2019: the quartile of 'self's 2019 GDP where 4 is the top 25% quartile
-        and 1 is the bottom 25% quartile
-        - gdp_quartile_2020: the quartile of 'self's 2020 GDP where 4 is the top 25% quartile
-        and 1 is the bottom 25% quartile
-        - gdp_manufacturing_2016: GDP value of self in manufactoring sector in 2016
-        - gdp_service_2016: GDP value of self in service sector in 2016
-        - gdp_industry_2016: GDP value of self in industry sector in 2016
-        - gdp_agriculture_forestry_fishing_2016: GDP value of self in agriculture sector in 2016
-        - gdp_manufacturing_2017: GDP value of self in manufacturing sector in 2017
-        - gdp_service_2017: GDP value of self in service sector in 2017
-        - gdp_industry_2017: GDP value of self in industry sector in 2017
-        - gdp_agriculture_forestry_fishing_2017: GDP value of self in agriculture sector in 2017
-        - gdp_manufacturing_2018: GDP value of self in manufacturing sector in 2018
-        - gdp_service_2018: GDP value of self in service sector in 2018
-        - gdp_industry_2018: GDP value of self in industry sector in 2018
-        - gdp_agriculture_forestry_fishing_2018: GDP value of self in agriculture sector in 2018
-        - gdp_manufacturing_2019: GDP value of self in manufactoring sector in 2019
-        - gdp_service_2019: GDP value of self in service sector in 2019
-        - gdp_industry_2019: GDP value of self in industry sector in 2019
-        - gdp_agriculture_forestry_fishing_2019: GDP value of self in agriculture sector in 2019
-        - gdp_manufacturing_2020: GDP value of self in manufactoring sector in 2020
-        - gdp_service_2020: GDP value of self in service sector in 2020
-        - gdp_industry_2020: GDP value of self in industry sector in 2020
-        - gdp_agriculture_forestry_fishing_2020: GDP value of self in agriculture section in 2020
-        - unemployment_2016: unemployment rate of 'self' reported in year 2016
-        - unemployment_2017: unemployment rate of 'self' in year 2017
-        - unemployment_2018: unemployment rate of 'self' in year 2018
-        - unemployment_2019: unemployment rate of 'self' in year 2019
-        - unemployment_2020: unemployment rate of 'self' in year 2020
+        - data: the Dataset 'self' is stored in
+        - row: the row of 'self' in data
 
     Representation Invariants:
         - self.name != ''
-        - gdp attribute is either an empty string or a float >= 0
-        - gdp quartile attribute is either a int in range [0, 4] or None
-        - sector gdp attribute is either an empty string or a float >= 0
-        - unemployment attribute is either a string or a float >= 0
+        - self.data.names[self.row] == self.name
+        - gdp and sector gdp attributes are either NaN or a float >= 0
+        - gdp quartile attributes are either an int in range [1, 4] or None
+        - unemployment attributes are either NaN or a float >= 0
 
     Sample Usage
-    >>> Country('Canada')
+    >>> data = Dataset(['Canada'], ['CAN'], [2020])
+    >>> canada = Country(data, 0)
+    >>> canada.name
+    'Canada'
+    >>> canada.gdp_quartile_2020 is None
+    True
     """
     name: str
-    gdp_2016: Optional[Any]
-    gdp_2017: Optional[Any]
-    gdp_2018: Optional[Any]
-    gdp_2019: Optional[Any]
-    gdp_2020: Optional[Any]
-    gdp_quartile_2016: Optional[int]
-    gdp_quartile_2017: Optional[int]
-    gdp_quartile_2018: Optional[int]
-    gdp_quartile_2019: Optional[int]
-    gdp_quartile_2020: Optional[int]
-    gdp_manufacturing_2016: Optional[Any]
-    gdp_service_2016: Optional[Any]
-    gdp_industry_2016: Optional[Any]
-    gdp_agriculture_2016: Optional[Any]
-    gdp_manufacturing_2017: Optional[Any]
-    gdp_service_2017: Optional[Any]
-    gdp_industry_2017: Optional[Any]
-    gdp_agriculture_2017: Optional[Any]
-    gdp_manufacturing_2018: Optional[Any]
-    gdp_service_2018: Optional[Any]
-    gdp_industry_2018: Optional[Any]
-    gdp_agriculture_2018: Optional[Any]
-    gdp_manufacturing_2019: Optional[Any]
-    gdp_service_2019: Optional[Any]
-    gdp_industry_2019: Optional[Any]
-    gdp_agriculture_2019: Optional[Any]
-    gdp_manufacturing_2020: Optional[Any]
-    gdp_service_2020: Optional[Any]
-    gdp_industry_2020: Optional[Any]
-    gdp_agriculture_2020: Optional[Any]
-    unemployment_2016: Optional[Any]
-    unemployment_2017: Optional[Any]
-    unemployment_2018: Optional[Any]
-    unemployment_2019: Optional[Any]
-    unemployment_2020: Optional[Any]
-
-    def __init__(self, name: str) -> None:
-        self.name = name
-
-        self.gdp_2016 = None
-        self.gdp_2017 = None
-        self.gdp_2018 = None
-        self.gdp_2019 = None
-        self.gdp_2020 = None
-
-        self.gdp_quartile_2016 = None
-        self.gdp_quartile_2017 = None
-        self.gdp_quartile_2018 = None
-        self.gdp_quartile_2019 = None
-        self.gdp_quartile_2020 = None
-
-        self.gdp_manufacturing_2016 = None
-        self.gdp_service_2016 = None
-        self.gdp_industry_2016 = None
-        self.gdp_agriculture_2016 = None
-        self.gdp_manufacturing_2017 = None
-        self.gdp_service_2017 = None
-        self.gdp_industry_2017 = None
-        self.gdp_agriculture_2017 = None
-        self.gdp_manufacturing_2018 = None
-        self.gdp_service_2018 = None
-        self.gdp_industry_2018 = None
-        self.gdp_agriculture_2018 = None
-        self.gdp_manufacturing_2019 = None
-        self.gdp_service_2019 = None
-        self.gdp_industry_2019 = None
-        self.gdp_agriculture_2019 = None
-        self.gdp_manufacturing_2020 = None
-        self.gdp_service_2020 = None
-        self.gdp_industry_2020 = None
-        self.gdp_agriculture_2020 = None
-
-        self.unemployment_2016 = None
-        self.unemployment_2017 = None
-        self.unemployment_2018 = None
-        self.unemployment_2019 = None
-        self.unemployment_2020 = None
-
-
-def populate_dictionary() -> tuple[dict[str, Country], dict[str, str]]:
-    """ Return a tuple of dictionary. The first dictionary maps the country code to a country name
-    and the second dictionary maps the country name to a Country instance.
+    data: Dataset
+    row: int
+
+    def __init__(self, data: Dataset, row: int) -> None:
+        self.name = data.names[row]
+        self.data = data
+        self.row = row
+
+    def __getattr__(self, attr: str) -> Union[float, Optional[int]]:
+        """ Return the value of attr for 'self', read from self.data.
+        """
+        try:
+            value = self.data.column(attr)[self.row]
+        except (KeyError, ValueError) as error:
+            raise AttributeError(attr) from error
+        if attr.startswith('gdp_quartile_'):
+            return int(value) if value != 0 else None
+        return float(value)
+
+
+def find_header(filename: str) -> tuple[int, list[str]]:
+    """ Return the line number and the cells of the header row of the csv file, which is the first
+    row whose first cell is 'Country Name'.
+
+    Preconditions:
+        - filename is a csv file with a header row
+    """
+    with open(filename) as file:
+        reader = csv.reader(file, delimiter=',')
+        for line, row in enumerate(reader):
+            if row != [] and row[0].lstrip('\ufeff') == 'Country Name':
+                return line, row
+    raise ValueError(f'{filename} has no header row')
+
+
+def get_header_attributes(header: list[str], root: str) -> tuple[list[str], list[int]]:
+    """ Return a tuple of two parallel lists. The first list contains the attributes found in the
+    header row of a csv file and the second list contains the column each attribute is found in.
+
+    A column whose header is a year (e.g. '2016') holds the attribute root + year. A column whose
+    header names a year and an indicator code in SECTOR_ROOTS (e.g. '2016 [YR2016] - Services,
+    value added (constant LCU) [NV.SRV.TOTL.KN]') holds the attribute of that sector in that year.
+
+    >>> get_header_attributes(['Country Name', 'Country Code', '1960', '1961'], 'gdp_')
+    (['gdp_1960', 'gdp_1961'], [2, 3])
+    >>> get_header_attributes(['Country Name', '2016 [YR2016] - Services [NV.SRV.TOTL.KN]'], '')
+    (['gdp_service_2016'], [1])
+    """
+    attributes = []
+    columns = []
+    for column in range(len(header)):
+        cell = header[column].strip()
+        if cell.isdigit():
+            attributes.append(root + cell)
+            columns.append(column)
+        elif cell[:4].isdigit() and cell.endswith(']'):
+            code = cell[cell.rindex('[') + 1:-1]
+            if code in SECTOR_ROOTS:
+                attributes.append(SECTOR_ROOTS[code] + cell[:4])
+                columns.append(column)
+    return attributes, columns
+
+
+def get_years() -> list[int]:
+    """ Return every year between the first and the last year found in the header rows of the
+    files in METRIC_FILES.
+    """
+    years = set()
+    for filename in METRIC_FILES:
+        attributes = get_header_attributes(find_header(filename)[1], '')[0]
+        years.update(int(attr[-4:]) for attr in attributes)
+    return list(range(min(years), max(years) + 1))
+
+
+@instrument.timed
+def populate_dictionary() -> tuple[list[str], list[str]]:
+    """ Return a tuple of two parallel lists. The first list contains the name of every country and
+    the second list contains the country code of every country.
 
     Preconditions:
         - raw_data/national_gdp.csv file is in the correct format
     """
     # initialize accumulators
-    country_dict = {}
-    code_dict = {}
+    names = []
+    codes = []
+    lines, header = find_header('raw_data/national_gdp.csv')
+    code_column = header.index('Country Code')
     # open csv file
     with open('raw_data/national_gdp.csv') as file:
         reader = csv.reader(file, delimiter=',')
-        # skip the first 5 lines
-        for _ in range(5):
+        # skip the lines up to and including the header row
+        for _ in range(lines + 1):
             next(reader)
         # iterate through all the remaining rows
         for row in reader:
             # get the country's name and country code
-            name = row[0].capitalize()
-            code = row[1]
-            # map the name to a Country instance and the code to the name
-            country_dict[name] = Country(name)
-            code_dict[name] = code
+            names.append(row[0])
+            codes.append(row[code_column])
     # return both accumulators
-    return country_dict, code_dict
+    return names, codes
 
 
-def populate_attribute_name(country_dict: dict, filename: str, lines: int, attributes: [str],
-                            columns: [int]) -> None:
-    """ Populate the attributes of Country instance attribute where the csv file contains the
-    desired attribute in the attributes list. 'attributes' and 'columns' are parallel lists
-    where attribute[i] can be found in columns[i] of the csv file.
+def to_floats(cells: list[list[str]], width: int) -> np.ndarray:
+    """ Return a float64 matrix of the numbers in cells, where cells that aren't numbers
+    (e.g. '' or '..') are NaN. All cells are converted at once rather than one by one.
+
+    Preconditions:
+        - all(len(row) == width for row in cells)
+
+    >>> to_floats([['1.5', ''], ['..', '2E+3']], 2).tolist()
+    [[1.5, nan], [nan, 2000.0]]
+    """
+    if cells == []:
+        return np.empty((0, width))
+    strings = np.array(cells, dtype=str)
+    strings = np.where((strings == '') | (strings == '..'), 'nan', strings)
+    try:
+        return strings.astype(np.float64)
+    except ValueError:
+        # fall back to converting cell by cell if a cell is neither a number nor missing
+        return np.array([[to_float(cell) for cell in row] for row in cells], dtype=np.float64)
+
+
+def to_float(cell: str) -> float:
+    """ Return cell as a float, or NaN if it isn't a number.
+
+    >>> to_float('3.25')
+    3.25
+    >>> to_float('..')
+    nan
+    """
+    try:
+        return float(cell)
+    except ValueError:
+        return math.nan
+
+
+@instrument.timed
+def populate_attribute_name(data: Dataset, filename: str, lines: int, attributes: [str],
+                            columns: [int], code_column: int = 1) -> None:
+    """ Populate the values of data where the csv file contains the desired attribute in the
+    attributes list. 'attributes' and 'columns' are parallel lists where attribute[i] can be found
+    in columns[i] of the csv file. Values that aren't numbers are stored as NaN.
+
+    Each row of the csv file is joined to the country in data with the ISO3 code found in
+    code_column of the row. Rows of countries that aren't in data are ignored.
 
     Preconditions:
         - len(attributes) == len(columns)
-        - attribute[i] is an attribute of the Country class
+        - attribute[i] is a metric root in METRIC_ROOTS followed by a year in data.years
         - all values in columns are less than the number of columns in the csv file row
     """
+    codes = []
+    cells = []
+    width = max(columns + [code_column]) + 1
     # open csv file
     with open(filename) as file:
         reader = csv.reader(file, delimiter=',')
         # skip the first 'lines' lines
         for _ in range(lines):
             next(reader)
-        # iterate through all the remaining rows
+        # iterate through all the remaining rows, keeping the cells of the desired columns
         for row in reader:
-            # get the name of the country
-            country = row[0].capitalize()
-            # check country is in country_dict
-            if country in country_dict:
-                # iterate through all attributes and their respective columns
-                for i in range(len(attributes)):
-                    # convert data in csv file to float if possible, else keep as string
-                    try:
-                        setattr(country_dict[country], attributes[i], float(row[columns[i]]))
-                    except ValueError:
-                        setattr(country_dict[country], attributes[i], (row[columns[i]]))
-
-
-def get_national_gdp(country_dict: dict) -> None:
+            if len(row) >= width:
+                codes.append(row[code_column])
+                cells.append([row[column] for column in columns])
+    instrument.count('populate_attribute_name', 'rows', len(codes))
+    instrument.count('populate_attribute_name', 'bytes', os.path.getsize(filename))
+    # convert every kept cell to a float at once, then gather the values of the rows of countries
+    # in data into their rows in data, one root at a time
+    rows = data.get_rows(codes)
+    found = rows >= 0
+    values = to_floats(cells, len(columns))[found]
+    rows = rows[found]
+    for root in METRIC_ROOTS:
+        source = [k for k in range(len(attributes)) if attributes[k][:-4] == root]
+        if source != []:
+            target = [data.years.index(int(attributes[k][-4:])) for k in source]
+            data.columns[root][np.ix_(rows, target)] = values[:, source]
+
+
+def populate_file(data: Dataset, filename: str, root: str) -> None:
+    """ Populate the values of data found in every year column of the csv file, where the header
+    row of the csv file is found with find_header.
+    """
+    line, header = find_header(filename)
+    attributes, columns = get_header_attributes(header, root)
+    populate_attribute_name(data, filename, line + 1, attributes, columns,
+                            header.index('Country Code'))
+
+
+@instrument.timed
+def stream_indicators(data: Dataset, filename: str, indicators: dict[str, str],
+                      chunk_size: int = CHUNK_SIZE,
+                      span: Optional[tuple[int, int]] = None) -> int:
+    """ Populate the values of data found in a World Development Indicators csv file, where every
+    row holds one indicator of one country in every year (e.g. national_gdp.csv or the full WDI
+    bulk export WDIData.csv). 'indicators' maps the code of every desired indicator to the metric
+    root its values are stored under. Return the number of rows that were stored.
+
+    The file is read once, line by line. Lines that don't mention a desired indicator code are
+    skipped without being parsed, and the kept rows are converted and stored chunk_size rows at a
+    time, so memory use doesn't grow with the size of the file. Year columns outside of data.years
+    and rows of countries that aren't in data are ignored. If span is given, only the lines of
+    the file in that byte range are read (see read_lines).
+
+    Preconditions:
+        - filename has a header row starting with 'Country Name' that contains 'Country Code',
+        'Indicator Code' and year columns
+        - chunk_size >= 1
+    """
+    pattern = re.compile('|'.join(re.escape(code) for code in indicators))
+    header = find_header(filename)[1]
+    code_column = header.index('Country Code')
+    indicator_column = header.index('Indicator Code')
+    columns = [c for c in range(len(header))
+               if header[c].strip().isdigit() and int(header[c]) in data.years]
+    target = [data.years.index(int(header[c])) for c in columns]
+    chunk = ([], [], [])
+    stored = 0
+    # only the lines that mention a desired indicator code are parsed as csv
+    lines = read_lines(filename, span)
+    for row in csv.reader(text for text in lines if pattern.search(text)):
+        if len(row) > indicator_column and row[indicator_column] in indicators:
+            chunk[0].append(row[code_column])
+            chunk[1].append(indicators[row[indicator_column]])
+            chunk[2].append([row[c] if c < len(row) else '' for c in columns])
+            if len(chunk[0]) == chunk_size:
+                stored += store_chunk(data, chunk, target)
+                chunk = ([], [], [])
+    stored += store_chunk(data, chunk, target)
+    instrument.count('stream_indicators', 'rows', stored)
+    return stored
+
+
+def get_body_offset(filename: str) -> int:
+    """ Return the byte offset of the first line after the header row of the csv file, which is
+    the first row whose first cell is 'Country Name'.
+
+    Preconditions:
+        - filename is a csv file with a header row
+    """
+    position = 0
+    with open(filename, 'rb') as file:
+        for line in file:
+            position += len(line)
+            row = next(csv.reader([line.decode('utf-8-sig')]), [])
+            if row != [] and row[0] == 'Country Name':
+                return position
+    raise ValueError(f'{filename} has no header row')
+
+
+def read_lines(filename: str, span: Optional[tuple[int, int]] = None) -> Iterator[str]:
+    """ Return an iterator over the lines of the csv file after its header row. If span is given,
+    only the lines that start at a byte offset in the range [span[0], span[1]) are returned, so a
+    file split into consecutive spans can be read in parts without reading a line twice.
+
+    Preconditions:
+        - no quoted cell of the csv file contains a line break
+        - span is None or get_body_offset(filename) <= span[0] <= span[1]
+    """
+    start, end = span or (get_body_offset(filename), os.path.getsize(filename))
+    with open(filename, 'rb') as file:
+        # skip the rest of the line that contains the byte before start
+        file.seek(start - 1)
+        position = start - 1 + len(file.readline())
+        for line in file:
+            if position >= end:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+    instrument.count('read_lines', 'bytes', position - start)
+
+
+def store_chunk(data: Dataset, chunk: tuple[list[str], list[str], list[list[str]]],
+                target: list[int]) -> int:
+    """ Store a chunk of rows read by stream_indicators in data and return the number of rows
+    stored. The chunk is a tuple of three parallel lists: the country code of every row, the metric
+    root of every row and the cells of every row, where the k-th cell of a row belongs in column
+    target[k] of data. A root that isn't in data.columns yet is added to it.
+    """
+    codes, roots, cells = chunk
+    rows = data.get_rows(codes)
+    values = to_floats(cells, len(target))
+    roots = np.array(roots)
+    stored = 0
+    for root in set(roots.tolist()):
+        if root not in data.columns:
+            data.columns[root] = np.full((len(data.names), len(data.years)), np.nan, order='F')
+        kept = (roots == root) & (rows >= 0)
+        data.columns[root][np.ix_(rows[kept], target)] = values[kept]
+        stored += int(np.count_nonzero(kept))
+    return stored
+
+
+def get_national_gdp(data: Dataset) -> None:
     """ Retrieve national gdp data from national_gdp.csv
     """
-    filename = 'raw_data/national_gdp.csv'
-    attributes = ['gdp_2016', 'gdp_2017', 'gdp_2018', 'gdp_2019', 'gdp_2020']
-    columns = [-5, -4, -3, -2, -1]
-    populate_attribute_name(country_dict, filename, 4, attributes, columns)
+    stream_indicators(data, 'raw_data/national_gdp.csv', {'NY.GDP.MKTP.CD': 'gdp_'})
 
 
-def get_sector_gdp(country_dict: dict) -> None:
+def get_sector_gdp(data: Dataset) -> None:
     """ Retrieve sector gdp data from sector_gdp.csv
     """
-    # getting sector gdp attribute
-    filename = 'raw_data/sector_gdp.csv'
-    attributes = [
-        'gdp_manufacturing_2016', 'gdp_service_2016', 'gdp_industry_2016',
-        'gdp_agriculture_2016', 'gdp_manufacturing_2017',
-        'gdp_service_2017', 'gdp_industry_2017', 'gdp_agriculture_2017',
-        'gdp_manufacturing_2018', 'gdp_service_2018', 'gdp_industry_2018',
-        'gdp_agriculture_2018', 'gdp_manufacturing_2019', 'gdp_service_2019',
-        'gdp_industry_2019', 'gdp_agriculture_2019', 'gdp_manufacturing_2020',
-        'gdp_service_2020', 'gdp_industry_2020', 'gdp_agriculture_2020'
-    ]
-    columns = list(range(2, 22))
-    populate_attribute_name(country_dict, filename, 1, attributes, columns)
-
-
-def get_unemployment(country_dict: dict) -> None:
+    populate_file(data, 'raw_data/sector_gdp.csv', '')
+
+
+def get_unemployment(data: Dataset) -> None:
     """ Retrieve unemployment rate data from unemployment_rate.csv
     """
-    filename = 'raw_data/unemployment_rate.csv'
-    attributes = [
-        'unemployment_2016', 'unemployment_2017', 'unemployment_2018', 'unemployment_2019',
-        'unemployment_2020'
-    ]
-    columns = [-5, -4, -3, -2, -1]
-    populate_attribute_name(country_dict, filename, 4, attributes, columns)
+    stream_indicators(data, 'raw_data/unemployment_rate.csv', {'SL.UEM.TOTL.ZS': 'unemployment_'})
+
 
+@instrument.timed
+def get_covid_metrics(data: Dataset, columns: list[str]) -> dict[str, np.ndarray]:
+    """ Return a mapping of each column of covid_vaccination.csv in columns (e.g.
+    'total_cases_per_million') to the value of that column for every country, where the i-th value
+    belongs to the country stored in row i of data and is NaN if it isn't available.
 
-def get_median(data: list[float], start: int, end: int) -> float:
-    """ Return the median of the subarray data[start:end] where data is an increasing list
+    Only the columns that weren't loaded before are converted to numbers, and the file isn't read
+    at all if every column was loaded before. The positions of those columns are found once from
+    the header, and the file is read in a single pass that only keeps the fields at those
+    positions, so callers should ask for all the columns they need at once. The names used in the
+    file are added as aliases.
 
     Preconditions:
-        - all(data[i] <= data[i + 1] for i in range(len(data) - 1))
-
-    >>> get_median([1.0, 2.0, 3.0], 0, 3)
-    2.0
-    >>> get_median([1.0, 2.0, 3.0, 4.0], 0, 4)
-    2.5
-    """
-    length = end - start
-    if length % 2 == 0:
-        mid1 = start + length // 2 - 1
-        mid2 = start + length // 2
-        median = (data[mid1] + data[mid2]) / 2
-    else:
-        mid = start + length // 2
-        median = data[mid]
-    return median
-
-
-def get_quartile_split(country_dict: [str, Country], root: str, year: int) -> None:
-    """ Sets the attribute gdp_quartile_xxxx where xxxx is year. The attribute can be assigned to
-    1, 2, 3 or 4 (or remain unassigned if the country's GDP that year isn't available).
-    """
-    attr = root + str(year)
-    data = []
-    for country in country_dict:
-        val = getattr(country_dict[country], attr)
-        if isinstance(val, float):
-            data.append(val)
-    data.sort()
-    median = get_median(data, 0, len(data))
-    mid = len(data) // 2
-    # get the median from lower half. 'mid' is never included
-    lower_half_median = get_median(data, 0, mid)
-    # get the median from upper half. 'mid' is included if len(data) is even and excluded if
-    # len(data) is odd
-    upper_half_median = get_median(data, mid + len(data) % 2, len(data))
-
-    for country in country_dict:
-        val = getattr(country_dict[country], attr)
-        if not isinstance(val, float):
-            continue
-        if val <= lower_half_median:
-            setattr(country_dict[country], f'gdp_quartile_{year}', 1)
-        elif val <= median:
-            setattr(country_dict[country], f'gdp_quartile_{year}', 2)
-        elif val <= upper_half_median:
-            setattr(country_dict[country], f'gdp_quartile_{year}', 3)
+        - every column in columns is a numeric column of covid_vaccination.csv
+    """
+    missing = [column for column in dict.fromkeys(columns) if ('covid', column) not in data.derived]
+    if missing != []:
+        with open(COVID_FILE, encoding='utf-8-sig') as file:
+            reader = csv.reader(file, delimiter=',')
+            header = next(reader)
+            # the code, the name and the missing columns of a row are taken in a single call
+            pick = operator.itemgetter(header.index('iso_code'), header.index('location'),
+                                       *[header.index(column) for column in missing])
+            fields = [pick(row) for row in reader]
+        rows = data.get_rows([field[0] for field in fields])
+        found = np.flatnonzero(rows >= 0)
+        data.add_aliases([fields[k][1] for k in found], rows[found].tolist())
+        values = to_floats([list(field[2:]) for field in fields], len(missing))
+        for k in range(len(missing)):
+            metric = np.full(len(data.names), np.nan)
+            metric[rows[found]] = values[found, k]
+            metric.flags.writeable = False
+            data.remember(('covid', missing[k]), metric, [COVID_FILE])
+    return {column: data.derived[('covid', column)] for column in columns}
+
+
+@instrument.timed
+def get_country_groups(data: Dataset, column: str = 'IncomeGroup') -> tuple[list[str], np.ndarray]:
+    """ Return a tuple of the names of the groups found in the column of
+    country_income_quartile.csv ('IncomeGroup' or 'Region') and the group of every country, where
+    the i-th group is the group of the country stored in row i of data. Groups are numbered from 1
+    in the order of their names and 0 means the country's group isn't available.
+
+    Income groups are ordered from the lowest to the highest (as in INCOME_GROUPS) and regions are
+    ordered alphabetically. The file is only read the first time a column is needed.
+
+    Preconditions:
+        - column in {'IncomeGroup', 'Region'}
+    """
+    if ('groups', column) not in data.derived:
+        with open(GROUPS_FILE, encoding='utf-8-sig') as file:
+            reader = csv.reader(file, delimiter=',')
+            header = next(reader)
+            code_column, group_column = header.index('Country Code'), header.index(column)
+            pairs = [(row[code_column], row[group_column]) for row in reader if len(row) > 1]
+        rows = data.get_rows([code for code, _ in pairs])
+        if column == 'IncomeGroup':
+            labels = INCOME_GROUPS
+        else:
+            labels = sorted({group for _, group in pairs if group != ''})
+        numbers = {labels[k]: k + 1 for k in range(len(labels))}
+        groups = np.zeros(len(data.names), dtype=np.int8)
+        for k in np.flatnonzero(rows >= 0):
+            groups[rows[k]] = numbers.get(pairs[k][1], 0)
+        groups.flags.writeable = False
+        data.remember(('groups', column), (labels, groups), [GROUPS_FILE])
+    return data.derived[('groups', column)]
+
+
+@instrument.timed
+def get_bucket_matrix(values: np.ndarray, buckets: int) -> np.ndarray:
+    """ Return the quantile bucket of every value in every column of values, where 'buckets' is the
+    number of buckets (e.g. 4 for quartiles or 10 for deciles). The bucket can be assigned to
+    1, 2, ..., buckets where 1 is the bottom bucket (or 0 if the value is NaN).
+
+    Each column is sorted once and the (buckets - 1) split points of every column are interpolated
+    from it at once. Split points below the median are evenly spaced quantiles of the lower half of
+    the column and split points above it are evenly spaced quantiles of the upper half (where the
+    middle value of an odd number of values is in neither half), so the quartile splits are the
+    medians of the lower half, the whole column and the upper half. A value is in bucket q + 1
+    where q is the number of split points strictly below it.
+
+    Preconditions:
+        - values.ndim == 2
+        - 2 <= buckets <= 127
+
+    >>> get_bucket_matrix(np.array([[1.0], [2.0], [3.0], [4.0], [np.nan]]), 4).ravel().tolist()
+    [1, 2, 3, 4, 0]
+    >>> get_bucket_matrix(np.array([[5.0, 1.0], [1.0, 1.0], [3.0, 2.0]]), 2).tolist()
+    [[2, 1], [1, 1], [1, 2]]
+    """
+    # NaN is sorted after every number, so the first counts[j] values of column j are available
+    ordered = np.sort(values, axis=0)
+    counts = np.count_nonzero(~np.isnan(values), axis=0)
+    # the (0-based) position of the i-th split point in the lower half is i * h / (buckets / 2)
+    # - 0.5 where h is the size of each half, and the upper half mirrors the lower half
+    split = np.arange(1, buckets)[:, np.newaxis]
+    half = counts // 2
+    positions = np.where(2 * split < buckets, 2 * split * half / buckets - 0.5,
+                         (counts - 1) / 2)
+    positions = np.where(2 * split > buckets,
+                         counts - 1 - (2 * (buckets - split) * half / buckets - 0.5), positions)
+    positions = np.clip(positions, 0, np.maximum(counts - 1, 0))
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    lower_values = np.take_along_axis(ordered, lower, axis=0)
+    upper_values = np.take_along_axis(ordered, upper, axis=0)
+    splits = lower_values + (upper_values - lower_values) * (positions - lower)
+
+    result = np.zeros(values.shape, dtype=np.int8, order='F')
+    for j in np.flatnonzero(counts):
+        available = ~np.isnan(values[:, j])
+        result[available, j] = np.searchsorted(splits[:, j], values[available, j],
+                                               side='left') + 1
+    return result
+
+
+@instrument.timed
+def impute_matrix(values: np.ndarray, method: str,
+                  limit: int = IMPUTATION_LIMIT) -> tuple[np.ndarray, np.ndarray]:
+    """ Return a copy of values where the missing values of every row (a country's series over the
+    years) are filled by the method, and the mask of the values that were filled. Every row is
+    filled at once from the nearest values available before and after each missing value:
+        - 'linear': a gap between two values is filled with the straight line between them
+        - 'ffill': a missing value is filled with the last value before it
+        - 'growth': a gap between two values is filled with the constant growth rate between them,
+        and the years after the last value are extrapolated with the growth rate between the last
+        two values. Only positive values are filled this way.
+
+    Gaps of more than 'limit' missing years between two values are left missing, at most 'limit'
+    years are filled after the last value of a row ('ffill' and 'growth' only), and the years
+    before the first value of a row are never filled.
+
+    Preconditions:
+        - values.ndim == 2
+        - method in IMPUTATION_METHODS
+        - limit >= 1
+
+    >>> values = np.array([[1.0, np.nan, 4.0, np.nan], [np.nan, 2.0, 4.0, np.nan]])
+    >>> impute_matrix(values, 'linear')[0].tolist()
+    [[1.0, 2.5, 4.0, nan], [nan, 2.0, 4.0, nan]]
+    >>> impute_matrix(values, 'ffill')[0].tolist()
+    [[1.0, 1.0, 4.0, 4.0], [nan, 2.0, 4.0, 4.0]]
+    >>> filled, mask = impute_matrix(values, 'growth')
+    >>> filled.tolist()
+    [[1.0, 2.0, 4.0, 8.0], [nan, 2.0, 4.0, 8.0]]
+    >>> mask.tolist()
+    [[False, True, False, True], [False, False, False, True]]
+    """
+    observed = ~np.isnan(values)
+    width = values.shape[1]
+    positions = np.arange(width)
+    rows = np.arange(values.shape[0])[:, np.newaxis]
+    # the column of the last value available at or before every cell, and of the next one at or
+    # after it (-1 and width if there is none)
+    last = np.maximum.accumulate(np.where(observed, positions, -1), axis=1)
+    following = np.flip(np.minimum.accumulate(np.flip(np.where(observed, positions, width),
+                                                      axis=1), axis=1), axis=1)
+    before = values[rows, np.maximum(last, 0)]
+    after = values[rows, np.minimum(following, width - 1)]
+    steps = positions - last
+    span = following - last
+    gap = ~observed & (last >= 0)
+    inside = gap & (following < width) & (span - 1 <= limit)
+    trailing = gap & (following == width) & (steps <= limit)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if method == 'linear':
+            filled = np.where(inside, before + (after - before) * steps / span, values)
+        elif method == 'ffill':
+            filled = np.where(inside | trailing, before, values)
         else:
-            setattr(country_dict[country], f'gdp_quartile_{year}', 4)
+            # the column of the value available before the last one, for the trailing growth rate
+            earlier = np.full(values.shape, -1)
+            earlier[:, 1:] = last[:, :-1]
+            earlier = np.take_along_axis(earlier, np.maximum(last, 0), axis=1)
+            rate = (before / values[rows, np.maximum(earlier, 0)]) ** (1 / (last - earlier))
+            filled = np.where(inside, before * (after / before) ** (steps / span), values)
+            filled = np.where(trailing & (earlier >= 0), before * rate ** steps, filled)
+            positive = (before > 0) & (np.where(inside, after, rate) > 0)
+            filled = np.where(positive | observed, filled, np.nan)
+    filled = np.asfortranarray(np.where(np.isfinite(filled) | observed, filled, np.nan))
+    return filled, np.asfortranarray(~observed & ~np.isnan(filled))
+
+
+def impute_roots(data: Dataset, roots: list[str]) -> None:
+    """ Fill the missing values of every metric root in roots of data with data.imputation (see
+    impute_matrix), and record the values filled in data.imputed.
+
+    Preconditions:
+        - data.imputation in IMPUTATION_METHODS
+        - all(root in data.columns for root in roots)
+    """
+    for root in roots:
+        data.columns[root], data.imputed[root] = impute_matrix(data.columns[root],
+                                                               data.imputation)
+    instrument.count('impute_roots', 'values filled',
+                     sum(int(np.count_nonzero(data.imputed[root])) for root in roots))
 
 
-def get_gdp_quartile(country_dict: dict[str, Country], start: int, end: int) -> None:
-    """ Sets the attribute gdp_quartile_xxxx where xxxx is in range [start, end + 1].
-    The attribute can be assigned to 1, 2, 3 or 4 (or remain unassigned if the country's GDP
+def get_quartile_split(data: Dataset, root: str, year: int) -> None:
+    """ Sets the GDP quartile of every country in 'year' to the quartile of its value of
+    root + year. The quartile can be assigned to 1, 2, 3 or 4 (or remain 0 if the country's value
     that year isn't available).
     """
-    for year in range(start, end + 1):
-        get_quartile_split(country_dict, 'gdp_', year)
+    j = data.years.index(year)
+    data.quartiles[:, j] = get_bucket_matrix(data.columns[root][:, j:j + 1], 4)[:, 0]
+
+
+@instrument.timed
+def get_gdp_quartile(data: Dataset, start: int, end: int) -> None:
+    """ Sets the GDP quartile of every country in the years [start, end]. The quartile can be
+    assigned to 1, 2, 3 or 4 (or remain 0 if the country's GDP that year isn't available).
+    """
+    first, last = data.years.index(start), data.years.index(end)
+    data.quartiles[:, first:last + 1] = get_bucket_matrix(data.columns['gdp_'][:, first:last + 1],
+                                                          4)
+
+
+def get_load_tasks(data: Dataset, files: dict[str, Optional[dict[str, str]]],
+                   workers: int) -> list[tuple]:
+    """ Return the tasks that load_part has to run to read files into data using workers worker
+    processes. 'files' maps each csv file to the indicators stored from it, like
+    METRIC_INDICATORS. A file of indicators is split into up to workers consecutive spans of at
+    least PART_SIZE bytes, and every other file is read by a single task.
+
+    Preconditions:
+        - workers >= 1
+    """
+    tasks = []
+    for filename, indicators in files.items():
+        if indicators is None:
+            tasks.append((data.names, data.iso_codes, data.years, filename, None, None))
+        else:
+            start, end = get_body_offset(filename), os.path.getsize(filename)
+            parts = max(1, min(workers, (end - start) // PART_SIZE))
+            bounds = [start + (end - start) * k // parts for k in range(parts + 1)]
+            tasks.extend((data.names, data.iso_codes, data.years, filename, indicators,
+                          (bounds[k], bounds[k + 1])) for k in range(parts))
+    return tasks
+
+
+def load_part(task: tuple) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """ Read the part of a csv file described by a task of get_load_tasks and return the values
+    found as a mapping of a metric root to a tuple of the rows that have a value and the values of
+    those rows. This is run by worker processes, so that only these buffers are sent back.
+    """
+    names, codes, years, filename, indicators, span = task
+    data = Dataset(names, codes, years)
+    if indicators is None:
+        populate_file(data, filename, '')
+    else:
+        stream_indicators(data, filename, indicators, span=span)
+    part = {}
+    for root, values in data.columns.items():
+        rows = np.flatnonzero(~np.isnan(values).all(axis=1))
+        if len(rows) > 0:
+            part[root] = (rows, values[rows])
+    return part
+
+
+def merge_part(data: Dataset, part: dict[str, tuple[np.ndarray, np.ndarray]]) -> None:
+    """ Store the values of a part returned by load_part in data, keeping the values already in
+    data where the part has no value.
+    """
+    for root, (rows, values) in part.items():
+        if root not in data.columns:
+            data.columns[root] = np.full((len(data.names), len(data.years)), np.nan, order='F')
+        merged = data.columns[root][rows]
+        np.copyto(merged, values, where=~np.isnan(values))
+        data.columns[root][rows] = merged
+
+
+def get_workers(filenames: list[str], workers: Optional[int]) -> int:
+    """ Return the number of worker processes used to read filenames. If workers is None, one
+    worker per core is used when the files add up to more than PARALLEL_THRESHOLD bytes and the
+    files are read by the current process otherwise.
+    """
+    if workers is not None:
+        return max(1, workers)
+    elif sum(os.path.getsize(filename) for filename in filenames) > PARALLEL_THRESHOLD:
+        return os.cpu_count() or 1
+    else:
+        return 1
+
+
+@instrument.timed
+def load_files(data: Dataset, files: dict[str, Optional[dict[str, str]]], workers: int) -> None:
+    """ Read files into data using workers worker processes, where files maps each csv file to
+    the indicators stored from it, like METRIC_INDICATORS. The parts are merged in the order of
+    files, so the result doesn't depend on which worker finishes first.
+
+    Preconditions:
+        - workers >= 2
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    tasks = get_load_tasks(data, files, workers)
+    with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+        for part in pool.map(load_part, tasks):
+            merge_part(data, part)
+
+
+def read_files(data: Dataset, filenames: list[str], workers: Optional[int] = None) -> None:
+    """ Read the csv files in filenames, which are files in METRIC_FILES, into data.
+
+    If workers is greater than 1, the files (and parts of large files) are parsed in parallel by
+    that many worker processes. If workers is None, this is decided by get_workers.
+    """
+    if filenames == []:
+        return
+    workers = get_workers(filenames, workers)
+    if workers > 1:
+        load_files(data, {filename: METRIC_INDICATORS[filename] for filename in filenames},
+                   workers)
+    else:
+        for filename in filenames:
+            if METRIC_INDICATORS[filename] is None:
+                populate_file(data, filename, '')
+            else:
+                stream_indicators(data, filename, METRIC_INDICATORS[filename])
+
+
+@instrument.timed
+def read_dataset(workers: Optional[int] = None) -> Dataset:
+    """ Return a new Dataset read from the csv files in METRIC_FILES, parsed by workers worker
+    processes (see read_files).
+    """
+    stamp = get_source_stamp()
+    # populate the Dataset with country names and country codes
+    data = Dataset(*populate_dictionary(), get_years(), stamp)
+    # get required attributes from csv files
+    read_files(data, METRIC_FILES, workers)
+    get_gdp_quartile(data, data.years[0], data.years[-1])
+    return data
+
+
+@instrument.timed
+def read_wdi_dataset(filename: str, indicators: Optional[dict[str, str]] = None,
+                     chunk_size: int = CHUNK_SIZE, workers: Optional[int] = None) -> Dataset:
+    """ Return a new Dataset of the countries in national_gdp.csv read from a World Development
+    Indicators bulk csv file (e.g. WDIData.csv), keeping the indicators whose codes are keys of
+    indicators (INDICATOR_ROOTS by default) for every year in the file. The file is streamed with
+    stream_indicators, split across worker processes as in read_dataset.
+    """
+    indicators = indicators or INDICATOR_ROOTS
+    years = [int(attr) for attr in get_header_attributes(find_header(filename)[1], '')[0]]
+    data = Dataset(*populate_dictionary(), list(range(min(years), max(years) + 1)))
+    workers = get_workers([filename], workers)
+    if workers > 1:
+        load_files(data, {filename: indicators}, workers)
+    else:
+        stream_indicators(data, filename, indicators, chunk_size)
+    get_gdp_quartile(data, data.years[0], data.years[-1])
+    return data
 
 
 def clean_data() -> dict[str, Country]:
     """ Main method that contains helper function calls to clean data
     """
-    # populate the dictionary with country names and Country instances
-    country_dict = populate_dictionary()[0]
-    # get required attributes from csv files
-    get_national_gdp(country_dict)
-    get_sector_gdp(country_dict)
-    get_unemployment(country_dict)
-    get_gdp_quartile(country_dict, 2016, 2020)
     # return cleaned data
-    return country_dict
+    return read_dataset().countries
+
+
+def get_source_stamp() -> tuple[int, ...]:
+    """ Return the modification time (in nanoseconds) of each file in SOURCE_FILES.
+    """
+    return tuple(os.stat(filename).st_mtime_ns for filename in SOURCE_FILES)
+
+
+def get_root_files(roots: Iterable[str]) -> frozenset[str]:
+    """ Return the source files the metric roots in roots are read from, for Dataset.remember. A
+    root that isn't read from METRIC_FILES (e.g. a root of read_wdi_dataset) is returned as is, so
+    the results computed from it are never kept by cache.keep_derived.
+
+    >>> sorted(get_root_files(['gdp_', 'gdp_service_', 'gdp_']))
+    ['raw_data/national_gdp.csv', 'raw_data/sector_gdp.csv']
+    """
+    return frozenset(ROOT_FILES.get(root, root) for root in roots)
+
+
+def load_dataset(use_cache: bool = True, workers: Optional[int] = None,
+                 imputation: Optional[str] = None) -> Dataset:
+    """ Return the shared Dataset. The csv files are only parsed again if one of them was modified
+    since the last time the Dataset was loaded, and then only the files that changed are parsed
+    again and only the derived results of those files are computed again (see
+    cache.get_shared_dataset).
+
+    If use_cache is True, the Dataset is read from the binary cache in cache.CACHE_DIR when the
+    source files haven't changed since the cache was written, and the cache is updated whenever
+    csv files have to be parsed, using workers worker processes (see read_files).
+
+    If imputation is not None, the returned Dataset has its missing values filled with the method
+    imputation (see impute_matrix). It is shared separately from the Dataset that isn't imputed,
+    so load_dataset() is never imputed.
+
+    The returned Dataset is shared between callers and must not be mutated.
+
+    Preconditions:
+        - imputation is None or imputation in IMPUTATION_METHODS
+    """
+    # cache.py imports this module, so it is only imported once a Dataset is loaded
+    import cache
+    return cache.get_shared_dataset(use_cache, workers, imputation)
 
 
 if __name__ == '__main__':
@@ -333,9 +985,11 @@ if __name__ == '__main__':
     doctest.testmod()
 
     python_ta.check_all(config={
-        'allowed-io': ['populate_dictionary', 'populate_attribute_name'],
-        'extra-imports': ['python_ta.contracts', 'csv', 'typing', 'doctest'],
+        'allowed-io': ['find_header', 'populate_dictionary', 'populate_attribute_name',
+                       'get_body_offset', 'read_lines', 'get_covid_metrics', 'get_country_groups'],
+        'extra-imports': ['python_ta.contracts', 'concurrent.futures', 'csv', 'math', 'operator',
+                          'os', 're', 'typing', 'numpy', 'instrument', 'cache', 'doctest'],
         'max-line-length': 100,
         'max-nested-blocks': 4,
-        'disable': ['R1705', 'C0200', 'R0902']
+        'disable': ['R1705', 'C0200', 'R0902', 'C0415']
     })
@@ -0,0 +1,199 @@
+""" CSC110 Fall 2021 Final Project: composition
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Compute the sector composition of every country's economy in every year: the share of its
+    value added produced by each sector of sector_gdp.csv
+    2. Measure how much that composition shifted between two years (e.g. from 2019 to 2020) with
+    the L1 distance between the compositions and the Lilien index of sectoral growth
+    3. Aggregate the compositions and shifts over any grouping of countries (e.g. GDP quartiles or
+    World Bank income groups)
+
+Manufacturing is part of industry in sector_gdp.csv, so the composition splits industry into
+manufacturing and the rest of industry, and the shares of SECTORS add up to 100%. Sector values
+are in each country's own currency, so they are only compared within a country; groups are
+aggregated from the shares of their countries rather than from sums of sector values.
+
+Every result is one array covering every country and every year at once.
+"""
+
+from typing import Optional
+import numpy as np
+import clean_data
+import computations
+import instrument
+
+# the sectors of a composition, in the order of the first axis of get_sector_shares
+SECTORS = ['Agriculture', 'Manufacturing', 'Other Industry', 'Service']
+
+# the metrics of a shift in composition computed by get_shift_matrix
+SHIFT_METRICS = ['l1', 'lilien']
+
+# the metric roots the sector values are computed from
+SECTOR_ROOTS = list(clean_data.SECTOR_ROOTS.values())
+
+
+def get_sector_values(data: clean_data.Dataset) -> np.ndarray:
+    """ Return the value added of every sector in SECTORS by every country in every year, where the
+    value at [s, i, j] is the value of SECTORS[s] of the i-th country in data.years[j]. The rest of
+    industry is industry minus manufacturing.
+    """
+    columns = data.columns
+    return np.stack([columns['gdp_agriculture_'], columns['gdp_manufacturing_'],
+                     columns['gdp_industry_'] - columns['gdp_manufacturing_'],
+                     columns['gdp_service_']])
+
+
+@instrument.timed
+def get_sector_shares(data: Optional[clean_data.Dataset] = None) -> np.ndarray:
+    """ Return the percentage of every country's value added produced by each sector in SECTORS in
+    every year, where the value at [s, i, j] is the share of SECTORS[s] of the i-th country in
+    data.years[j]. A country's shares are NaN in a year where any sector is missing or negative.
+
+    >>> shares = get_sector_shares(clean_data.load_dataset())
+    >>> shares.shape[0] == len(SECTORS)
+    True
+    >>> total = np.nansum(shares, axis=0)
+    >>> bool(np.all(np.isclose(total[~np.isnan(shares[0])], 100.0)))
+    True
+    """
+    data = data or clean_data.load_dataset()
+
+    def compute() -> np.ndarray:
+        # the shares are computed in place, since they take as much memory as the sector values
+        shares = get_sector_values(data)
+        total = shares.sum(axis=0)
+        valid = (shares >= 0).all(axis=0) & (total > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares /= total / 100
+        shares[:, ~valid] = np.nan
+        return shares
+
+    return computations.memoize(data, ('sector_shares',), SECTOR_ROOTS, compute)
+
+
+@instrument.timed
+def get_shift_matrix(metric: str, periods: int = 1,
+                     data: Optional[clean_data.Dataset] = None) -> np.ndarray:
+    """ Return the shift in the sector composition of every country over every 'periods' years,
+    measured by the metric in SHIFT_METRICS. The value in row i and column j is the shift of the
+    i-th country from data.years[j - periods] to data.years[j], or NaN if either composition is
+    missing (including the first 'periods' columns).
+
+    The metrics are:
+        - 'l1': the sum over every sector of the absolute change in its share, in percentage
+        points, which is 0 when the composition didn't change and at most 200
+        - 'lilien': the Lilien index, the standard deviation of the growth rates of the sectors
+        around the growth rate of the whole economy, weighted by the sector shares in the later
+        year, in percent. It is NaN when a sector's value is 0 in either year.
+
+    Preconditions:
+        - metric in SHIFT_METRICS
+        - periods >= 1
+
+    >>> l1 = get_shift_matrix('l1', 1, clean_data.load_dataset())
+    >>> bool(np.nanmin(l1) >= 0 and np.nanmax(l1) <= 200)
+    True
+    """
+    data = data or clean_data.load_dataset()
+
+    def compute() -> np.ndarray:
+        shifts = np.full((len(data.names), len(data.years)), np.nan, order='F')
+        shares = get_sector_shares(data)
+        if metric == 'l1':
+            shifts[:, periods:] = np.abs(shares[..., periods:] - shares[..., :-periods]).sum(axis=0)
+        else:
+            values = get_sector_values(data)
+            # the log growth of the whole economy, which is NaN where a composition is missing
+            with np.errstate(divide='ignore', invalid='ignore'):
+                total = np.log(np.where(np.isnan(shares[0]), np.nan, values.sum(axis=0)))
+                growth = total[:, periods:] - total[:, :-periods]
+                # the sectors are added one at a time, so only one sector's values are copied
+                variance = np.zeros(growth.shape)
+                for sector in range(len(SECTORS)):
+                    logs = np.log(values[sector])
+                    deviations = logs[:, periods:] - logs[:, :-periods] - growth
+                    variance += shares[sector, :, periods:] / 100 * deviations ** 2
+                lilien = np.sqrt(variance) * 100
+            shifts[:, periods:] = np.where(np.isfinite(lilien), lilien, np.nan)
+        return shifts
+
+    return computations.memoize(data, ('sector_shift', metric, periods), SECTOR_ROOTS, compute)
+
+
+@instrument.timed
+def get_group_compositions(groups: np.ndarray, weighted: bool = False,
+                           data: Optional[clean_data.Dataset] = None) -> np.ndarray:
+    """ Return the sector composition of every group of countries in every year, where the value at
+    [s, g - 1, j] is the share (in percent) of SECTORS[s] in group g in data.years[j]. groups is
+    numbered like in computations.get_group_aggregates.
+
+    The composition of a group is the mean of the compositions of its countries that have one, or
+    their mean weighted by each country's GDP if weighted is True, so the shares of every group
+    still add up to 100%.
+
+    Preconditions:
+        - groups.shape in {(len(data.names), len(data.years)), (len(data.names),)}
+
+    >>> data = clean_data.load_dataset()
+    >>> compositions = get_group_compositions(data.quartiles, True, data)
+    >>> compositions.shape == (len(SECTORS), 4, len(data.years))
+    True
+    >>> total = compositions[:, :, -1].sum(axis=0)
+    >>> bool(np.allclose(total, 100.0))
+    True
+    """
+    data = data or clean_data.load_dataset()
+    shares = get_sector_shares(data)
+    if weighted:
+        weights = np.where(np.isnan(shares[0]), np.nan, data.columns['gdp_'])
+    else:
+        weights = np.where(np.isnan(shares[0]), np.nan, 1.0)
+    totals = computations.get_matrix_aggregates(weights, groups)['sum']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([computations.get_matrix_aggregates(weights * share, groups)['sum']
+                         / totals for share in shares])
+
+
+@instrument.timed
+def get_group_shifts(metric: str, groups: np.ndarray, periods: int = 1,
+                     statistics: tuple[str, ...] = ('mean', 'median'),
+                     data: Optional[clean_data.Dataset] = None) -> dict[str, np.ndarray]:
+    """ Return a mapping of each statistic in statistics ('sum', 'mean', 'median' or 'count') to
+    its value over the shifts (see get_shift_matrix) of the countries of every group in every year,
+    where the value in row g - 1 and column j is the statistic of group g over the shifts from
+    data.years[j - periods] to data.years[j]. groups is numbered like in
+    computations.get_group_aggregates.
+
+    Preconditions:
+        - metric in SHIFT_METRICS
+        - periods >= 1
+        - groups.shape in {(len(data.names), len(data.years)), (len(data.names),)}
+
+    >>> data = clean_data.load_dataset()
+    >>> shifts = get_group_shifts('l1', data.quartiles, data=data)
+    >>> shifts['median'].shape == (4, len(data.years))
+    True
+    """
+    data = data or clean_data.load_dataset()
+    return computations.get_matrix_aggregates(get_shift_matrix(metric, periods, data), groups,
+                                              statistics)
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'extra-imports': ['typing', 'numpy', 'clean_data', 'computations', 'instrument',
+                          'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200']
+    })
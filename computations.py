@@ -3,14 +3,25 @@
 This Python module contains several function headers and descriptions. Functions located
 in this file are meant to:
     1. Compute certain metrics of interest for visualization
+
+Every computation takes an optional Dataset. When it is not given, the shared Dataset returned by
+clean_data.load_dataset() is used, so the csv files are never parsed more than once.
 """
 
-import math
-from clean_data import clean_data
+from typing import Callable, Optional
+import warnings
+import numpy as np
+import instrument
+from clean_data import Dataset, get_bucket_matrix, get_covid_metrics, get_root_files, load_dataset
+
+# the default threshold of each outlier method of get_outlier_mask: the number of interquartile
+# ranges beyond the quartiles, the number of standard deviations from the mean and the percentage
+# of values clipped from each end
+OUTLIER_THRESHOLDS = {'iqr': 3.0, 'zscore': 3.0, 'percentile': 1.0}
 
 
-def get_percent_change(root: str, new_attr_suffix: str, old_attr_suffix: str, country: str) -> \
-        float:
+def get_percent_change(root: str, new_attr_suffix: str, old_attr_suffix: str, country: str,
+                       data: Optional[Dataset] = None) -> float:
     """ Calculates the percent change between the attributes (root + new_attr_suffix) and
     (root + old_attr_suffix).
 
@@ -18,106 +29,361 @@ def get_percent_change(root: str, new_attr_suffix: str, old_attr_suffix: str, co
         - root + new_attr_suffix is an attribute of country
         - root + old_attr_suffix is an attribute of country
     """
-    # retrieve the country instance
-    country_dict = clean_data()
-    country = country_dict[country]
-    # assign new_attr and old_attr
-    new_attr = root + new_attr_suffix
-    old_attr = root + old_attr_suffix
+    data = data or load_dataset()
+    # retrieve the country's row
+    row = data.row(country)
     # get the old and new attribute values
-    new = getattr(country, new_attr)
-    old = getattr(country, old_attr)
-    # return percentage change
-    if isinstance(old, float) and isinstance(new, float):
-        return (new - old) / old * 100
-    return float('nan')
+    new = data.column(root + new_attr_suffix)[row]
+    old = data.column(root + old_attr_suffix)[row]
+    # return percentage change (NaN if either value is missing, infinite or NaN if old is 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float((new - old) / old * 100)
 
 
-def get_percent_change_over_time(root: str, start: int, end: int, country: str) -> \
-        list[tuple[int, float]]:
+@instrument.timed
+def get_percent_change_over_time(root: str, start: int, end: int, country: str,
+                                 data: Optional[Dataset] = None) -> list[tuple[int, float]]:
     """ Calculates the percentage change of the desired attribute (root) between consecutive years
     ranging from start to end inclusive.
 
     Preconditions:
         - 0 <= start < end
     """
-    # initialize accumulator
-    percentage_changes = []
-    # iterate through all pairs of consecutive years
-    for year in range(start, end):
-        # cur is the cur year and nxt is the the next year after cur
-        cur = str(year)
-        nxt = str(year + 1)
-        # calculate and append the percent change between the attribute root + nxt and root + cur
-        percentage_changes.append((year + 1, get_percent_change(root, nxt, cur, country)))
-    # return the list of percentage change
-    return percentage_changes
+    data = data or load_dataset()
+    # read the country's year-over-year changes from the percent change matrix
+    changes = get_percent_change_matrix(root, data)[data.row(country)]
+    first = data.years.index(start)
+    return [(start + i + 1, float(changes[first + i + 1])) for i in range(end - start)]
+
+
+def memoize(data: Dataset, key: tuple, roots: list[str],
+            compute: Callable[[], np.ndarray]) -> np.ndarray:
+    """ Return the result of compute(), which is computed from the metric roots in roots of data,
+    computing it only if no result was stored under key in data.derived before. The result is
+    made read-only since it is shared, and it is kept when the Dataset is refreshed as long as
+    the files of these roots don't change (see cache.keep_derived).
+    """
+    if key not in data.derived:
+        instrument.count('memoize', 'misses')
+        result = compute()
+        result.flags.writeable = False
+        data.remember(key, result, get_root_files(roots))
+    else:
+        instrument.count('memoize', 'hits')
+    return data.derived[key]
+
+
+@instrument.timed
+def get_percent_change_matrix(root: str, data: Optional[Dataset] = None,
+                              periods: int = 1) -> np.ndarray:
+    """ Return the percentage change of the desired attribute (root) of every country over every
+    'periods' years. The value in row i and column j is the change of the i-th country from
+    data.years[j - periods] to data.years[j]. The value is NaN if either year's attribute is missing
+    (including the first 'periods' columns).
+
+    Preconditions:
+        - root in data.columns
+        - periods >= 1
+    """
+    data = data or load_dataset()
+
+    def compute() -> np.ndarray:
+        values = data.columns[root]
+        changes = np.full(values.shape, np.nan, order='F')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes[:, periods:] = (values[:, periods:] - values[:, :-periods]) \
+                / values[:, :-periods] * 100
+        return changes
+
+    return memoize(data, ('percent_change', root, periods), [root], compute)
+
+
+@instrument.timed
+def get_cagr_matrix(root: str, periods: int, data: Optional[Dataset] = None) -> np.ndarray:
+    """ Return the compound annual growth rate (as a percentage) of the desired attribute (root) of
+    every country over every 'periods' years. The value in row i and column j is the rate of the
+    i-th country from data.years[j - periods] to data.years[j], or NaN if it is undefined.
+
+    Preconditions:
+        - root in data.columns
+        - periods >= 1
+    """
+    data = data or load_dataset()
+
+    def compute() -> np.ndarray:
+        values = data.columns[root]
+        rates = np.full(values.shape, np.nan, order='F')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates[:, periods:] = ((values[:, periods:] / values[:, :-periods]) ** (1 / periods)
+                                  - 1) * 100
+        return rates
+
+    return memoize(data, ('cagr', root, periods), [root], compute)
+
+
+@instrument.timed
+def get_cumulative_change_matrix(root: str, base_year: int,
+                                 data: Optional[Dataset] = None) -> np.ndarray:
+    """ Return the cumulative percentage change of the desired attribute (root) of every country
+    since base_year. The value in row i and column j is the change of the i-th country from
+    base_year to data.years[j], or NaN if either year's attribute is missing.
+
+    Preconditions:
+        - root in data.columns
+        - base_year in data.years
+    """
+    data = data or load_dataset()
+
+    def compute() -> np.ndarray:
+        values = data.columns[root]
+        base = values[:, [data.years.index(base_year)]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.asfortranarray((values - base) / base * 100)
+
+    return memoize(data, ('cumulative_change', root, base_year), [root], compute)
+
+
+@instrument.timed
+def get_buckets(root: str, buckets: int, data: Optional[Dataset] = None) -> np.ndarray:
+    """ Return the quantile bucket of the desired attribute (root) of every country in every year,
+    where 'buckets' is the number of buckets (e.g. 4 for quartiles, 5 for quintiles, 10 for deciles
+    or 100 for percentiles). The value in row i and column j is the bucket of the i-th country in
+    data.years[j], where 1 is the bottom bucket and 0 means the attribute isn't available.
+
+    The result is read-only like every other shared result (see memoize).
+
+    Preconditions:
+        - root in data.columns
+        - 2 <= buckets <= 127
+
+    >>> get_buckets('gdp_', 4, load_dataset()).flags.writeable
+    False
+    """
+    data = data or load_dataset()
+    if root == 'gdp_' and buckets == 4:
+        # GDP quartiles are already stored in data, so a read-only view of them is returned
+        quartiles = data.quartiles.view()
+        quartiles.flags.writeable = False
+        return quartiles
+    return memoize(data, ('buckets', root, buckets), [root],
+                   lambda: get_bucket_matrix(data.columns[root], buckets))
+
+
+@instrument.timed
+def get_group_aggregates(roots: list[str], groups: np.ndarray,
+                         statistics: tuple[str, ...] = ('sum',),
+                         data: Optional[Dataset] = None) -> dict[tuple[str, str], np.ndarray]:
+    """ Return a mapping of (root, statistic) to the statistic of the desired attribute (root) of
+    every group of countries in every year, for every root in roots and every statistic in
+    statistics ('sum', 'mean', 'median' or 'count'). Missing values are left out.
+
+    groups is either a matrix of the group of every country in every year (e.g. the buckets
+    returned by get_buckets) or a list of the group of every country in all years (e.g. the income
+    groups returned by clean_data.get_country_groups), where groups are numbered 1, 2, ... and 0
+    means the country isn't in any group. The value in row g - 1 and
+    column j of each returned matrix is the statistic of group g in data.years[j].
+
+    The sums and counts of every group in every year are found in a single pass over each
+    attribute's values.
+
+    Preconditions:
+        - all(root in data.columns for root in roots)
+        - all(statistic in {'sum', 'mean', 'median', 'count'} for statistic in statistics)
+        - groups.shape in {(len(data.names), len(data.years)), (len(data.names),)}
+    """
+    data = data or load_dataset()
+    result = {}
+    for root in roots:
+        found = get_matrix_aggregates(data.columns[root], groups, statistics)
+        for statistic in statistics:
+            result[(root, statistic)] = found[statistic]
+    return result
 
 
-def get_aggregate(attribute: str) -> float:
-    """ Calculates the aggregate of the attribute in country_dict where the attribute is available
-    (i.e. the attribute is not an empty string).
+def get_matrix_aggregates(values: np.ndarray, groups: np.ndarray,
+                          statistics: tuple[str, ...] = ('sum',)) -> dict[str, np.ndarray]:
+    """ Return a mapping of each statistic in statistics ('sum', 'mean', 'median' or 'count') to
+    its value over the rows of values of every group in every column, where NaN values are left
+    out. groups is numbered like in get_group_aggregates, and the value in row g - 1 and column j of
+    each returned matrix is the statistic of group g in column j.
+
+    Preconditions:
+        - values.ndim == 2
+        - groups.shape in {values.shape, (values.shape[0],)}
+        - all(statistic in {'sum', 'mean', 'median', 'count'} for statistic in statistics)
+
+    >>> values = np.array([[1.0, 2.0], [3.0, np.nan], [5.0, 6.0]])
+    >>> get_matrix_aggregates(values, np.array([1, 1, 2]), ('mean', 'count'))['mean'].tolist()
+    [[2.0, 2.0], [5.0, 6.0]]
+    """
+    shape = values.shape
+    groups = np.broadcast_to(groups.reshape(shape[0], -1), shape).astype(np.intp)
+    count_groups = int(groups.max(initial=0))
+    # the flat position of each value's (group, column) pair in a (group x column) matrix
+    cells = (groups - 1) * shape[1] + np.arange(shape[1])
+    available = ~np.isnan(values) & (groups > 0)
+    sums = np.bincount(cells[available], weights=values[available],
+                       minlength=count_groups * shape[1]).reshape(count_groups, shape[1])
+    counts = np.bincount(cells[available],
+                         minlength=count_groups * shape[1]).reshape(count_groups, shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        found = {'sum': sums, 'count': counts, 'mean': np.where(counts > 0, sums / counts,
+                                                                np.nan)}
+    if 'median' in statistics:
+        found['median'] = get_group_medians(values, groups, counts)
+    return {statistic: found[statistic] for statistic in statistics}
+
+
+def get_group_medians(values: np.ndarray, groups: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """ Return the median of the values of every group in every column, where counts[g - 1, j] is
+    the number of values of group g available in column j. The median is NaN if no value is
+    available.
+
+    Every column is sorted once by group and then by value, so the values of each group are
+    consecutive and the offset of group g in a column is the number of values of the groups before
+    it.
+
+    Preconditions:
+        - values.shape == groups.shape
+        - counts.shape == (groups.max(), values.shape[1])
+
+    >>> values = np.array([[4.0, 1.0], [1.0, np.nan], [2.0, 3.0], [8.0, 2.0]])
+    >>> groups = np.array([[1, 1], [1, 1], [2, 2], [1, 2]])
+    >>> get_group_medians(values, groups, np.array([[3, 1], [1, 2]])).tolist()
+    [[4.0, 1.0], [2.0, 2.5]]
+    """
+    # missing values and values of no group are sorted after every group
+    keys = np.where(np.isnan(values) | (groups <= 0), counts.shape[0] + 1, groups)
+    # the columns of the Fortran-order matrices are the rows of their transposes, which are
+    # sorted without copying them
+    order = np.lexsort((values.T, keys.T), axis=1).T
+    starts = np.cumsum(counts, axis=0) - counts
+    last = max(values.shape[0] - 1, 0)
+    lower = np.minimum(starts + np.maximum(counts - 1, 0) // 2, last)
+    upper = np.minimum(starts + counts // 2, last)
+    # only the values at the middle of every group are taken from the sorted order
+    medians = (np.take_along_axis(values, np.take_along_axis(order, lower, axis=0), axis=0)
+               + np.take_along_axis(values, np.take_along_axis(order, upper, axis=0), axis=0)) / 2
+    return np.where(counts > 0, medians, np.nan)
+
+
+@instrument.timed
+def get_totals(root: str, data: Optional[Dataset] = None) -> np.ndarray:
+    """ Return the aggregate of the desired attribute (root) over every country in every year, where
+    the j-th value is the aggregate in data.years[j]. Countries where the attribute isn't available
+    are left out.
+
+    Preconditions:
+        - root in data.columns
+    """
+    data = data or load_dataset()
+    return memoize(data, ('totals', root), [root],
+                   lambda: np.nansum(data.columns[root], axis=0))
+
+
+@instrument.timed
+def get_share_matrix(root: str, data: Optional[Dataset] = None) -> np.ndarray:
+    """ Return the percentage every country's attribute (root) takes up of the aggregate in every
+    year. The value in row i and column j is the percentage of the i-th country in data.years[j],
+    or NaN if the country does not have the attribute.
+
+    Preconditions:
+        - root in data.columns
+    """
+    data = data or load_dataset()
+
+    def compute() -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.asfortranarray(data.columns[root] / get_totals(root, data) * 100)
+
+    return memoize(data, ('shares', root), [root], compute)
+
+
+def get_outlier_mask(values: np.ndarray, method: str = 'zscore',
+                     threshold: Optional[float] = None) -> np.ndarray:
+    """ Return a boolean matrix of the outliers among values, compared to the other values of the
+    same column (i.e. of the same year). values isn't changed.
+
+    The method is one of the keys of OUTLIER_THRESHOLDS:
+        - 'iqr': a value is an outlier if it is more than threshold interquartile ranges below the
+        first quartile or above the third quartile of its column
+        - 'zscore': a value is an outlier if it is more than threshold standard deviations from
+        the mean of its column
+        - 'percentile': a value is an outlier if it is in the bottom or top threshold percent of
+        its column
+    If threshold is None, the method's threshold in OUTLIER_THRESHOLDS is used. Infinite values
+    (e.g. the percent change from 0) are always outliers and NaN values never are.
+
+    Preconditions:
+        - method in OUTLIER_THRESHOLDS
+        - values.ndim in {1, 2}
+
+    >>> values = np.array([[1.0, 2.0], [2.0, 2.0], [3.0, np.nan], [100.0, np.inf]])
+    >>> get_outlier_mask(values, 'iqr', 1.5).tolist()
+    [[False, False], [False, False], [False, False], [True, True]]
+    >>> get_outlier_mask(values, 'zscore', 1.5)[:, 0].tolist()
+    [False, False, False, True]
+    """
+    if threshold is None:
+        threshold = OUTLIER_THRESHOLDS[method]
+    finite = np.where(np.isfinite(values), values, np.nan)
+    # columns without a finite value have NaN statistics, so none of their values are outliers
+    with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if method == 'iqr':
+            first, third = np.nanpercentile(finite, [25, 75], axis=0)
+            low, high = first - threshold * (third - first), third + threshold * (third - first)
+        elif method == 'zscore':
+            mean, deviation = np.nanmean(finite, axis=0), np.nanstd(finite, axis=0)
+            low, high = mean - threshold * deviation, mean + threshold * deviation
+        else:
+            low, high = np.nanpercentile(finite, [threshold, 100 - threshold], axis=0)
+        return np.isinf(values) | (finite < low) | (finite > high)
+
+
+def get_aggregate(attribute: str, data: Optional[Dataset] = None) -> float:
+    """ Calculates the aggregate of the attribute over every country where the attribute is
+    available (i.e. the attribute is not NaN).
 
     Preconditions:
         - 'attribute' is an attribute of a Country instance
     """
-    country_dict = clean_data()
-    # initialize accumulator
-    accum = 0
-    # iterate through every country in country_dict
-    for country in country_dict:
-        # retrieve attribute from the country's Country instance
-        to_add = getattr(country_dict[country], attribute)
-        # if the attribute is available, add it to the accumulator
-        if isinstance(to_add, float):
-            accum += to_add
-    # return the accumulator
-    return accum
-
-
-def get_percent_of_aggregate(aggregate: float, attr: str, country: str) -> float:
+    data = data or load_dataset()
+    return float(get_totals(attribute[:-4], data)[data.years.index(int(attribute[-4:]))])
+
+
+def get_percent_of_aggregate(aggregate: float, attr: str, country: str,
+                             data: Optional[Dataset] = None) -> float:
     """ Returns the percentage the attribute takes up of the aggregate for a given country.
     If the country does not have the attribute, return float('nan') (Not a number).
 
     Preconditions:
         - 'attr' is an attribute of a Country instance
-        - country in clean_data()
+        - country is the ISO3 code, name or an alias of a country in load_dataset()
     """
-    country_dict = clean_data()
-    # get the attribute from country's Country instance
-    portion = getattr(country_dict[country], attr)
-    # if the attribute is available, return the percent it takes up from aggregate
-    if portion != '':
-        return portion / aggregate * 100
-    # if the attribute isn't available, return it as float('nan') (not a number)
-    return float('nan')
+    data = data or load_dataset()
+    # get the attribute from the country's row (NaN if it isn't available)
+    portion = data.column(attr)[data.row(country)]
+    return float(portion / aggregate * 100)
 
 
-def get_percent_of_whole(attr: str) -> dict[str, float]:
+def get_percent_of_whole(attr: str, data: Optional[Dataset] = None) -> dict[str, float]:
     """ Returns a mapping of the percentage the attribute takes up of the aggregate for all
-    countries. If the country does not have the attribute, return float('nan') (Not a number).
+    countries. Countries that do not have the attribute are left out.
     The return type is a dict where a country's name maps to its percentage of whole.
 
     Preconditions:
         - 'attr' is an attribute of a Country instance
     """
-    country_dict = clean_data()
-    # initialize the accumulator
-    country_to_percent_of_aggregate = {}
-    # calculate the aggregate for the given attribute
-    aggregate = get_aggregate(attr)
-    # iterate through all country in country_dict
-    for country in country_dict:
-        # calculate the percent the country's attribute takes up from aggregate
-        percent_of_aggregate = get_percent_of_aggregate(aggregate, attr, country)
-        # if percent_of_aggregate is a number (i.e. not NaN), add it to the accumulator
-        if not math.isnan(percent_of_aggregate):
-            country_to_percent_of_aggregate[country] = percent_of_aggregate
-    # return the accumulator
-    return country_to_percent_of_aggregate
+    data = data or load_dataset()
+    percents = get_share_matrix(attr[:-4], data)[:, data.years.index(int(attr[-4:]))]
+    # keep the countries whose percent is a number (i.e. not NaN)
+    available = np.flatnonzero(~np.isnan(percents))
+    return {data.names[i]: float(percents[i]) for i in available}
 
 
-def get_attribute_by_gdp_quartile(root: str, year: int) -> list[list[tuple[int, int]]]:
+def get_attribute_by_gdp_quartile(root: str, year: int, data: Optional[Dataset] = None) -> \
+        list[list[tuple[float, float]]]:
     """
     Returns a list of 4 lists. Each of the 4 lists contain lists with 2 elements, in the form
     (gdp, attribute) where the attribute is root + year.
@@ -125,48 +391,53 @@ def get_attribute_by_gdp_quartile(root: str, year: int) -> list[list[tuple[int,
     Preconditions:
         - year >= 0
     """
-    country_dict = clean_data()
-    cur = [[], [], [], []]
-    attr = root + str(year)
-    gdp_quartile = 'gdp_quartile_' + str(year)
-    for country in country_dict:
-        gdp = getattr(country_dict[country], f'gdp_{year}')
-        attr_val = getattr(country_dict[country], attr)
-        if not isinstance(attr_val, float) or not isinstance(gdp, float):
-            continue
-        quartile = getattr(country_dict[country], gdp_quartile)
-        if quartile == 1:
-            cur[0].append((gdp, attr_val))
-        elif quartile == 2:
-            cur[1].append((gdp, attr_val))
-        elif quartile == 3:
-            cur[2].append((gdp, attr_val))
-        elif quartile == 4:
-            cur[3].append((gdp, attr_val))
+    data = data or load_dataset()
+    gdp = data.column(f'gdp_{year}')
+    attr_val = data.column(root + str(year))
+    quartiles = data.column(f'gdp_quartile_{year}')
+    available = ~np.isnan(gdp) & ~np.isnan(attr_val)
+    cur = []
+    for quartile in range(1, 5):
+        in_quartile = available & (quartiles == quartile)
+        cur.append(list(zip(gdp[in_quartile].tolist(), attr_val[in_quartile].tolist())))
     return cur
 
 
-def get_aggregate_quartile(root: str, desired_quartile: int, year: int) -> float:
-    """ Calculates the sum of the attribute in country_dict where the country is in the desired
-    quartile and the attribute is available (i.e. the attribute is not an empty string).
+def get_aggregate_quartile(root: str, desired_quartile: int, year: int,
+                           data: Optional[Dataset] = None) -> float:
+    """ Calculates the sum of the attribute over every country where the country is in the desired
+    quartile and the attribute is available (i.e. the attribute is not NaN).
 
     Preconditions:
         - year >= 0
         - desired_quartile in {1, 2, 3, 4}
         - root + year is an attribute of a Country instance
     """
-    country_dict = clean_data()
-    # initialize accumulator
-    accum = 0
-    attr = root + str(year)
-    # iterate through every country in country_dict
-    for country in country_dict:
-        quartile = getattr(country_dict[country], f'gdp_quartile_{year}')
-        if desired_quartile == quartile:
-            to_add = getattr(country_dict[country], attr)
-            if isinstance(to_add, float):
-                accum += to_add
-    return accum
+    data = data or load_dataset()
+    in_quartile = data.column(f'gdp_quartile_{year}') == desired_quartile
+    return float(np.nansum(data.column(root + str(year))[in_quartile]))
+
+
+@instrument.timed
+def get_covid_correlation(covid_metric: str, root: str, start: int, end: int,
+                          data: Optional[Dataset] = None) -> tuple[float, int]:
+    """ Return a tuple of the Pearson correlation coefficient between a COVID-19 metric (a column
+    of covid_vaccination.csv, e.g. 'total_deaths_per_million') and the cumulative percentage change
+    of the desired attribute (root) from start to end across countries, and the number of countries
+    it is computed from. Countries missing either value are left out.
+
+    Preconditions:
+        - root in data.columns
+        - start in data.years and end in data.years
+    """
+    data = data or load_dataset()
+    covid = get_covid_metrics(data, [covid_metric])[covid_metric]
+    change = get_cumulative_change_matrix(root, start, data)[:, data.years.index(end)]
+    available = ~np.isnan(covid) & np.isfinite(change)
+    if np.count_nonzero(available) < 2:
+        return float('nan'), int(np.count_nonzero(available))
+    return float(np.corrcoef(covid[available], change[available])[0, 1]), \
+        int(np.count_nonzero(available))
 
 
 def get_xy_data(ordered_data: list[tuple[int, float]]) -> tuple[list[int], list[float]]:
@@ -199,7 +470,7 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-io': [],
-        'extra-imports': ['clean_data', 'math', 'doctest'],
+        'extra-imports': ['clean_data', 'instrument', 'typing', 'warnings', 'numpy', 'doctest'],
         'max-line-length': 100,
         'max-nested-blocks': 4,
         'disable': ['R1705', 'C0200']
@@ -0,0 +1,254 @@
+""" CSC110 Fall 2021 Final Project: correlations
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Quantify the relationship between any two metrics (e.g. GDP % change and unemployment %
+    change, or GDP and COVID-19 deaths per million) with Pearson and Spearman correlations and an
+    ordinary least squares fit with standard errors
+    2. Compute these statistics for many pairs of metrics, every year and every group of countries
+    (e.g. GDP quartiles) in one batched call
+
+A metric is named by one of:
+    - a metric root (e.g. 'gdp_'), for its values
+    - a metric root followed by 'change' (e.g. 'gdp_change'), for its percent change from the
+    year before
+    - a column of covid_vaccination.csv (e.g. 'total_deaths_per_million'), which has the same
+    value in every year
+
+Every statistic is computed over the countries that have both values (and are in the group), with
+missing values masked out rather than removed, so all pairs, years and groups share one array.
+"""
+
+from typing import Iterable, Optional
+import numpy as np
+import clean_data
+import computations
+import instrument
+
+# the statistics computed for every pair of metrics, year and group (see get_fit_statistics)
+STATISTICS = ['count', 'pearson', 'spearman', 'slope', 'intercept', 'slope_se', 'intercept_se']
+
+# the suffix of the name of a metric's percent change
+CHANGE = 'change'
+
+# the number of values of the pairs of metrics fitted at once by get_correlations, which bounds
+# its memory use
+BATCH_VALUES = 2 ** 22
+
+
+def get_fit_statistics(x: np.ndarray, y: np.ndarray, mask: np.ndarray) -> dict[str, np.ndarray]:
+    """ Return a mapping of each statistic in STATISTICS except 'spearman' to its value between
+    x and y along axis -2, counting only the values where mask is True: the number of values,
+    the Pearson correlation coefficient, and the slope and intercept of the least squares line
+    y = slope * x + intercept with their standard errors. Any other axes are batches (e.g. pairs,
+    groups and years).
+
+    A statistic is NaN when it is undefined (e.g. fewer than 2 values, or fewer than 3 values for
+    the standard errors).
+
+    Preconditions:
+        - x.shape == y.shape == mask.shape
+        - x.ndim >= 2
+        - not np.isnan(x[mask]).any() and not np.isnan(y[mask]).any()
+
+    >>> x = np.array([[1.0], [2.0], [3.0], [4.0]])
+    >>> fit = get_fit_statistics(x, 2 * x + 1, np.ones(x.shape, dtype=bool))
+    >>> [float(fit[name][0]) for name in ['count', 'pearson', 'slope', 'intercept', 'slope_se']]
+    [4.0, 1.0, 2.0, 1.0, 0.0]
+    """
+    count = np.count_nonzero(mask, axis=-2).astype(np.float64)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = x.sum(axis=-2) / count
+        mean_y = y.sum(axis=-2) / count
+        # the deviations from the means, which are 0 where the mask is False
+        dx = np.where(mask, x - mean_x[..., np.newaxis, :], 0.0)
+        dy = np.where(mask, y - mean_y[..., np.newaxis, :], 0.0)
+        sxx, syy, sxy = (dx * dx).sum(axis=-2), (dy * dy).sum(axis=-2), (dx * dy).sum(axis=-2)
+        slope = sxy / sxx
+        # the variance of the residuals, which can't be negative
+        variance = np.maximum(syy - slope * sxy, 0.0) / (count - 2)
+        fit = {'count': count,
+               'pearson': np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0),
+               'slope': slope,
+               'intercept': mean_y - slope * mean_x,
+               'slope_se': np.sqrt(variance / sxx),
+               'intercept_se': np.sqrt(variance * (1 / count + mean_x ** 2 / sxx))}
+    for name in ['pearson', 'slope', 'intercept']:
+        fit[name] = np.where(count >= 2, fit[name], np.nan)
+    for name in ['slope_se', 'intercept_se']:
+        fit[name] = np.where(count >= 3, fit[name], np.nan)
+    return fit
+
+
+def get_ranks(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """ Return the rank of every value along axis -2 among the values where mask is True, where the
+    smallest value has rank 1 and tied values share the mean of their ranks. The rank of a value
+    where mask is False is NaN.
+
+    Preconditions:
+        - values.shape == mask.shape
+        - values.ndim >= 2
+
+    >>> get_ranks(np.array([[3.0], [1.0], [3.0], [2.0], [0.0]]),
+    ...           np.array([[True], [True], [True], [True], [False]])).ravel().tolist()
+    [3.5, 1.0, 3.5, 2.0, nan]
+    """
+    # the values masked out are sorted last, so they don't change the ranks of the others
+    order = np.argsort(np.where(mask, values, np.inf), axis=-2, kind='stable')
+    ordered = np.take_along_axis(np.where(mask, values, np.inf), order, axis=-2)
+    positions = np.arange(values.shape[-2]).reshape((-1, 1))
+    # every run of tied values spans the positions from its first to its last value
+    new = np.ones(ordered.shape, dtype=bool)
+    new[..., 1:, :] = ordered[..., 1:, :] != ordered[..., :-1, :]
+    last = np.ones(ordered.shape, dtype=bool)
+    last[..., :-1, :] = new[..., 1:, :]
+    first = np.maximum.accumulate(np.where(new, positions, 0), axis=-2)
+    end = np.flip(np.minimum.accumulate(np.flip(np.where(last, positions, values.shape[-2]),
+                                                axis=-2), axis=-2), axis=-2)
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + end) / 2 + 1, axis=-2)
+    return np.where(mask, ranks, np.nan)
+
+
+def get_metric_matrix(metric: str, data: clean_data.Dataset) -> np.ndarray:
+    """ Return the value of the metric (see the description of this module) of every country in
+    every year, where the value in row i and column j is the value of the i-th country in
+    data.years[j].
+
+    Raise a KeyError if the metric isn't in the dataset.
+
+    >>> get_metric_matrix('total_deaths_per_million', clean_data.load_dataset()).shape[1] > 1
+    True
+    """
+    if metric in data.columns:
+        return data.columns[metric]
+    elif metric.endswith(CHANGE) and metric[:-len(CHANGE)] in data.columns:
+        return computations.get_percent_change_matrix(metric[:-len(CHANGE)], data)
+    try:
+        values = clean_data.get_covid_metrics(data, [metric])[metric]
+    except ValueError as error:
+        raise KeyError(metric) from error
+    return np.broadcast_to(values[:, np.newaxis], (len(data.names), len(data.years)))
+
+
+def get_batch_statistics(x: np.ndarray, y: np.ndarray,
+                         in_group: np.ndarray) -> dict[str, np.ndarray]:
+    """ Return a mapping of each statistic in STATISTICS to its value between x and y, which hold
+    a batch of pairs of metrics, in every group of countries and every year. The value at [p, g, k]
+    is the statistic of the p-th pair in the group g in the k-th year, counting only the finite
+    values of the countries in the group.
+
+    Preconditions:
+        - x.shape == y.shape == (x.shape[0], 1) + in_group.shape[1:]
+        - in_group.ndim == 3
+    """
+    mask = np.isfinite(x) & np.isfinite(y) & in_group
+    x, y = np.broadcast_to(x, mask.shape), np.broadcast_to(y, mask.shape)
+    statistics = get_fit_statistics(x, y, mask)
+    statistics['spearman'] = get_fit_statistics(get_ranks(x, mask), get_ranks(y, mask),
+                                                mask)['pearson']
+    return statistics
+
+
+def get_group_masks(groups: Optional[np.ndarray], data: clean_data.Dataset, first: int,
+                    last: int) -> np.ndarray:
+    """ Return whether every country is in every group in every year of data.years[first:last],
+    where the value at [g, i, k] is whether the i-th country is in the group g in
+    data.years[first + k] and the group 0 is every country. groups is like in get_correlations.
+
+    >>> masks = get_group_masks(np.array([1, 2, 0]), clean_data.Dataset(['A', 'B', 'C'],
+    ...                         ['AAA', 'BBB', 'CCC'], [2019, 2020]), 0, 1)
+    >>> masks[:, :, 0].tolist()
+    [[True, True, True], [True, False, False], [False, True, False]]
+    """
+    shape = (len(data.names), last - first)
+    if groups is None:
+        return np.ones((1,) + shape, dtype=bool)
+    groups = np.broadcast_to(groups.reshape(len(data.names), -1),
+                             (len(data.names), len(data.years)))[:, first:last]
+    numbers = np.arange(int(groups.max(initial=0)) + 1).reshape((-1, 1, 1))
+    return (groups == numbers) | (numbers == 0)
+
+
+def load_covid_metrics(metrics: Iterable[str], data: clean_data.Dataset) -> None:
+    """ Read the metrics in metrics that are columns of covid_vaccination.csv into data together,
+    so that the file is read at most once rather than once per metric. A metric that isn't in the
+    dataset is left for get_metric_matrix to report.
+    """
+    covid = [metric for metric in metrics if metric not in data.columns
+             and not (metric.endswith(CHANGE) and metric[:-len(CHANGE)] in data.columns)]
+    try:
+        clean_data.get_covid_metrics(data, covid)
+    except ValueError:
+        pass
+
+
+@instrument.timed
+def get_correlations(pairs: list[tuple[str, str]], start: int, end: int,
+                     data: Optional[clean_data.Dataset] = None,
+                     groups: Optional[np.ndarray] = None) -> dict[str, np.ndarray]:
+    """ Return a mapping of each statistic in STATISTICS to its value for every pair of metrics
+    (x, y) in pairs, every group of countries and every year from start to end inclusive, where
+    the least squares line fits y from x. The value at [p, g, k] is the statistic of pairs[p] in
+    the group g in the year start + k, where the group 0 is every country.
+
+    groups is either a matrix of the group of every country in every year (e.g. data.quartiles or
+    the buckets returned by computations.get_buckets) or a list of the group of every country in
+    all years (e.g. the income groups returned by clean_data.get_country_groups), where groups are
+    numbered 1, 2, ... and 0 means the country isn't in any group. If groups is None, only the
+    group of every country is computed.
+
+    Infinite values (e.g. the percent change from 0) are masked out like missing values. The
+    pairs are fitted in batches of about BATCH_VALUES values.
+
+    Preconditions:
+        - start in data.years and end in data.years
+        - start <= end
+        - groups is None or groups.shape[0] == len(data.names)
+        - groups is None or groups.shape[1:] in {(len(data.years),), ()}
+
+    >>> result = get_correlations([('gdp_', 'gdp_'), ('gdp_change', 'unemployment_change')],
+    ...                           2019, 2020, groups=clean_data.load_dataset().quartiles)
+    >>> result['pearson'].shape
+    (2, 5, 2)
+    >>> float(result['pearson'][0, 0, 1])
+    1.0
+    """
+    data = data or clean_data.load_dataset()
+    first, last = data.years.index(start), data.years.index(end) + 1
+    load_covid_metrics([metric for pair in pairs for metric in pair], data)
+    metrics = {metric: get_metric_matrix(metric, data)[:, first:last]
+               for pair in pairs for metric in pair}
+
+    # in_group[g, i, k] is whether the i-th country is in the group g in the year start + k
+    in_group = get_group_masks(groups, data, first, last)
+
+    size = max(1, BATCH_VALUES // in_group.size)
+    parts = []
+    for batch in range(0, len(pairs), size):
+        x = np.stack([metrics[metric_x] for metric_x, _ in pairs[batch:batch + size]])[:, None]
+        y = np.stack([metrics[metric_y] for _, metric_y in pairs[batch:batch + size]])[:, None]
+        parts.append(get_batch_statistics(x, y, in_group))
+    instrument.count('get_correlations', 'fits', len(pairs) * in_group.shape[0] * (last - first))
+    return {name: np.concatenate([part[name] for part in parts]) for name in STATISTICS}
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'extra-imports': ['typing', 'numpy', 'clean_data', 'computations', 'instrument',
+                          'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200']
+    })
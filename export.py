@@ -0,0 +1,458 @@
+""" CSC110 Fall 2021 Final Project: export
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Build any list of the charts in visualizations.py from one loaded dataset
+    2. Write the charts to an output directory as HTML files or static images, without a browser
+
+HTML files share a single copy of plotly.js written next to them. Static images (PNG and SVG)
+require the optional kaleido package (pip install kaleido).
+
+Exports are incremental: the hashes of the source files every chart was built from are recorded
+in the file MANIFEST of the output directory, and a chart is only exported again once one of its
+source files changes (or CHART_VERSION changes, when the way charts are drawn changes).
+"""
+
+from dataclasses import dataclass
+import importlib.util
+import json
+import os
+from typing import Any, Optional
+from urllib.parse import parse_qs
+import cache
+import clean_data
+import computations
+import instrument
+import visualizations
+
+# the function that builds each chart, by the name of the function that displays it
+CHARTS = {'map_percentage_change': visualizations.build_map_percentage_change,
+          'map_percent_difference_gdp': visualizations.build_map_percent_difference_gdp,
+          'scatter_percentage_change': visualizations.build_scatter_percentage_change,
+          'visualize_aggregates': visualizations.build_visualize_aggregates}
+
+# the parameters of each chart, in the order the chart's function takes them
+CHART_PARAMETERS = {'map_percentage_change': ['root', 'start', 'end'],
+                    'map_percent_difference_gdp': ['start', 'end'],
+                    'scatter_percentage_change': ['root', 'start', 'end'],
+                    'visualize_aggregates': ['start', 'end', 'group_by']}
+
+# the parameters of CHART_PARAMETERS that a chart can be built without
+OPTIONAL_PARAMETERS = {'group_by'}
+
+# the charts that can leave out the countries given by the 'exclude' parameter and the outliers
+# given by the 'outliers' and 'threshold' parameters
+EXCLUDABLE_CHARTS = {'map_percentage_change', 'scatter_percentage_change'}
+
+# the charts that can draw the least squares line of their points, given by the 'fit' parameter
+FIT_CHARTS = {'scatter_percentage_change'}
+
+# the values of the 'outliers' parameter
+OUTLIER_METHODS = list(computations.OUTLIER_THRESHOLDS) + ['none']
+
+# the metric roots every chart is built from, besides its 'root' parameter
+CHART_ROOTS = {'map_percentage_change': [],
+               'map_percent_difference_gdp': ['gdp_'],
+               'scatter_percentage_change': ['gdp_'],
+               'visualize_aggregates': ['gdp_', 'gdp_manufacturing_', 'gdp_service_',
+                                        'gdp_industry_', 'gdp_agriculture_']}
+
+# the file formats charts can be exported to
+FORMATS = ['html', 'png', 'svg']
+
+# the file of an output directory that records the source files of every chart exported to it,
+# and the version of the charts recorded in it, which changes whenever a chart would be drawn
+# differently from the same spec and source files
+MANIFEST = 'manifest.json'
+CHART_VERSION = '3'
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """ A chart to export: the chart named 'chart' built from the arguments in 'args'.
+
+    Instance Attributes:
+        - chart: the name of the chart, which is a key of CHARTS
+        - args: the arguments the chart is built from, in the order the chart's function takes
+        them (e.g. ('gdp_', 2016, 2020) for 'map_percentage_change')
+        - excluded: the ISO3 codes of the countries left out of the chart, or None to leave out
+        no country
+        - outliers: the method that finds the outliers left out of the chart (see
+        visualizations.get_outliers), or None for the chart's default method
+        (visualizations.OUTLIERS)
+        - threshold: the threshold of the outlier method, or None for the method's default
+        - fit: whether the least squares line of the points of the chart is drawn
+        - impute: the method the missing values of the dataset are filled with before the chart
+        is built (see clean_data.impute_matrix), or None to leave them missing
+
+    Representation Invariants:
+        - self.chart in CHARTS
+        - self.excluded is None or self.chart in EXCLUDABLE_CHARTS
+        - self.outliers is None or self.outliers in OUTLIER_METHODS
+        - (self.outliers is None and self.threshold is None) or self.chart in EXCLUDABLE_CHARTS
+        - self.threshold is None or self.outliers != 'none'
+        - not self.fit or self.chart in FIT_CHARTS
+        - self.impute is None or self.impute in clean_data.IMPUTATION_METHODS
+
+    Sample Usage
+    >>> ChartSpec('map_percentage_change', ('gdp_', 2016, 2020)).get_filename('html')
+    'map_percentage_change_gdp_2016_2020.html'
+    """
+    chart: str
+    args: tuple
+    excluded: Optional[frozenset[str]] = None
+    outliers: Optional[str] = None
+    threshold: Optional[float] = None
+    fit: bool = False
+    impute: Optional[str] = None
+
+    def get_filename(self, file_format: str) -> str:
+        """ Return the name of the file self is exported to in the format file_format.
+
+        >>> ChartSpec('visualize_aggregates', (2016, 2020, None)).get_filename('png')
+        'visualize_aggregates_2016_2020.png'
+        >>> ChartSpec('map_percentage_change', ('gdp_', 2016, 2020), frozenset({'VNM', 'QAT'})
+        ...           ).get_filename('html')
+        'map_percentage_change_gdp_2016_2020_without_QAT_VNM.html'
+        >>> ChartSpec('scatter_percentage_change', ('gdp_', 2016, 2020), None, 'iqr', 1.5
+        ...           ).get_filename('html')
+        'scatter_percentage_change_gdp_2016_2020_outliers_iqr_1.5.html'
+        >>> ChartSpec('map_percentage_change', ('gdp_', 2016, 2020), None, None, 2.0
+        ...           ).get_filename('html')
+        'map_percentage_change_gdp_2016_2020_outliers_zscore_2.html'
+        """
+        parts = [self.chart] + [str(arg).strip('_') for arg in self.args if arg is not None]
+        if self.excluded is not None:
+            parts.extend(['without'] + sorted(self.excluded))
+        if self.outliers is not None or self.threshold is not None:
+            parts.extend(['outliers', self.outliers or visualizations.OUTLIERS])
+        if self.threshold is not None:
+            parts.append(f'{self.threshold:g}')
+        if self.fit:
+            parts.append('fit')
+        if self.impute is not None:
+            parts.extend(['imputed', self.impute])
+        return '_'.join(parts) + '.' + file_format
+
+    def get_sources(self) -> list[str]:
+        """ Return the source files the chart of self is built from, in the order of
+        clean_data.SOURCE_FILES. GDP quartiles are computed from national GDP, so charts that use
+        them depend on national GDP.
+
+        >>> ChartSpec('map_percentage_change', ('unemployment_', 2016, 2020)).get_sources()
+        ['raw_data/unemployment_rate.csv']
+        >>> ChartSpec('visualize_aggregates', (2016, 2020, 'Region')).get_sources()[-1]
+        'raw_data/country_income_quartile.csv'
+        """
+        parameters = dict(zip(CHART_PARAMETERS[self.chart], self.args))
+        roots = CHART_ROOTS[self.chart] + ([parameters['root']] if 'root' in parameters else [])
+        files = clean_data.get_root_files(roots)
+        if parameters.get('group_by') is not None:
+            files |= {clean_data.GROUPS_FILE}
+        return [filename for filename in clean_data.SOURCE_FILES if filename in files]
+
+    def build(self) -> Any:
+        """ Return the figure of self, built from the shared dataset (imputed with self.impute).
+        """
+        options = {} if self.excluded is None else {'excluded': set(self.excluded)}
+        if self.outliers is not None:
+            options['outliers'] = self.outliers
+        if self.threshold is not None:
+            options['threshold'] = self.threshold
+        if self.fit:
+            options['fit'] = True
+        return CHARTS[self.chart](*self.args, data=clean_data.load_dataset(imputation=self.impute),
+                                  **options)
+
+
+def parse_threshold(text: str, method: str) -> float:
+    """ Return the threshold of the outlier method written in text. The threshold of 'percentile'
+    is a percent from 0 up to (but not including) 50, and the threshold of any other method is a
+    positive number of spreads (see computations.get_outlier_mask).
+
+    Raise a ValueError naming the constraint if text isn't a valid threshold of the method.
+
+    Preconditions:
+        - method in computations.OUTLIER_THRESHOLDS
+
+    >>> parse_threshold('2.5', 'iqr')
+    2.5
+    >>> parse_threshold('50', 'percentile')
+    Traceback (most recent call last):
+    ValueError: the percentile threshold must be at least 0 and less than 50, not 50
+    >>> parse_threshold('many', 'zscore')
+    Traceback (most recent call last):
+    ValueError: the zscore threshold must be a number, not many
+    """
+    try:
+        threshold = float(text)
+    except ValueError as error:
+        raise ValueError(f'the {method} threshold must be a number, not {text}') from error
+    if method == 'percentile' and not 0 <= threshold < 50:
+        raise ValueError('the percentile threshold must be at least 0 and less than 50, '
+                         f'not {text}')
+    elif method != 'percentile' and not 0 < threshold < float('inf'):
+        raise ValueError(f'the {method} threshold must be a positive number, not {text}')
+    return threshold
+
+
+def parse_outliers(chart: str, options: dict[str, str]) -> tuple[Optional[str], Optional[float]]:
+    """ Return the outlier method and threshold of the chart given by the 'outliers' and
+    'threshold' parameters in options (see parse_spec), where None means the default.
+
+    Raise a ValueError naming the constraint if either parameter is invalid.
+
+    >>> parse_outliers('map_percentage_change', {'outliers': 'iqr', 'threshold': '2'})
+    ('iqr', 2.0)
+    >>> parse_outliers('map_percentage_change', {'outliers': 'mad'})
+    Traceback (most recent call last):
+    ValueError: unknown outlier method mad; choose one of ['iqr', 'zscore', 'percentile', 'none']
+    """
+    if chart not in EXCLUDABLE_CHARTS and ('outliers' in options or 'threshold' in options):
+        raise ValueError(f"{chart} can't leave out outliers")
+    outliers = options.get('outliers')
+    if outliers is not None and outliers not in OUTLIER_METHODS:
+        raise ValueError(f'unknown outlier method {outliers}; choose one of {OUTLIER_METHODS}')
+    elif 'threshold' not in options:
+        return outliers, None
+    elif outliers == 'none':
+        raise ValueError("threshold can't be used with outliers=none")
+    return outliers, parse_threshold(options['threshold'], outliers or visualizations.OUTLIERS)
+
+
+def parse_spec(text: str) -> tuple[ChartSpec, Optional[str]]:
+    """ Return the spec of a chart written as <chart>[.<format>][?<parameters>] and its format
+    (None if no format is given), where <chart> is a key of CHARTS and <parameters> is a query
+    string of the chart's parameters in CHART_PARAMETERS. The 'exclude' parameter of a chart in
+    EXCLUDABLE_CHARTS is a comma separated list of the ISO3 codes of the countries left out, its
+    'outliers' parameter is one of OUTLIER_METHODS and its 'threshold' parameter is a threshold of
+    that method (see parse_threshold), or of visualizations.OUTLIERS if no method is given. The
+    'fit' parameter of a chart in FIT_CHARTS is 1 (or 'true') to draw the least squares line. The
+    'impute' parameter of any chart is one of clean_data.IMPUTATION_METHODS.
+
+    Raise a KeyError if the chart doesn't exist and a ValueError if a parameter is invalid
+    (including a start that isn't before the end).
+
+    >>> spec, file_format = parse_spec('map_percentage_change.json?root=gdp_&start=2016&end=2020')
+    >>> spec.chart, spec.args, file_format
+    ('map_percentage_change', ('gdp_', 2016, 2020), 'json')
+    >>> spec = parse_spec('scatter_percentage_change?root=gdp_&start=2016&end=2020&exclude=qat')[0]
+    >>> spec.excluded
+    frozenset({'QAT'})
+    >>> spec = parse_spec('map_percentage_change?root=gdp_&start=2016&end=2020&outliers=iqr'
+    ...                   '&threshold=2')[0]
+    >>> spec.outliers, spec.threshold
+    ('iqr', 2.0)
+    >>> parse_spec('scatter_percentage_change.html?root=gdp_&start=2016&end=2020&fit=1')[0].fit
+    True
+    >>> parse_spec('visualize_aggregates?start=2016&end=2020&impute=ffill')[0].get_filename('html')
+    'visualize_aggregates_2016_2020_imputed_ffill.html'
+    >>> parse_spec('map_percentage_change?root=gdp_&start=2016')
+    Traceback (most recent call last):
+    ValueError: map_percentage_change requires the parameter end
+    >>> parse_spec('map_percentage_change?root=gdp_&start=2019&end=2019')
+    Traceback (most recent call last):
+    ValueError: map_percentage_change's start must be before its end, not 2019 and 2019
+    >>> parse_spec('visualize_aggregates.html?start=2016&end=2020&exclude=CAN')
+    Traceback (most recent call last):
+    ValueError: visualize_aggregates can't exclude countries
+    """
+    name, query = text.partition('?')[::2]
+    chart, file_format = name.partition('.')[::2]
+    if chart not in CHART_PARAMETERS:
+        raise KeyError(chart)
+    options = {key: values[-1] for key, values in parse_qs(query).items()}
+
+    missing = [parameter for parameter in CHART_PARAMETERS[chart]
+               if parameter not in options and parameter not in OPTIONAL_PARAMETERS]
+    if missing != []:
+        raise ValueError(f'{chart} requires the parameter {missing[0]}')
+    args = [int(options[parameter]) if parameter in ('start', 'end') else options.get(parameter)
+            for parameter in CHART_PARAMETERS[chart]]
+    # every chart shows the years after start up to end
+    if int(options['start']) >= int(options['end']):
+        raise ValueError(f"{chart}'s start must be before its end, not {options['start']} and "
+                         f"{options['end']}")
+
+    if chart not in EXCLUDABLE_CHARTS and 'exclude' in options:
+        raise ValueError(f"{chart} can't exclude countries")
+    excluded = None
+    if 'exclude' in options:
+        excluded = frozenset(code.strip().upper() for code in options['exclude'].split(',')
+                             if code.strip() != '')
+    outliers, threshold = parse_outliers(chart, options)
+    fit = options.get('fit', '0').lower()
+    if fit not in ('0', '1', 'false', 'true'):
+        raise ValueError(f'fit must be 1 or 0, not {fit}')
+    elif fit in ('1', 'true') and chart not in FIT_CHARTS:
+        raise ValueError(f"{chart} can't draw a least squares line")
+    impute = options.get('impute')
+    if impute is not None and impute not in clean_data.IMPUTATION_METHODS:
+        raise ValueError(f'unknown imputation method {impute}; '
+                         f'choose one of {clean_data.IMPUTATION_METHODS}')
+    return ChartSpec(chart, tuple(args), excluded, outliers, threshold, fit in ('1', 'true'),
+                     impute), file_format or None
+
+
+def get_specs(roots: list[str], windows: list[tuple[int, int]]) -> list[ChartSpec]:
+    """ Return the specs of every chart of every root in roots over every window of years in
+    windows: a map and a scatter plot of the root's percent change, followed by the GDP share map
+    and the sector aggregates of the window.
+
+    Preconditions:
+        - all(start < end for start, end in windows)
+
+    >>> len(get_specs(['gdp_', 'unemployment_'], [(2016, 2020), (2017, 2020)]))
+    12
+    """
+    specs = []
+    for start, end in windows:
+        for root in roots:
+            specs.append(ChartSpec('map_percentage_change', (root, start, end)))
+            specs.append(ChartSpec('scatter_percentage_change', (root, start, end)))
+        specs.append(ChartSpec('map_percent_difference_gdp', (start, end)))
+        specs.append(ChartSpec('visualize_aggregates', (start, end, None)))
+    return specs
+
+
+def export_chart(spec: ChartSpec, directory: str, file_format: str) -> str:
+    """ Build the chart of spec and write it to directory in the format file_format. Return the
+    path of the file written.
+
+    An HTML file loads plotly.js from the file plotly.min.js in directory, which is written by
+    export_charts.
+
+    Preconditions:
+        - file_format in FORMATS
+        - os.path.isdir(directory)
+    """
+    fig = spec.build()
+    path = os.path.join(directory, spec.get_filename(file_format))
+    with instrument.span('write_' + file_format):
+        if file_format == 'html':
+            fig.write_html(path, include_plotlyjs='directory')
+        else:
+            fig.write_image(path, format=file_format)
+    return path
+
+
+def export_part(task: tuple[list[ChartSpec], str, str]) -> list[str]:
+    """ Export every chart of a task, which is a tuple of the specs of the charts, the directory
+    and the file format passed to export_chart. Return the paths of the files written.
+
+    This is run by worker processes, so that each worker only loads the dataset once.
+    """
+    specs, directory, file_format = task
+    return [export_chart(spec, directory, file_format) for spec in specs]
+
+
+def read_export_manifest(directory: str) -> dict[str, list[str]]:
+    """ Return the mapping of the name of every chart file exported to directory to the stamp it
+    was built with (see get_chart_stamp), or {} if nothing was exported to directory.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_chart_stamp(spec: ChartSpec, data: clean_data.Dataset) -> list[str]:
+    """ Return the stamp of the chart of spec recorded in MANIFEST: CHART_VERSION followed by the
+    hashes of the source files of the chart when data was loaded.
+    """
+    return [CHART_VERSION] + list(data.get_stamp(spec.get_sources()))
+
+
+def get_outdated_specs(specs: list[ChartSpec], directory: str, file_format: str,
+                       manifest: dict[str, list[str]]) -> list[ChartSpec]:
+    """ Return the specs in specs whose chart file in directory is missing or was built from source
+    files that changed since or by another CHART_VERSION, according to manifest (see
+    read_export_manifest).
+    """
+    data = clean_data.load_dataset()
+    outdated = []
+    for spec in specs:
+        filename = spec.get_filename(file_format)
+        if manifest.get(filename) != get_chart_stamp(spec, data) \
+                or not os.path.exists(os.path.join(directory, filename)):
+            outdated.append(spec)
+    return outdated
+
+
+def write_plotlyjs(directory: str, force: bool = False) -> None:
+    """ Write the copy of plotly.js loaded by every HTML file in directory, unless it already
+    exists and force is False.
+    """
+    path = os.path.join(directory, 'plotly.min.js')
+    if force or not os.path.exists(path):
+        import plotly.offline
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(plotly.offline.get_plotlyjs())
+
+
+def export_charts(specs: list[ChartSpec], directory: str, file_format: str = 'html',
+                  workers: Optional[int] = None, force: bool = False) -> list[str]:
+    """ Export the chart of every spec in specs to directory in the format file_format and return
+    the paths of the files, in the order of specs. Duplicate specs are only exported once, and
+    directory is created if it doesn't exist.
+
+    Unless force is True, the charts whose files in directory were built from the current source
+    files are not exported again (see get_outdated_specs).
+
+    The charts are built by workers worker processes (one per core if workers is None). The
+    datasets are loaded before the workers start, so they read them from the binary cache.
+
+    Preconditions:
+        - file_format in FORMATS
+        - workers is None or workers >= 1
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'cannot export charts to {file_format}; choose one of {FORMATS}')
+    if file_format != 'html' and importlib.util.find_spec('kaleido') is None:
+        raise ValueError(f'exporting charts to {file_format} requires the kaleido package')
+    specs = list(dict.fromkeys(specs))
+    os.makedirs(directory, exist_ok=True)
+    if file_format == 'html':
+        write_plotlyjs(directory, force)
+    data = clean_data.load_dataset()
+    for imputation in {spec.impute for spec in specs} - {None}:
+        clean_data.load_dataset(imputation=imputation)
+    manifest = read_export_manifest(directory)
+    outdated = specs if force else get_outdated_specs(specs, directory, file_format, manifest)
+    instrument.count('export_charts', 'skipped', len(specs) - len(outdated))
+
+    workers = min(workers or os.cpu_count() or 1, len(outdated))
+    if workers <= 1:
+        export_part((outdated, directory, file_format))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        # give every worker an equal share of the charts
+        parts = [(outdated[k::workers], directory, file_format) for k in range(workers)]
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(export_part, parts))
+    if outdated != []:
+        manifest.update({spec.get_filename(file_format): get_chart_stamp(spec, data)
+                         for spec in outdated})
+        cache.save_atomic(os.path.join(directory, MANIFEST), manifest)
+    return [os.path.join(directory, spec.get_filename(file_format)) for spec in specs]
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': ['export_charts', 'read_export_manifest', 'write_plotlyjs'],
+        'extra-imports': ['concurrent.futures', 'dataclasses', 'importlib.util', 'json', 'os',
+                          'typing', 'urllib.parse', 'plotly.offline', 'cache', 'clean_data',
+                          'computations', 'instrument', 'visualizations', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200', 'C0415']
+    })
@@ -0,0 +1,340 @@
+""" CSC110 Fall 2021 Final Project: inequality
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Measure the inequality between countries of any metric in every year with the Gini
+    index, the Theil T and L indices, the Palma ratio and other top/bottom share ratios
+    2. Estimate confidence intervals of these indices by bootstrapping the countries
+
+Every index is computed for every year at once from a single sort of each year's values. An index
+can be weighted by the population of every country (the OWID 'population' column of
+covid_vaccination.csv), in which case totals such as GDP are divided by the population first, so
+that the index measures the gap between the people of different countries. The population is
+only available for one year, so the same weights are used in every year.
+"""
+
+from dataclasses import dataclass
+import os
+from typing import Optional
+import warnings
+import numpy as np
+import clean_data
+import instrument
+
+# the share ratios computed, as (top, bottom) fractions of the population: the share of the total
+# held by the top fraction divided by the share held by the bottom fraction
+SHARE_RATIOS = {'palma': (0.1, 0.4), 's80_s20': (0.2, 0.2), 's90_s10': (0.1, 0.1)}
+
+# every index computed, in the order of the rows returned by get_inequality_matrix
+INDICES = ['gini', 'theil_t', 'theil_l'] + list(SHARE_RATIOS)
+
+# the metric roots that are rates rather than totals, so they are weighted by population without
+# being divided by it first
+RATE_ROOTS = {'unemployment_'}
+
+# the number of values resampled by each batch of the bootstrap, which bounds its memory use, and
+# the total number of values resampled above which the batches are run by one worker process per
+# core
+BATCH_VALUES = 2 ** 20
+PARALLEL_VALUES = 2 ** 25
+
+
+def get_inequality_indices(values: np.ndarray,
+                           weights: Optional[np.ndarray] = None) -> dict[str, np.ndarray]:
+    """ Return a mapping of each index in INDICES to its value among the countries of values in
+    every year, where values[..., i, j] is the value of the i-th country in the j-th year and
+    weights (if given) holds the weight of each value (e.g. the population of each country).
+    Any leading axes of values are batches of separate datasets (e.g. bootstrap resamples).
+
+    Values that are missing, not positive or have no weight are left out, and an index is NaN in
+    a year with fewer than 2 values left.
+
+    Preconditions:
+        - values.ndim >= 2
+        - weights is None or np.broadcast_to(weights, values.shape) is possible
+        - weights is None or not (weights < 0).any()
+
+    >>> indices = get_inequality_indices(np.array([[1.0, 1.0], [3.0, 1.0], [np.nan, 1.0]]))
+    >>> [round(float(value), 4) for value in indices['gini']]
+    [0.25, 0.0]
+    >>> [round(float(indices[name][0]), 4) for name in ['theil_t', 'theil_l', 's80_s20']]
+    [0.1308, 0.1438, 3.0]
+    >>> round(float(get_inequality_indices(np.arange(1.0, 11.0)[:, np.newaxis])['palma'][0]), 6)
+    1.0
+    """
+    weights = np.broadcast_to(1.0 if weights is None else weights, values.shape)
+    with np.errstate(invalid='ignore'):
+        kept = (values > 0) & (weights > 0)
+    # sort every year's values, with the values left out sorted last and given no weight
+    order = np.argsort(np.where(kept, values, np.inf), axis=-2)
+    x = np.take_along_axis(np.where(kept, values, 0.0), order, axis=-2)
+    w = np.take_along_axis(np.where(kept, weights, 0.0), order, axis=-2)
+    count = np.count_nonzero(kept, axis=-2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_weight = w.sum(axis=-2, keepdims=True)
+        wx = w * x
+        total = wx.sum(axis=-2, keepdims=True)
+        # the points of the Lorenz curve: the share of the population and of the total held by
+        # the countries up to and including each country
+        population = np.cumsum(w, axis=-2) / total_weight
+        income = np.cumsum(wx, axis=-2) / total
+        ratio = x / (total / total_weight)
+        logs = np.log(np.where(w > 0, ratio, 1.0))
+        result = {'gini': 1 - np.sum(w * (2 * income - wx / total), axis=-2)
+                  / total_weight[..., 0, :],
+                  'theil_t': np.sum(w * ratio * logs, axis=-2) / total_weight[..., 0, :],
+                  'theil_l': -np.sum(w * logs, axis=-2) / total_weight[..., 0, :],
+                  **get_share_ratios(population, income)}
+    return {name: np.where(count >= 2, result[name], np.nan) for name in INDICES}
+
+
+def get_share_ratios(population: np.ndarray, income: np.ndarray) -> dict[str, np.ndarray]:
+    """ Return a mapping of each ratio in SHARE_RATIOS to its value in every column, given the
+    points of the Lorenz curve of every column (see get_lorenz_share).
+
+    >>> ratios = get_share_ratios(np.linspace(0.1, 1.0, 10)[:, np.newaxis],
+    ...                           np.linspace(0.1, 1.0, 10)[:, np.newaxis])
+    >>> [round(float(ratios[name][0]), 6) for name in SHARE_RATIOS]
+    [0.25, 1.0, 1.0]
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {name: (1 - get_lorenz_share(population, income, 1 - top))
+                / get_lorenz_share(population, income, bottom)
+                for name, (top, bottom) in SHARE_RATIOS.items()}
+
+
+def get_lorenz_share(population: np.ndarray, income: np.ndarray, fraction: float) -> np.ndarray:
+    """ Return the share of the total held by the bottom fraction of the population in every
+    column, interpolated linearly between the points (population[..., i, j], income[..., i, j])
+    of the Lorenz curve of column j, which are in increasing order along axis -2.
+
+    Preconditions:
+        - 0 < fraction < 1
+
+    >>> get_lorenz_share(np.array([[0.5], [1.0]]), np.array([[0.25], [1.0]]), 0.75).tolist()
+    [0.625]
+    """
+    zeros = np.zeros_like(population[..., :1, :])
+    population = np.concatenate([zeros, population], axis=-2)
+    income = np.concatenate([zeros, income], axis=-2)
+    # the first point at or above the fraction, which is preceded by the last point below it
+    above = np.minimum(np.sum(population < fraction, axis=-2, keepdims=True),
+                       population.shape[-2] - 1)
+    low_p, high_p = (np.take_along_axis(population, k, axis=-2) for k in (above - 1, above))
+    low_i, high_i = (np.take_along_axis(income, k, axis=-2) for k in (above - 1, above))
+    return (low_i + (high_i - low_i) * (fraction - low_p) / (high_p - low_p))[..., 0, :]
+
+
+def get_inequality_values(root: str, data: clean_data.Dataset,
+                          weighted: bool) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """ Return the values of the metric root whose inequality is measured, and their weights (None
+    if not weighted). When weighted, each country is weighted by its population and totals (roots
+    not in RATE_ROOTS) are divided by it.
+
+    Preconditions:
+        - root in data.columns
+    """
+    values = data.columns[root]
+    if not weighted:
+        return values, None
+    population = clean_data.get_covid_metrics(data, ['population'])['population'][:, np.newaxis]
+    if root not in RATE_ROOTS:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = values / population
+    return values, population
+
+
+@instrument.timed
+def get_inequality_matrix(root: str, data: Optional[clean_data.Dataset] = None,
+                          weighted: bool = False) -> np.ndarray:
+    """ Return the inequality indices of the metric root between every country in every year,
+    where the value in row k and column j is the index INDICES[k] in data.years[j] (see
+    get_inequality_indices). If weighted is True, the indices are weighted by population (see
+    get_inequality_values).
+
+    Preconditions:
+        - root in data.columns
+    """
+    data = data or clean_data.load_dataset()
+    key = ('inequality', root, weighted)
+    if key not in data.derived:
+        indices = get_inequality_indices(*get_inequality_values(root, data, weighted))
+        matrix = np.array([indices[name] for name in INDICES])
+        matrix.flags.writeable = False
+        files = clean_data.get_root_files([root]) | ({clean_data.COVID_FILE} if weighted else set())
+        data.remember(key, matrix, files)
+    return data.derived[key]
+
+
+def get_inequality(root: str, start: int, end: int, data: Optional[clean_data.Dataset] = None,
+                   weighted: bool = False) -> dict[str, list[tuple[int, float]]]:
+    """ Return a mapping of each index in INDICES to a list of (year, value) tuples of the index of
+    the metric root between countries in every year from start to end inclusive. If weighted is
+    True, the indices are weighted by population (see get_inequality_values).
+
+    Preconditions:
+        - root in data.columns
+        - start in data.years and end in data.years
+        - start <= end
+
+    >>> round(get_inequality('gdp_', 2019, 2020)['gini'][1][1], 3)
+    0.872
+    """
+    data = data or clean_data.load_dataset()
+    matrix = get_inequality_matrix(root, data, weighted)
+    first, last = data.years.index(start), data.years.index(end)
+    return {INDICES[k]: [(data.years[j], float(matrix[k, j])) for j in range(first, last + 1)]
+            for k in range(len(INDICES))}
+
+
+@dataclass(frozen=True)
+class Bootstrap:
+    """ The settings of the bootstrap that estimates confidence intervals (see
+    get_confidence_intervals).
+
+    Instance Attributes:
+        - weighted: whether the indices are weighted by population (see get_inequality_values)
+        - resamples: the number of resamples
+        - level: the confidence level of the intervals
+        - seed: the seed the resamples are drawn from
+        - workers: the number of worker processes, or None for one per core when more than
+        PARALLEL_VALUES values are resampled (and a single process otherwise)
+
+    Representation Invariants:
+        - self.resamples >= 1
+        - 0 < self.level < 1
+        - self.workers is None or self.workers >= 1
+
+    Sample Usage
+    >>> Bootstrap(resamples=200).level
+    0.95
+    """
+    weighted: bool = False
+    resamples: int = 1000
+    level: float = 0.95
+    seed: int = 0
+    workers: Optional[int] = None
+
+
+def bootstrap_part(task: tuple) -> np.ndarray:
+    """ Return the inequality indices of a batch of bootstrap resamples, where the task is a tuple
+    of the values of every year with the values left out sorted last (see get_bootstrap_tasks),
+    their weights, the number of values left in every year, the number of resamples and the seed
+    of the batch. The value at [k, r, j] is the index INDICES[k] of resample r in year j.
+
+    This is run by worker processes, so only the small matrices of values are sent to them.
+    """
+    values, weights, counts, resamples, seed = task
+    generator = np.random.default_rng(seed)
+    columns = np.arange(values.shape[1])
+    # every resample draws counts[j] countries with replacement among those left in year j
+    positions = (generator.random((resamples,) + values.shape) * counts).astype(np.intp)
+    drawn = np.arange(values.shape[0])[:, np.newaxis] < counts
+    indices = get_inequality_indices(values[positions, columns],
+                                     np.where(drawn, weights[positions, columns], 0.0))
+    return np.array([indices[name] for name in INDICES])
+
+
+def get_bootstrap_tasks(values: np.ndarray, weights: Optional[np.ndarray],
+                        bootstrap: Bootstrap) -> list[tuple]:
+    """ Return the tasks of bootstrap_part that draw the resamples of bootstrap from values, where
+    values[i, j] is the value of the i-th country in the j-th year and weights (if given) holds the
+    weight of each value. Each task draws a batch of at most BATCH_VALUES values, and every batch
+    has its own seed spawned from bootstrap.seed.
+    """
+    weights = np.broadcast_to(1.0 if weights is None else weights, values.shape)
+    with np.errstate(invalid='ignore'):
+        kept = (values > 0) & (weights > 0)
+    # move the values left in every year to the top of its column, so a resample of year j draws
+    # from its first counts[j] rows
+    order = np.argsort(~kept, axis=0, kind='stable')
+    values = np.take_along_axis(values, order, axis=0)
+    weights = np.take_along_axis(weights, order, axis=0)
+    counts = np.count_nonzero(kept, axis=0)
+
+    size = max(1, BATCH_VALUES // values.size)
+    seeds = np.random.SeedSequence(bootstrap.seed).spawn((bootstrap.resamples + size - 1) // size)
+    return [(values, weights, counts, min(size, bootstrap.resamples - k * size), seeds[k])
+            for k in range(len(seeds))]
+
+
+def run_bootstrap(tasks: list[tuple], workers: Optional[int]) -> np.ndarray:
+    """ Return the indices of every resample of the tasks of get_bootstrap_tasks, where the value
+    at [k, r, j] is the index INDICES[k] of resample r in year j. The tasks are run by workers
+    worker processes, or by one per core if workers is None and more than PARALLEL_VALUES values
+    are resampled.
+
+    Preconditions:
+        - tasks != []
+    """
+    if workers is None:
+        resampled = sum(task[3] for task in tasks) * tasks[0][0].size
+        workers = os.cpu_count() or 1 if resampled > PARALLEL_VALUES else 1
+    workers = min(workers, len(tasks))
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(bootstrap_part, tasks))
+    else:
+        parts = [bootstrap_part(task) for task in tasks]
+    return np.concatenate(parts, axis=1)
+
+
+@instrument.timed
+def get_confidence_intervals(root: str, start: int, end: int,
+                             data: Optional[clean_data.Dataset] = None,
+                             bootstrap: Optional[Bootstrap] = None) -> dict[str, np.ndarray]:
+    """ Return a mapping of each index in INDICES to its bootstrap confidence interval at the
+    confidence level of bootstrap (Bootstrap() by default) in every year from start to end
+    inclusive, as a matrix whose first row is the lower bound and whose second row is the upper
+    bound of every year.
+
+    Each resample draws as many countries as there are values in a year, with replacement, and
+    the interval is given by the percentiles of the index over the resamples. The resamples are
+    computed in batches of a bounded size, by bootstrap.workers worker processes (see
+    run_bootstrap). The result only depends on bootstrap.seed, not on the number of workers.
+
+    Preconditions:
+        - root in data.columns
+        - start in data.years and end in data.years
+        - start <= end
+
+    >>> low, high = get_confidence_intervals('gdp_', 2020, 2020,
+    ...                                      bootstrap=Bootstrap(resamples=200))['gini'][:, 0]
+    >>> bool(low < get_inequality('gdp_', 2020, 2020)['gini'][0][1] < high)
+    True
+    """
+    data = data or clean_data.load_dataset()
+    bootstrap = bootstrap or Bootstrap()
+    values, weights = get_inequality_values(root, data, bootstrap.weighted)
+    first, last = data.years.index(start), data.years.index(end)
+    indices = run_bootstrap(get_bootstrap_tasks(values[:, first:last + 1], weights, bootstrap),
+                            bootstrap.workers)
+    instrument.count('get_confidence_intervals', 'resamples', bootstrap.resamples)
+
+    bounds = [(1 - bootstrap.level) / 2 * 100, (1 + bootstrap.level) / 2 * 100]
+    # a year with fewer than 2 values has NaN bounds
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        intervals = np.nanpercentile(indices, bounds, axis=1)
+    return {INDICES[k]: intervals[:, k] for k in range(len(INDICES))}
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'extra-imports': ['concurrent.futures', 'dataclasses', 'os', 'typing', 'warnings', 'numpy',
+                          'clean_data', 'instrument', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200', 'C0415']
+    })
@@ -0,0 +1,285 @@
+""" CSC110 Fall 2021 Final Project: instrument
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Record the wall time and number of calls of every stage of the pipeline (e.g. parsing a csv
+    file, computing quartiles or building a figure) and counters such as rows parsed and bytes read
+    2. Report the records as a summary table or as a trace file
+
+Instrumentation is off unless the environment variable CSC110_INSTRUMENT is set to anything but
+'' or '0', or enable() is called (e.g. by the --instrument flag of main.py). While it is off, a
+stage only costs one extra function call. When CSC110_INSTRUMENT is set, the summary is printed
+when the program exits. When CSC110_TRACE is set to a filename, instrumentation is on and a trace
+of every stage is written to that file when the program exits, in the Trace Event Format read by
+chrome://tracing and https://ui.perfetto.dev.
+
+The records of a process are kept by a single Recorder, reached through get_recorder.
+
+Stages run by worker processes (see clean_data.load_files and export.export_charts) are recorded
+by the workers and are not part of the report of the main process.
+"""
+
+import atexit
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+# the environment variables that turn instrumentation on and that name the trace file
+ENV_VARIABLE = 'CSC110_INSTRUMENT'
+TRACE_VARIABLE = 'CSC110_TRACE'
+
+# the largest number of stage runs kept for the trace file
+MAX_EVENTS = 100000
+
+
+@dataclass
+class Stage:
+    """ The records of a stage of the pipeline.
+
+    Instance Attributes:
+        - calls: the number of times the stage ran
+        - seconds: the total wall time of the stage
+        - longest: the wall time of the longest run of the stage
+        - counters: a mapping of the name of a counter (e.g. 'rows') to its total
+
+    Representation Invariants:
+        - self.calls >= 0
+        - 0 <= self.longest <= self.seconds
+    """
+    calls: int = 0
+    seconds: float = 0.0
+    longest: float = 0.0
+    counters: dict[str, int] = field(default_factory=dict)
+
+
+class Recorder:
+    """ The records of every stage of the pipeline run by this process. A single Recorder is
+    shared by the whole process (see get_recorder).
+
+    Instance Attributes:
+        - enabled: whether instrumentation is on
+        - stages: a mapping of the name of every stage to its records
+        - events: the (name, start, end, thread) of each stage run, for the trace file
+        - lock: the lock held while stages or events are read or changed
+        - origin: the time (as given by time.perf_counter()) the trace file starts at
+
+    Representation Invariants:
+        - len(self.events) <= MAX_EVENTS
+    """
+    enabled: bool
+    stages: dict[str, Stage]
+    events: list[tuple[str, float, float, int]]
+    lock: threading.Lock
+    origin: float
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stages = {}
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def record(self, name: str, start: float, end: float) -> None:
+        """ Record a run of the stage named name from time start to time end.
+        """
+        with self.lock:
+            stage = self.stages.setdefault(name, Stage())
+            stage.calls += 1
+            stage.seconds += end - start
+            stage.longest = max(stage.longest, end - start)
+            if len(self.events) < MAX_EVENTS:
+                self.events.append((name, start, end, threading.get_ident()))
+
+    def count(self, name: str, counter: str, amount: int) -> None:
+        """ Add amount to the counter of the stage named name.
+        """
+        with self.lock:
+            counters = self.stages.setdefault(name, Stage()).counters
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def reset(self) -> None:
+        """ Forget every record made so far.
+        """
+        with self.lock:
+            self.stages.clear()
+            self.events.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_recorder() -> Recorder:
+    """ Return the Recorder of this process, which is created (on if the environment variables
+    ask for it) the first time it is needed. Its report is made when the program exits (see
+    report_at_exit).
+    """
+    recorder = Recorder(os.environ.get(ENV_VARIABLE, '') not in ('', '0')
+                        or os.environ.get(TRACE_VARIABLE, '') != '')
+    atexit.register(report_at_exit)
+    return recorder
+
+
+def enable() -> None:
+    """ Turn instrumentation on.
+    """
+    get_recorder().enabled = True
+
+
+def disable() -> None:
+    """ Turn instrumentation off, keeping the records made so far.
+    """
+    get_recorder().enabled = False
+
+
+def is_enabled() -> bool:
+    """ Return whether instrumentation is on.
+    """
+    return get_recorder().enabled
+
+
+def reset() -> None:
+    """ Forget every record made so far.
+    """
+    get_recorder().reset()
+
+
+def record(name: str, start: float, end: float) -> None:
+    """ Record a run of the stage named name from time start to time end, as given by
+    time.perf_counter().
+    """
+    get_recorder().record(name, start, end)
+
+
+def count(name: str, counter: str, amount: int = 1) -> None:
+    """ Add amount to the counter (e.g. 'rows' or 'bytes') of the stage named name, if
+    instrumentation is on.
+    """
+    recorder = get_recorder()
+    if recorder.enabled:
+        recorder.count(name, counter, amount)
+
+
+def timed(func: Callable) -> Callable:
+    """ Return func, recording each of its calls as a run of the stage named after func while
+    instrumentation is on. This is meant to be used as a decorator.
+
+    >>> @timed
+    ... def double(x: int) -> int:
+    ...     return 2 * x
+    >>> enable()
+    >>> double(2)
+    4
+    >>> get_stages()['double'].calls
+    1
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        recorder = get_recorder()
+        if not recorder.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.record(name, start, time.perf_counter())
+
+    return wrapper
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """ Record the body of a with statement as a run of the stage named name while
+    instrumentation is on.
+    """
+    recorder = get_recorder()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if recorder.enabled:
+            recorder.record(name, start, time.perf_counter())
+
+
+def get_stages() -> dict[str, Stage]:
+    """ Return a copy of the records of every stage, by name.
+    """
+    recorder = get_recorder()
+    with recorder.lock:
+        return {name: Stage(stage.calls, stage.seconds, stage.longest, dict(stage.counters))
+                for name, stage in recorder.stages.items()}
+
+
+def get_summary() -> str:
+    """ Return a table of the records of every stage, from the longest total wall time to the
+    shortest.
+    """
+    stages = get_stages()
+    lines = [f'{"stage":<34} {"calls":>7} {"total ms":>11} {"mean ms":>10} {"max ms":>10}'
+             f'  counters']
+    for name in sorted(stages, key=lambda stage: -stages[stage].seconds):
+        stage = stages[name]
+        mean = stage.seconds / stage.calls if stage.calls > 0 else 0.0
+        counters = ', '.join(f'{counter}={total}' for counter, total in stage.counters.items())
+        lines.append(f'{name:<34} {stage.calls:>7} {stage.seconds * 1000:>11.2f} '
+                     f'{mean * 1000:>10.3f} {stage.longest * 1000:>10.3f}  {counters}')
+    return '\n'.join(lines)
+
+
+def write_trace(filename: str) -> None:
+    """ Write every stage run recorded to filename in the Trace Event Format, where each run is a
+    complete event and the counters of each stage are the arguments of its first event.
+    """
+    recorder = get_recorder()
+    stages = get_stages()
+    with recorder.lock:
+        events = list(recorder.events)
+    trace = []
+    for name, start, end, thread in events:
+        event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': thread,
+                 'ts': (start - recorder.origin) * 1e6, 'dur': (end - start) * 1e6}
+        if name in stages and stages[name].counters != {}:
+            event['args'] = stages.pop(name).counters
+        trace.append(event)
+    with open(filename, 'w') as file:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, file)
+
+
+def is_reported_at_exit() -> bool:
+    """ Return whether the summary is printed when the program exits, which the environment
+    variable ENV_VARIABLE asks for (see report_at_exit).
+    """
+    return os.environ.get(ENV_VARIABLE, '') not in ('', '0')
+
+
+def report_at_exit() -> None:
+    """ Print the summary and write the trace file requested by the environment variables.
+    """
+    if is_reported_at_exit() and get_recorder().stages != {}:
+        print(get_summary(), file=sys.stderr)
+    if os.environ.get(TRACE_VARIABLE, '') != '':
+        write_trace(os.environ[TRACE_VARIABLE])
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': ['write_trace', 'report_at_exit'],
+        'extra-imports': ['atexit', 'contextlib', 'dataclasses', 'functools', 'json', 'os', 'sys',
+                          'threading', 'time', 'typing', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200']
+    })
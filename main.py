@@ -5,19 +5,129 @@ the module:
     1. Loads the necessary files from the datasets
     2. Performs the relevant computations on the data
     3. Produces visualizations
+
+The charts to produce are given as job specs of the form <chart>[.<format>][?<parameters>] (see
+export.parse_spec), on the command line or in a batch file with one job spec per line. The
+dataset is loaded once for every job, duplicate jobs are only run once and charts written to
+files are built in parallel. Charts whose files were built from the current source files are not
+written again unless --force is given (see export.export_charts). For example:
+
+    python main.py "map_percentage_change.html?root=unemployment_&start=2016&end=2020&exclude=QAT"
+    python main.py --batch jobs.txt --format png --output charts --workers 4
+
+A job without a format uses the --format option. The 'show' format displays the chart in a
+browser instead of writing it to a file. With no job specs, the scatter plot of the GDP % change
+from 2016 to 2020 is displayed.
 """
-import visualizations
+import argparse
+from typing import Optional
+import export
+import instrument
+
+# the jobs run when no job spec is given
+DEFAULT_JOBS = ['scatter_percentage_change?root=gdp_&start=2016&end=2020']
+
+# the format that displays a chart instead of writing it to a file
+SHOW = 'show'
 
 
-def main() -> None:
-    """ Creates the visualizations of interest.
+def read_batch_file(filename: str) -> list[str]:
+    """ Return the job specs in a batch file, which has one job spec per line. Blank lines and
+    lines starting with '#' are skipped.
     """
-    visualizations.scatter_percentage_change('gdp_', 2016, 2020)
-    # visualizations.map_percentage_change('gdp_', 2016, 2020)
-    # visualizations.visualize_aggregates(2016, 2020)
-    # visualizations.map_percent_difference_gdp(2018, 2020)
-    # visualizations.scatter_percentage_change('unemployment_', 2016, 2020)
-    # visualizations.map_percentage_change('unemployment_', 2016, 2020)
+    with open(filename) as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line != '' and not line.startswith('#')]
+
+
+def get_jobs(job_specs: list[str], default_format: str) -> dict[str, list[export.ChartSpec]]:
+    """ Return a mapping of each format to the specs of the charts to produce in that format, in
+    the order of job_specs and without duplicates. A job spec without a format uses
+    default_format.
+
+    Raise a ValueError if a job spec is invalid.
+
+    >>> jobs = get_jobs(['visualize_aggregates?start=2016&end=2020',
+    ...                  'visualize_aggregates.html?start=2016&end=2020',
+    ...                  'map_percent_difference_gdp.svg?start=2018&end=2020'], 'html')
+    >>> {file_format: len(jobs[file_format]) for file_format in jobs}
+    {'html': 1, 'svg': 1}
+    """
+    jobs = {}
+    for job_spec in job_specs:
+        try:
+            spec, file_format = export.parse_spec(job_spec)
+        except KeyError as error:
+            raise ValueError(f'{job_spec}: unknown chart; '
+                             f'choose one of {list(export.CHARTS)}') from error
+        except ValueError as error:
+            raise ValueError(f'{job_spec}: {error}') from error
+        file_format = file_format or default_format
+        if file_format not in export.FORMATS + [SHOW]:
+            raise ValueError(f'{job_spec}: unknown format {file_format}')
+        jobs.setdefault(file_format, {})[spec] = None
+    return {file_format: list(specs) for file_format, specs in jobs.items()}
+
+
+def run_jobs(jobs: dict[str, list[export.ChartSpec]], output: str,
+             workers: Optional[int] = None, force: bool = False) -> list[str]:
+    """ Produce the charts of jobs, which maps each format to the specs of the charts to produce
+    in that format. Charts to display are displayed one at a time, and the other charts are
+    written to the directory output by workers worker processes (see export.export_charts), only
+    writing the charts whose source files changed unless force is True. Return the paths of the
+    chart files.
+    """
+    paths = []
+    for file_format, specs in jobs.items():
+        if file_format == SHOW:
+            for spec in specs:
+                spec.build().show()
+        else:
+            paths.extend(export.export_charts(specs, output, file_format, workers, force))
+    return paths
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    """ Creates the visualizations of interest, as given by the command line arguments args
+    (sys.argv[1:] if args is None).
+    """
+    parser = argparse.ArgumentParser(description='Produce the charts of the given job specs.')
+    parser.add_argument('jobs', nargs='*', metavar='JOB',
+                        help='a job spec of the form <chart>[.<format>][?<parameters>], e.g. '
+                             '"map_percentage_change.html?root=gdp_&start=2016&end=2020"')
+    parser.add_argument('--batch', action='append', default=[], metavar='FILE',
+                        help='a file of job specs, one per line')
+    parser.add_argument('--format', default=SHOW, choices=export.FORMATS + [SHOW],
+                        help='the format of the jobs that do not give one (default: show)')
+    parser.add_argument('--output', default='charts', metavar='DIRECTORY',
+                        help='the directory charts are written to (default: charts)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='the number of worker processes (default: one per core)')
+    parser.add_argument('--force', action='store_true',
+                        help='write every chart, even if its source files did not change')
+    parser.add_argument('--instrument', action='store_true',
+                        help='print the time spent in every stage of the pipeline')
+    options = parser.parse_args(args)
+
+    if options.instrument:
+        instrument.enable()
+    job_specs = list(options.jobs)
+    try:
+        for filename in options.batch:
+            job_specs.extend(read_batch_file(filename))
+        jobs = get_jobs(job_specs or DEFAULT_JOBS, options.format)
+        paths = run_jobs(jobs, options.output, options.workers, options.force)
+    except KeyError as error:
+        # e.g. a metric root that isn't in the dataset
+        parser.error(f'invalid parameter: {error}')
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    else:
+        if paths != []:
+            print(f'{len(paths)} charts in {options.output} are up to date')
+    if options.instrument and not instrument.is_reported_at_exit():
+        # otherwise the summary is printed when the program exits
+        print(instrument.get_summary())
 
 
 if __name__ == "__main__":
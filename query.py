@@ -0,0 +1,145 @@
+""" CSC110 Fall 2021 Final Project: query
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Answer quick questions about the data from the command line, such as the share of the
+    world's GDP produced by Canada in 2020:
+
+        python query.py share gdp_ 2020 Canada
+
+Queries only need numpy and the binary cache of the dataset, so this module imports neither
+pandas nor plotly. Its start-up budget, STARTUP_BUDGET, is checked by the 'startup' stage of
+benchmarks.py.
+"""
+import argparse
+from typing import Callable, Optional
+import clean_data
+import computations
+
+# the longest time (in seconds) a query may take, from starting Python to printing the answer,
+# once the binary cache of the dataset is written; importing numpy takes most of it
+STARTUP_BUDGET = 0.25
+
+
+def get_value(data: clean_data.Dataset, root: str, row: int, column: int) -> float:
+    """ Return the value of the metric root of the country in row in the year in column.
+    """
+    return float(data.columns[root][row, column])
+
+
+def get_share(data: clean_data.Dataset, root: str, row: int, column: int) -> float:
+    """ Return the percentage of the world's total of the metric root of the country in row in the
+    year in column.
+    """
+    return float(computations.get_share_matrix(root, data)[row, column])
+
+
+def get_change(data: clean_data.Dataset, root: str, row: int, column: int) -> float:
+    """ Return the percent change of the metric root of the country in row from the year before
+    the year in column.
+    """
+    return float(computations.get_percent_change_matrix(root, data)[row, column])
+
+
+def get_quartile(data: clean_data.Dataset, root: str, row: int, column: int) -> float:
+    """ Return the quartile of the metric root of the country in row in the year in column, where
+    4 is the top 25%, or NaN if the country has no value that year.
+    """
+    quartiles = computations.get_buckets(root, 4, data)
+    return float(quartiles[row, column]) if quartiles[row, column] > 0 else float('nan')
+
+
+def get_total(data: clean_data.Dataset, root: str, _row: int, column: int) -> float:
+    """ Return the world's total of the metric root in the year in column, which is the same for
+    every row.
+    """
+    return float(computations.get_totals(root, data)[column])
+
+
+# the queries that can be answered
+QUERIES = ['value', 'share', 'change', 'quartile', 'total']
+
+
+def get_query_function(query: str) -> Callable[[clean_data.Dataset, str, int, int], float]:
+    """ Return the function answering the query.
+
+    Preconditions:
+        - query in QUERIES
+
+    >>> get_query_function('share') is get_share
+    True
+    """
+    functions = {'value': get_value, 'share': get_share, 'change': get_change,
+                 'quartile': get_quartile, 'total': get_total}
+    return functions[query]
+
+
+def answer(query: str, root: str, year: int, country: Optional[str] = None,
+           data: Optional[clean_data.Dataset] = None) -> float:
+    """ Return the answer to the query (an element of QUERIES) about the metric root of the
+    country (its ISO3 code, name or an alias of its name) in the year. The country isn't needed
+    for the 'total' query. If data isn't given, the shared dataset is used.
+
+    Raise a KeyError if the root or the country isn't in the dataset and a ValueError if the
+    year isn't.
+
+    >>> answer('quartile', 'gdp_', 2020, 'Canada')
+    4.0
+    >>> round(answer('share', 'gdp_', 2020, 'CAN'), 2)
+    1.99
+    """
+    data = data or clean_data.load_dataset()
+    function = get_query_function(query)
+    if root not in data.columns:
+        raise KeyError(root)
+    row = -1 if query == 'total' else data.row(country)
+    return function(data, root, row, data.years.index(year))
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    """ Print the answer to the query given by the command line arguments args (sys.argv[1:] if
+    args is None).
+    """
+    parser = argparse.ArgumentParser(description='Answer a question about the data.')
+    parser.add_argument('query', choices=QUERIES)
+    parser.add_argument('root', help='a metric root, e.g. gdp_ or unemployment_')
+    parser.add_argument('year', type=int)
+    parser.add_argument('country', nargs='?', default=None,
+                        help="a country's ISO3 code or name (not needed for total)")
+    parser.add_argument('--impute', choices=clean_data.IMPUTATION_METHODS, default=None,
+                        help='fill the missing values of every country with this method first')
+    options = parser.parse_args(args)
+    if options.country is None and options.query != 'total':
+        parser.error(f'the {options.query} query needs a country')
+    try:
+        print(answer(options.query, options.root, options.year, options.country,
+                     clean_data.load_dataset(imputation=options.impute)))
+    except KeyError as error:
+        parser.error(f'{error} is not in the dataset')
+    except ValueError:
+        parser.error(f'{options.year} is not in the dataset')
+
+
+if __name__ == '__main__':
+    import sys
+
+    if sys.argv[1:]:
+        main()
+    else:
+        # importing python_ta takes far longer than STARTUP_BUDGET, so the checks are only run
+        # when there's no query to answer
+        import python_ta
+        import python_ta.contracts
+        import doctest
+
+        python_ta.contracts.DEBUG_CONTRACTS = False
+        python_ta.contracts.check_all_contracts()
+        doctest.testmod()
+
+        python_ta.check_all(config={
+            'allowed-io': ['main'],
+            'extra-imports': ['argparse', 'sys', 'typing', 'clean_data', 'computations', 'doctest'],
+            'max-line-length': 100,
+            'max-nested-blocks': 4,
+            'disable': ['R1705', 'C0200']
+        })
@@ -0,0 +1,160 @@
+""" CSC110 Fall 2021 Final Project: server
+
+This Python module contains several function headers and descriptions. Functions located
+in this file are meant to:
+    1. Serve the charts of visualizations.py from a local HTTP server that loads the dataset once
+    2. Cache the response of every chart by its parameters, so repeated requests are answered
+    without building the chart again until one of the source files of the chart changes
+
+Each chart is served as JSON or HTML at /charts/<chart>.<json or html>, where <chart> is a key
+of export.CHARTS and the chart's parameters are given in the query string (see export.parse_spec),
+for example:
+
+    /charts/map_percentage_change.html?root=unemployment_&start=2016&end=2020&exclude=QAT,VNM
+
+Run this module to start the server on http://127.0.0.1:8050.
+"""
+
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import urlparse
+import clean_data
+import export
+import instrument
+
+# the content type of each format a chart is served in
+CONTENT_TYPES = {'json': 'application/json', 'html': 'text/html; charset=utf-8'}
+
+# the number of responses kept in the response cache
+CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def render_chart(spec: export.ChartSpec, file_format: str, stamp: tuple[str, ...]) -> bytes:
+    """ Return the chart of spec in the format file_format.
+
+    Responses are cached by their parameters. stamp is the stamp of the source files of the chart
+    in the loaded Dataset (see export.ChartSpec.get_sources), so a response is only built again
+    once one of these files changes.
+
+    Preconditions:
+        - file_format in CONTENT_TYPES
+    """
+    fig = spec.build()
+    with instrument.span('to_' + file_format):
+        if file_format == 'json':
+            return fig.to_json().encode('utf-8')
+        return fig.to_html(include_plotlyjs='/plotly.min.js').encode('utf-8')
+
+
+@lru_cache(maxsize=1)
+def get_plotlyjs() -> bytes:
+    """ Return the plotly.js bundle that every HTML chart loads from /plotly.min.js.
+    """
+    import plotly.offline
+    return plotly.offline.get_plotlyjs().encode('utf-8')
+
+
+def get_chart_request(path: str, query: str) -> tuple[export.ChartSpec, str]:
+    """ Return the spec and format of the chart requested by a path and query string (see
+    export.parse_spec). Raise a KeyError if the path isn't a chart and a ValueError if a parameter
+    is invalid.
+
+    >>> spec, file_format = get_chart_request('/charts/map_percentage_change.json',
+    ...                                       'root=gdp_&start=2016&end=2020')
+    >>> spec.chart, spec.args, file_format
+    ('map_percentage_change', ('gdp_', 2016, 2020), 'json')
+    >>> get_chart_request('/charts/visualize_aggregates.html', 'start=2016&end=2020&exclude=CAN')
+    Traceback (most recent call last):
+    ValueError: visualize_aggregates can't exclude countries
+    """
+    directory, _, filename = path.rpartition('/')
+    if directory != '/charts' or filename.partition('.')[2] not in CONTENT_TYPES:
+        raise KeyError(path)
+    return export.parse_spec(filename + '?' + query)
+
+
+class ChartHandler(BaseHTTPRequestHandler):
+    """ A handler of the requests made to the chart server. Each request is handled by a thread
+    of its own.
+    """
+
+    def do_GET(self) -> None:
+        """ Respond to a GET request of a chart or of /plotly.min.js.
+        """
+        url = urlparse(self.path)
+        if url.path == '/plotly.min.js':
+            self.respond(200, 'application/javascript', get_plotlyjs())
+            return
+        try:
+            spec, file_format = get_chart_request(url.path, url.query)
+        except KeyError:
+            self.respond(404, 'text/plain', f'{url.path} is not a chart'.encode('utf-8'))
+            return
+        except ValueError as error:
+            self.respond(400, 'text/plain', str(error).encode('utf-8'))
+            return
+        try:
+            stamp = clean_data.load_dataset().get_stamp(spec.get_sources())
+            body = render_chart(spec, file_format, stamp)
+        except (KeyError, ValueError, IndexError) as error:
+            # e.g. a metric root or a year that isn't in the dataset
+            self.respond(400, 'text/plain', f'invalid parameter: {error}'.encode('utf-8'))
+        else:
+            self.respond(200, CONTENT_TYPES[file_format], body)
+
+    def respond(self, status: int, content_type: str, body: bytes) -> None:
+        """ Send a response with the status code, content type and body.
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """ Don't log every request to the console.
+        """
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8050) -> ThreadingHTTPServer:
+    """ Return a chart server listening on host and port, with the dataset already loaded. If port
+    is 0, the server listens on a free port, which is server.server_address[1].
+    """
+    clean_data.load_dataset()
+    return ThreadingHTTPServer((host, port), ChartHandler)
+
+
+def serve(host: str = '127.0.0.1', port: int = 8050) -> None:
+    """ Serve the charts on host and port until interrupted.
+    """
+    server = make_server(host, port)
+    print(f'Serving charts on http://{host}:{server.server_address[1]}/charts/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+    import doctest
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+    doctest.testmod()
+
+    python_ta.check_all(config={
+        'allowed-io': ['serve'],
+        'extra-imports': ['functools', 'http.server', 'typing', 'urllib.parse', 'plotly.offline',
+                          'clean_data', 'export', 'instrument', 'doctest'],
+        'max-line-length': 100,
+        'max-nested-blocks': 4,
+        'disable': ['R1705', 'C0200', 'W0622', 'C0103', 'C0415']
+    })
+
+    serve()
@@ -3,13 +3,186 @@
 This Python module contains several function headers and descriptions. Functions located
 in this file are meant to:
     1. Help visualize data that is extracted from clean_data.py and processed by computations.py
+
+Every chart is built by a build_* function that returns the figure without displaying it, so that
+charts can also be exported in batches (see export.py).
+
+plotly and pandas are only imported once a figure is built, so computations and exports that
+don't build figures don't pay for importing them. The figures (plotly.graph_objects.Figure) are
+annotated as Any, since plotly isn't imported with this module.
+
+Animated charts store the countries of each trace once, in the first frame, and every other frame
+only holds the values that change, rounded to PRECISION significant digits.
+
+Percent change charts leave out the outliers of each year found by computations.get_outlier_mask
+(by default, with the OUTLIERS method), so that a few extreme values don't squeeze the colours and
+axes of every other country. A chart can keep every value with the method 'none', in which case
+its colours and axes only cover the values between the ROBUST_PERCENTILE-th percentiles.
 """
 
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
+from typing import Any, Optional
+import numpy as np
 import clean_data
 import computations
+import correlations
+import instrument
+
+# the number of significant digits of the values in animated charts
+PRECISION = 4
+
+# the default outlier method of percent change charts (a key of computations.OUTLIER_THRESHOLDS),
+# or 'none' to keep every value
+OUTLIERS = 'zscore'
+
+# the fraction of the range of the values added to each side of an axis range
+PADDING = 0.1
+
+# the percentile of the values left out of each end of the axis ranges of a chart that keeps every
+# value, so that a few extreme values don't squeeze every other value
+ROBUST_PERCENTILE = 1.0
+
+
+def get_included_rows(data: clean_data.Dataset, excluded: set[str]) -> np.ndarray:
+    """ Return the rows of data of every country whose ISO3 code isn't in excluded, in order.
+    """
+    return np.array([i for i in range(len(data.iso_codes)) if data.iso_codes[i] not in excluded],
+                    dtype=np.intp)
+
+
+def get_outliers(values: np.ndarray, outliers: str, threshold: Optional[float]) -> np.ndarray:
+    """ Return the mask of the outliers among values found by the method outliers with threshold
+    (see computations.get_outlier_mask), or a mask of no values if outliers is 'none'.
+
+    Preconditions:
+        - outliers == 'none' or outliers in computations.OUTLIER_THRESHOLDS
+    """
+    if outliers == 'none':
+        return np.isinf(values)
+    return computations.get_outlier_mask(values, outliers, threshold)
+
+
+def get_axis_range(values: np.ndarray, padding: float = PADDING,
+                   percentile: float = 0.0) -> Optional[list[float]]:
+    """ Return the range of an axis that shows every finite value in values between the
+    percentile-th and the (100 - percentile)-th percentiles, with padding times the range of those
+    values added to each side. Return None (so plotly picks the range) if no value is finite.
+
+    Preconditions:
+        - 0 <= percentile < 50
+
+    >>> get_axis_range(np.array([np.nan, 0.0, 10.0, np.inf]))
+    [-1.0, 11.0]
+    >>> get_axis_range(np.array([5.0, 5.0]))
+    [4.5, 5.5]
+    >>> get_axis_range(np.append(np.arange(100.0), 10000.0), 0, 1)
+    [1.0, 99.0]
+    >>> get_axis_range(np.array([np.nan])) is None
+    True
+    """
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return None
+    low, high = (float(bound) for bound in np.percentile(finite, [percentile, 100 - percentile]))
+    # a single value is shown in the middle of a range of its own size (or of 1 around 0)
+    spread = high - low or abs(low) or 1.0
+    return [low - spread * padding, high + spread * padding]
+
+
+def get_range_percentile(outliers: str) -> float:
+    """ Return the percentile of the values left out of each end of the axis ranges of a chart
+    whose outliers are found by the method outliers: ROBUST_PERCENTILE if outliers is 'none', since
+    nothing else keeps extreme values from squeezing the others, and 0 otherwise.
+
+    >>> get_range_percentile('none') == ROBUST_PERCENTILE
+    True
+    >>> get_range_percentile('zscore')
+    0.0
+    """
+    return ROBUST_PERCENTILE if outliers == 'none' else 0.0
+
+
+def get_fit_lines(x: np.ndarray, y: np.ndarray, mask: np.ndarray,
+                  precision: Optional[int]) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """ Return the least squares line of y from x in every column, counting only the values where
+    mask is True and both values are finite (see correlations.get_fit_statistics), as a tuple of
+    the x values and the y values of the two ends of every column's line, drawn from its smallest
+    to its largest x, and a label of every line with its correlation and slope. The values are
+    rounded to precision significant digits.
+
+    >>> x = np.array([[1.0], [2.0], [4.0]])
+    >>> get_fit_lines(x, 3 * x, np.ones(x.shape, dtype=bool), None)
+    (array([[1., 4.]]), array([[ 3., 12.]]), ['r=1.000, slope=3 ± 0 (n=3)'])
+    """
+    mask = mask & np.isfinite(x) & np.isfinite(y)
+    fit = correlations.get_fit_statistics(x, y, mask)
+    ends = np.stack([np.fmin.reduce(np.where(mask, x, np.nan), axis=0),
+                     np.fmax.reduce(np.where(mask, x, np.nan), axis=0)], axis=1)
+    labels = [f'r={fit["pearson"][k]:.3f}, slope={fit["slope"][k]:.3g} ± '
+              f'{fit["slope_se"][k]:.2g} (n={fit["count"][k]:.0f})' for k in range(x.shape[1])]
+    line = ends * fit['slope'][:, np.newaxis] + fit['intercept'][:, np.newaxis]
+    return round_significant(ends, precision), round_significant(line, precision), labels
+
+
+def get_frame_columns(data: clean_data.Dataset, first: int, last: int, step: int) -> np.ndarray:
+    """ Return the columns of data of every step-th year from last back to first, in order, so the
+    frames of an animation decimated by step always end in the year last.
+
+    Preconditions:
+        - first <= last
+        - step >= 1
+
+    >>> get_frame_columns(clean_data.Dataset([], [], list(range(2010, 2021))), 2011, 2020, 4)
+    array([ 2,  6, 10])
+    """
+    return np.arange(data.years.index(last), data.years.index(first) - 1, -step)[::-1]
+
+
+def round_significant(values: np.ndarray, precision: Optional[int]) -> np.ndarray:
+    """ Return values rounded to precision significant digits, so that each value is written to a
+    chart with at most that many digits. NaN values stay NaN. If precision is None, values are
+    returned unchanged.
+
+    Preconditions:
+        - precision is None or precision >= 1
+
+    >>> round_significant(np.array([1234.5678, -0.012345, 0.0, np.nan]), 3).tolist()
+    [1230.0, -0.0123, 0.0, nan]
+    """
+    if precision is None:
+        return values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        digits = precision - 1 - np.floor(np.log10(np.abs(values)))
+    digits = np.where(np.isfinite(digits), digits, 0)
+    # dividing (or multiplying) by an exact power of ten keeps the shortest form of each value
+    up = 10.0 ** np.maximum(digits, 0)
+    down = 10.0 ** np.maximum(-digits, 0)
+    return np.round(values * up / down) / up * down
+
+
+def get_animation_layout(frames: list[str], duration: int, redraw: bool) -> dict:
+    """ Return the layout of the play and pause buttons and the slider of an animated figure whose
+    frames are named frames (one per year), where each frame is shown for duration milliseconds.
+    These are laid out the same way as in the animated figures of plotly express.
+    """
+    buttons = [dict(label='&#9654;', method='animate',
+                    args=[None, get_animation_args(duration, 500, redraw)]),
+               dict(label='&#9724;', method='animate',
+                    args=[[None], get_animation_args(0, 0, redraw)])]
+    steps = [dict(label=frame, method='animate', args=[[frame], get_animation_args(0, 0, redraw)])
+             for frame in frames]
+    return dict(
+        updatemenus=[dict(type='buttons', buttons=buttons, direction='left', pad={'r': 10, 't': 70},
+                          showactive=False, x=0.1, xanchor='right', y=0, yanchor='top')],
+        sliders=[dict(active=0, currentvalue={'prefix': 'Year='}, len=0.9, pad={'b': 10, 't': 60},
+                      steps=steps, x=0.1, xanchor='left', y=0, yanchor='top')]
+    )
+
+
+def get_animation_args(duration: int, transition: int, redraw: bool) -> dict:
+    """ Return the animation options of a button or slider step of get_animation_layout.
+    """
+    return {'frame': {'duration': duration, 'redraw': redraw}, 'mode': 'immediate',
+            'fromcurrent': True, 'transition': {'duration': transition, 'easing': 'linear'}}
 
 
 def map_percentage_change(root: str, start: int, end: int) -> None:
@@ -23,37 +196,66 @@ def map_percentage_change(root: str, start: int, end: int) -> None:
     >>> map_percentage_change('gdp_', 2016, 2020)
     >>> map_percentage_change('unemployment_', 2016, 2020)
     """
-    countries, codes = clean_data.populate_dictionary()
-    # Qatar and Vietnam are outliers which prevents proper colour differences from being displayed
-    # Qatar and Vietnam has extremely high unemployement rate % change after COVID-19
-    if root == 'unemployment_':
-        countries.pop('Qatar')
-        countries.pop('Vietnam')
+    build_map_percentage_change(root, start, end).show()
+
+
+@instrument.timed
+def build_map_percentage_change(root: str, start: int, end: int,
+                                data: Optional[clean_data.Dataset] = None,
+                                precision: Optional[int] = PRECISION, step: int = 1,
+                                excluded: Optional[set[str]] = None, outliers: str = OUTLIERS,
+                                threshold: Optional[float] = None) -> Any:
+    """ Return the figure displayed by map_percentage_change, with values rounded to precision
+    significant digits (see round_significant) and a frame for every step-th year up to end.
+    The countries whose ISO3 codes are in excluded are left out, and so is the change of a country
+    in a year when it is an outlier found by the method outliers with threshold (see get_outliers).
+    The colour scale covers the changes left in every year.
+
+    Preconditions:
+        - root != ''
+        - 0 <= start < end
+        - step >= 1
+        - outliers == 'none' or outliers in computations.OUTLIER_THRESHOLDS
+    """
+    import plotly.graph_objects as go
+    import plotly.express as px
+    data = data or clean_data.load_dataset()
+    excluded = excluded or set()
 
     yaxis_title = [word.capitalize() for word in (root.split('_'))]
     yaxis_title = ' '.join(yaxis_title)
     if yaxis_title == 'Gdp ':
         yaxis_title = 'GDP '
 
-    data_so_far = []
-    for country in countries:
-        ordered_data = computations.get_percent_change_over_time(root, start, end,
-                                                                 countries[country].name)
-        for i in range(end - start):
-            list.append(data_so_far, (codes[country], 2016 + i + 1, ordered_data[i][1],
-                                      countries[country].name))
-
-    gapminder = pd.DataFrame(data_so_far, columns=['Country Code', 'Year', 'Percent Change %',
-                                                   'Country Name'])
-
-    fig = px.choropleth(gapminder, locations='Country Code', color='Percent Change %',
-                        hover_name='Country Name', animation_frame='Year',
-                        color_continuous_scale=px.colors.sequential.RdBu[::-1],
-                        projection='natural earth')
+    # compute every included country's percent change in every year at once
+    changes = computations.get_percent_change_matrix(root, data)
+    rows = get_included_rows(data, excluded)
+    columns = get_frame_columns(data, start + 1, end, step)
+    values = changes[np.ix_(rows, columns)]
+    # outliers (e.g. the unemployment of Qatar after COVID-19) are left out of their year, and
+    # if they are kept they take the colour of the end of the scale
+    values = round_significant(np.where(get_outliers(values, outliers, threshold), np.nan, values),
+                               precision)
+    color_range = get_axis_range(values, 0, get_range_percentile(outliers)) or [None, None]
+    years = [str(data.years[column]) for column in columns]
+
+    # the countries are only stored in the first frame; the other frames only hold values
+    fig = go.Figure(
+        data=[go.Choropleth(locations=np.array(data.iso_codes)[rows], z=values[:, 0],
+                            hovertext=np.array(data.names)[rows], coloraxis='coloraxis',
+                            hovertemplate='<b>%{hovertext}</b><br><br>Country Code=%{location}'
+                                          '<br>Percent Change %=%{z}<extra></extra>')],
+        frames=[go.Frame(data=[go.Choropleth(z=values[:, k])], name=years[k])
+                for k in range(len(years))]
+    )
+    fig.update_layout(geo={'projection': {'type': 'natural earth'}}, margin={'t': 60},
+                      coloraxis={'colorscale': px.colors.sequential.RdBu[::-1],
+                                 'cmin': color_range[0], 'cmax': color_range[1],
+                                 'colorbar': {'title': {'text': 'Percent Change %'}}},
+                      **get_animation_layout(years, 1500, True))
     fig.update_layout(title=f'{yaxis_title}Percent Change of Countries between Years {start + 1} '
                             f'and {end}')
-    fig.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1500
-    fig.show()
+    return fig
 
 
 def map_percent_difference_gdp(start: int, end: int) -> None:
@@ -65,20 +267,34 @@ def map_percent_difference_gdp(start: int, end: int) -> None:
 
     >>> map_percent_difference_gdp(2016, 2020)
     """
+    build_map_percent_difference_gdp(start, end).show()
+
+
+@instrument.timed
+def build_map_percent_difference_gdp(start: int, end: int,
+                                     data: Optional[clean_data.Dataset] = None) -> Any:
+    """ Return the figure displayed by map_percent_difference_gdp.
+
+    Preconditions:
+        - 0 <= start < end
+    """
+    import plotly.graph_objects as go
+    import pandas as pd
     root = 'gdp_'
-    countries, codes = clean_data.populate_dictionary()
-    data_start = computations.get_percent_of_whole(root + str(start))
-    data_end = computations.get_percent_of_whole(root + str(end))
-    data_so_far = []
+    data = data or clean_data.load_dataset()
+    shares = computations.get_share_matrix(root, data)
 
-    # iterate through all countries and compute the % change
-    for country in countries:
-        if country in data_start and country in data_end:
-            data = data_end[country] - data_start[country]
-            data_so_far.append((codes[country], data, country))
+    # compute the % change of every country at once, keeping the countries with both shares
+    difference = shares[:, data.years.index(end)] - shares[:, data.years.index(start)]
+    rows = np.flatnonzero(~np.isnan(difference))
 
     # create the dataframe
-    df = pd.DataFrame(data_so_far, columns=['Country Code', 'Percent Difference %', 'Country Name'])
+    with instrument.span('DataFrame'):
+        df = pd.DataFrame({
+            'Country Code': np.array(data.iso_codes)[rows],
+            'Percent Difference %': difference[rows],
+            'Country Name': np.array(data.names)[rows]
+        })
 
     # create and configure the figure
     fig = go.Figure()
@@ -103,8 +319,7 @@ def map_percent_difference_gdp(start: int, end: int) -> None:
         )
     )
 
-    # display the figure
-    fig.show()
+    return fig
 
 
 def scatter_percentage_change(root: str, start: int, end: int) -> None:
@@ -117,105 +332,160 @@ def scatter_percentage_change(root: str, start: int, end: int) -> None:
 
     >>> scatter_percentage_change('gdp_', 2016, 2020)
     """
-    country_dict = clean_data.clean_data()
-    # Qatar and Vietnam are outliers which affects the scaling of y-axes
-    # Qatar and Vietnam has extremely high unemployement rate % change after COVID-19
-    if root == 'unemployment_':
-        country_dict.pop('Qatar')
-        country_dict.pop('Vietnam')
-    data = []
-    # xy_min_max is in the form [min_x, min_y, max_x, max_y]
-    xy_min_max = [float('-inf'), float('-inf'), float('inf'), float('inf')]
-    quartile_to_str = {1: 'Low GDP', 2: 'Lower Middle GDP', 3: 'Higher Middle GDP', 4: 'High GDP'}
-
-    # iterate over all countries
-    for country in country_dict:
-        country_data = computations.get_percent_change_over_time(root, start, end, country)
-        for i in range(len(country_data)):
-            quartile = getattr(country_dict[country], f'gdp_quartile_{start + i}')
-            gdp = getattr(country_dict[country], f'gdp_{start + i}')
-            # verify that the country has a GDP quartile (thus verifying GDP data exists)
-            if quartile in {1, 2, 3, 4}:
-                quartile = quartile_to_str[quartile]
-                data.append((country_data[i][0], country_data[i][1], country, quartile, gdp))
-                xy_min_max[0] = min(xy_min_max[0], gdp)
-                xy_min_max[1] = min(xy_min_max[1], gdp)
-                xy_min_max[2] = max(xy_min_max[2], country_data[i][1])
-                xy_min_max[3] = max(xy_min_max[3], country_data[i][1])
+    build_scatter_percentage_change(root, start, end).show()
+
+
+@instrument.timed
+def build_scatter_percentage_change(root: str, start: int, end: int,
+                                    data: Optional[clean_data.Dataset] = None,
+                                    precision: Optional[int] = PRECISION, step: int = 1,
+                                    excluded: Optional[set[str]] = None, outliers: str = OUTLIERS,
+                                    threshold: Optional[float] = None,
+                                    fit: bool = False) -> Any:
+    """ Return the figure displayed by scatter_percentage_change, with values rounded to precision
+    significant digits (see round_significant) and a frame for every step-th year up to end.
+    The countries whose ISO3 codes are in excluded are left out, and so is the point of a country
+    in a year when its change is an outlier found by the method outliers with threshold (see
+    get_outliers). The axes cover the points left in every year. If fit is True, the least
+    squares line of the points of every year is drawn over them (see get_fit_lines).
+
+    Preconditions:
+        - root != ''
+        - 0 <= start < end
+        - step >= 1
+        - outliers == 'none' or outliers in computations.OUTLIER_THRESHOLDS
+    """
+    import plotly.graph_objects as go
+    import plotly.express as px
+    dataset = data or clean_data.load_dataset()
+    excluded = excluded or set()
+    quartile_to_str = ['Low GDP', 'Lower Middle GDP', 'Higher Middle GDP', 'High GDP']
+
+    # compute every included country's percent change in every year at once, where each change
+    # is paired with the GDP and GDP quartile of the year before it
+    changes = computations.get_percent_change_matrix(root, dataset)
+    rows = get_included_rows(dataset, excluded)
+    columns = get_frame_columns(dataset, start + 1, end, step)
+    quartiles = dataset.quartiles[np.ix_(rows, columns - 1)]
+    gdp = dataset.columns['gdp_'][np.ix_(rows, columns - 1)]
+    change = changes[np.ix_(rows, columns)]
+    # keep the countries that have a GDP quartile (thus verifying GDP data exists) and whose
+    # change isn't an outlier (e.g. the unemployment of Qatar after COVID-19)
+    available = (quartiles > 0) & ~get_outliers(change, outliers, threshold)
+    # make sure that all points over the years can be captured in the xy-plane, or all but the
+    # most extreme ones if outliers are kept
+    x_range = get_axis_range(np.where(available, gdp, np.nan))
+    y_range = get_axis_range(np.where(available, change, np.nan), PADDING,
+                             get_range_percentile(outliers))
+    # the points drawn, where countries without a quartile or with an outlier have no point
+    x = round_significant(np.where(available, gdp, np.nan), precision)
+    y = round_significant(np.where(available, change, np.nan), precision)
+    years = [str(dataset.years[column]) for column in columns]
 
     attribute = ' '.join([word.capitalize() for word in root.split('_')])
     if attribute == 'Gdp ':
         attribute = attribute.upper()
     attribute += '% Change'
 
-    # create the dafaframe
-    gapminder = pd.DataFrame(data, columns=['Year', attribute, 'Country', 'Quartile', 'GDP'])
-
-    # create and configure the figure
-    fig = px.scatter(gapminder, color='Quartile', hover_name='Country', animation_frame='Year',
-                     x='GDP', y=attribute, color_discrete_sequence=px.colors.qualitative.G10)
-    fig.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1500
+    # a single trace holds every country, coloured by its GDP quartile in each year, so the
+    # country names are only stored in the first frame
+    colors = px.colors.qualitative.G10[:4]
+    colorscale = [[bound, colors[q]] for q in range(4) for bound in (q / 4, (q + 1) / 4)]
+    traces = [go.Scatter(x=x[:, 0], y=y[:, 0], hovertext=np.array(dataset.names)[rows],
+                         mode='markers', showlegend=False,
+                         marker={'color': quartiles[:, 0], 'colorscale': colorscale, 'cmin': 0.5,
+                                 'cmax': 4.5},
+                         hovertemplate=f'<b>%{{hovertext}}</b><br><br>Quartile=%{{marker.color}}'
+                                       f'<br>GDP=%{{x}}<br>{attribute}=%{{y}}<extra></extra>')]
+    # the legend shows the colour of each quartile
+    traces += [go.Scatter(x=[None], y=[None], mode='markers', name=quartile_to_str[q],
+                          marker={'color': colors[q], 'symbol': 'circle'}) for q in range(4)]
+    frames = [[go.Scatter(x=x[:, k], y=y[:, k], marker={'color': quartiles[:, k]})]
+              for k in range(len(years))]
+    if fit:
+        # the line of each year is the last trace, so each frame updates the points and the line.
+        # The lines are fitted to the values before they are rounded
+        ends, line, labels = get_fit_lines(gdp, change, available, precision)
+        traces.append(go.Scatter(x=ends[0], y=line[0], mode='lines', name='Least squares fit',
+                                 text=[labels[0]] * 2, line={'color': 'black', 'dash': 'dash'},
+                                 hovertemplate='%{text}<extra></extra>'))
+        for k in range(len(years)):
+            frames[k].append(go.Scatter(x=ends[k], y=line[k], text=[labels[k]] * 2))
+    fig = go.Figure(data=traces,
+                    frames=[go.Frame(data=frames[k], name=years[k],
+                                     traces=[0, len(traces) - 1] if fit else None)
+                            for k in range(len(years))])
+    fig.update_layout(xaxis_title='GDP', yaxis_title=attribute, legend_title='Quartile',
+                      margin={'t': 60}, **get_animation_layout(years, 1500, False))
     fig.update_layout(title=f'{attribute} from {start + 1} to {end}')
+    fig.update_xaxes(range=x_range)
+    fig.update_yaxes(range=y_range)
 
-    # make sure that all points over the years can be captured in the xy-plane
-    fig.update_xaxes(range=[xy_min_max[0] - (xy_min_max[2] - xy_min_max[0]) * 0.1, xy_min_max[2] + (
-                            xy_min_max[2] - xy_min_max[0]) * 0.1])
-    fig.update_yaxes(range=[xy_min_max[1] - (xy_min_max[3] - xy_min_max[1]) * 0.1, xy_min_max[3] + (
-                            xy_min_max[3] - xy_min_max[1]) * 0.1])
+    return fig
 
-    # display the figure
-    fig.show()
 
-
-def visualize_aggregates(start: int, end: int) -> None:
-    """Visualize aggergate sector gdp as a % of aggeregate gdp grouped by gdp quartile.
+def visualize_aggregates(start: int, end: int, group_by: Optional[str] = None) -> None:
+    """Visualize aggergate sector gdp as a % of aggeregate gdp grouped by gdp quartile, or by the
+    World Bank group of each country if group_by is 'IncomeGroup' or 'Region'.
 
     Preconditions:
         - 0 <= start < end
+        - group_by in {None, 'IncomeGroup', 'Region'}
 
     >>> visualize_aggregates(2016, 2020)
+    >>> visualize_aggregates(2016, 2020, 'IncomeGroup')
     """
-    sectors = ['Manufacturing', 'Service', 'Industry', 'Agriculture']
-    quartiles = ['Low GDP', 'Lower Middle GDP', 'Upper Middle GDP', 'High GDP']
-    aq_m, aq_s, aq_i, aq_a = {}, {}, {}, {}
+    build_visualize_aggregates(start, end, group_by).show()
 
-    # Execute computations
-    for year in range(start, end + 1):
-        for quartile in range(1, 5):
-            aq_m[(year, quartile)] = computations.get_aggregate_quartile('gdp_manufacturing_',
-                                                                         quartile, year)
-            aq_s[(year, quartile)] = computations.get_aggregate_quartile('gdp_service_',
-                                                                         quartile, year)
-            aq_i[(year, quartile)] = computations.get_aggregate_quartile('gdp_industry_',
-                                                                         quartile, year)
-            aq_a[(year, quartile)] = computations.get_aggregate_quartile('gdp_agriculture_',
-                                                                         quartile, year)
+
+@instrument.timed
+def build_visualize_aggregates(start: int, end: int, group_by: Optional[str] = None,
+                               data: Optional[clean_data.Dataset] = None) -> Any:
+    """ Return the figure displayed by visualize_aggregates.
+
+    Preconditions:
+        - 0 <= start < end
+        - group_by in {None, 'IncomeGroup', 'Region'}
+    """
+    import plotly.graph_objects as go
+    sectors = ['Manufacturing', 'Service', 'Industry', 'Agriculture']
+    data = data or clean_data.load_dataset()
+    if group_by is None:
+        quartiles = ['Low GDP', 'Lower Middle GDP', 'Upper Middle GDP', 'High GDP']
+        groups = data.quartiles
+    else:
+        quartiles, groups = clean_data.get_country_groups(data, group_by)
+
+    # Execute computations: the sum of every sector of every group in every year at once
+    roots = ['gdp_manufacturing_', 'gdp_service_', 'gdp_industry_', 'gdp_agriculture_']
+    aggregates = computations.get_group_aggregates(roots, groups, ('sum',), data)
+    first = data.years.index(start)
+    # aq[year, group - 1, sector] is the sum of the sector's GDP in the group in the year
+    aq = np.stack([aggregates[(root, 'sum')].T for root in roots], axis=-1)[first:]
 
     # create the figure
     fig = go.Figure()
     # Add traces(bars) to the figure
     for year in range(start, end + 1):
-        for quartile in range(1, 5):
-            gdp = sum([aq_m[(year, quartile)], aq_s[(year, quartile)], aq_i[(year, quartile)],
-                       aq_a[(year, quartile)]])
-            aq_percentages = [aq_m[(year, quartile)] / gdp * 100,
-                              aq_s[(year, quartile)] / gdp * 100,
-                              aq_i[(year, quartile)] / gdp * 100,
-                              aq_a[(year, quartile)] / gdp * 100]
+        for quartile in range(1, len(quartiles) + 1):
+            sector_sums = aq[year - start, quartile - 1]
+            aq_percentages = (sector_sums / sector_sums.sum() * 100).tolist()
             fig.add_trace(go.Bar(x=sectors, y=aq_percentages,
                                  name=str(year) + ' ' + quartiles[quartile - 1] + ' GDP',
                                  visible=(year == start)))
 
     # Slider for changing the year
+    grouping = 'Quartile' if group_by is None else {'IncomeGroup': 'Income Group',
+                                                     'Region': 'Region'}[group_by]
     steps = []
     for i in range(end - start + 1):
         steps.append(dict(
             label=str(start + i),
             method='update',
-            args=[{'visible': [i * 4 <= x < i * 4 + 4
+            args=[{'visible': [i * len(quartiles) <= x < (i + 1) * len(quartiles)
                                for x in range(len(fig.data))]},
                   {'title': f'Aggregate Sector GDP as a % of Aggregate GDP for {start}-{end} '
-                            f'by Quartile',
+                            f'by {grouping}',
                    'showlegend': True}]))
 
     # configure the figure
@@ -229,11 +499,10 @@ def visualize_aggregates(start: int, end: int) -> None:
         xaxis_title='Sector',
         yaxis_title='% of Aggregate GDP',
         title=f'Aggregate Sector GDP as a % of Aggregate GDP for {start}-{end} '
-              f'by GDP Quartile'
+              f'by {"GDP Quartile" if group_by is None else grouping}'
     )
 
-    # display the figure
-    fig.show()
+    return fig
 
 
 if __name__ == '__main__':
@@ -247,9 +516,9 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-io': [],
-        'extra-imports': ['plotly.graph_objects', 'plotly.express', 'pandas', 'clean_data',
-                          'computations', 'doctest'],
+        'extra-imports': ['typing', 'numpy', 'plotly.graph_objects', 'plotly.express', 'pandas',
+                          'clean_data', 'computations', 'correlations', 'instrument', 'doctest'],
         'max-line-length': 100,
         'max-nested-blocks': 4,
-        'disable': ['R1705', 'C0200']
+        'disable': ['R1705', 'C0200', 'C0415']
     })